@@ -1,15 +1,68 @@
-import subprocess
 import os
 import json
+import shutil
+import tempfile
 import numpy as np
 import time
-import requests
+import asyncio
+import contextlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from sklearn.metrics.pairwise import cosine_similarity
 
 # Load environment variables from .env file
 load_dotenv()
 
+from http_pool import get_http_pool, SingleFlight
+from token_provider import TokenProvider
+from rate_limiter import get_rate_limiter, estimate_request_tokens
+from embedding_cache import get_embedding_cache
+from answer_cache import get_answer_cache
+from script_library import get_script_library
+from document_index import get_document_index_manager
+from vector_store import VectorStore, normalize_rows
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from chunking import TOKENIZER_NAME, estimate_tokens
+from ingest_filters import filters_key, iter_clean_chunks
+from context_packer import pack_context
+from metrics import (timed_stage, record_usage, STAGE_SECONDS, STAGE_ERRORS, LLM_REQUESTS, LLM_RETRIES,
+                     CACHE_LOOKUPS, SCRIPT_LIBRARY_SAVED_SECONDS, SPECULATIVE_CANDIDATES)
+from flight_recorder import trace, annotate, mark_error, record_llm_call, record_script_run
+from script_sandbox import CancelToken, run_script
+from document_artifact import artifact_prompt
+
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL_DEPLOYMENT_NAME', 'text-embedding-ada-002')
+# Chunk budget in tokens (~300 words) and the overlap repeated between neighbouring chunks
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '400'))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '50'))
+
+# Generated scripts run in a fresh directory per analysis under this root (system temp dir if unset)
+WORKSPACE_ROOT = os.getenv('ANALYSIS_WORKSPACE_DIR') or None
+# Link the document's pre-parsed SQLite line / page table into the workspace for scripts to query
+SCRIPT_ARTIFACTS_ENABLED = os.getenv('SCRIPT_ARTIFACTS_ENABLED', 'true').lower() == 'true'
+# Candidate scripts written and run concurrently per iteration; the first usable one wins. 1 = one at a time
+SPECULATIVE_SCRIPTS = max(1, int(os.getenv('SPECULATIVE_SCRIPTS', '1')))
+# Per candidate: sampling temperature and an extra instruction, so candidates differ (identical
+# requests would also be coalesced into one call)
+SCRIPT_CANDIDATE_VARIANTS = [
+    (0.3, ""),
+    (0.7, "Keep the script short and defensive: prefer simple, robust parsing over clever tricks."),
+    (0.9, "Take a different approach from the obvious one, e.g. a different parsing or matching strategy."),
+    (1.0, "Be lenient with formatting: match case-insensitively and tolerate irregular whitespace.")
+]
+
+# "hybrid" fuses BM25 and cosine rankings; "dense" uses cosine similarity only
+RETRIEVAL_MODE = os.getenv('RAG_RETRIEVAL_MODE', 'hybrid').lower()
+# Hybrid retrieval is precise enough to send far fewer chunks to the model
+# Candidates retrieved per query; pack_context() fits the best of them into RAG_CONTEXT_TOKENS
+RAG_TOP_K = int(os.getenv('RAG_TOP_K', '20' if RETRIEVAL_MODE == 'hybrid' else '25'))
+HYBRID_CANDIDATES = 50
+# Embedding cache namespace for query (prompt) embeddings
+QUERY_EMBEDDING_PARAMS = "query"
+
+class AnalysisError(Exception):
+    """An analysis that produced no answer; the message is shown to the user in its place"""
+
 class AzureOpenAIAuth:
     """Handle OAuth2 authentication with PingFed"""
     
@@ -17,19 +70,31 @@ class AzureOpenAIAuth:
         self.ping_fed_url = os.getenv('PING_FED_URL')
         self.kgw_client_id = os.getenv('KGW_CLIENT_ID')
         self.kgw_client_secret = os.getenv('KGW_CLIENT_SECRET')
-        self.access_token = None
-        self.token_expires_at = None
         
         if not all([self.ping_fed_url, self.kgw_client_id, self.kgw_client_secret]):
             raise ValueError("Missing auth config: PING_FED_URL, KGW_CLIENT_ID, KGW_CLIENT_SECRET")
+        
+        # Refreshed in the background before expiry; optionally shared by all uvicorn workers
+        self.token_provider = TokenProvider(self.request_token, cache_file=os.getenv('AOAI_TOKEN_CACHE_FILE'))
+    
+    @property
+    def access_token(self):
+        return self.token_provider.token
+    
+    @property
+    def token_expires_at(self):
+        return self.token_provider.expires_at
     
     def get_access_token(self) -> str:
         """Get or refresh OAuth2 access token"""
-        # Return cached token if still valid
-        if self.access_token and self.token_expires_at and time.time() < self.token_expires_at:
-            return self.access_token
-        
-        # Request new token from PingFed
+        return self.token_provider.get_token()
+    
+    async def get_access_token_async(self) -> str:
+        """Get or refresh OAuth2 access token without blocking the event loop"""
+        return await self.token_provider.get_token_async()
+    
+    async def request_token(self):
+        """Request a new token from PingFed; returns (token, seconds it may be used for)"""
         headers = {'Content-Type': 'application/x-www-form-urlencoded'}
         data = {
             'grant_type': 'client_credentials',
@@ -37,19 +102,18 @@ class AzureOpenAIAuth:
             'client_secret': self.kgw_client_secret
         }
         
-        response = requests.post(self.ping_fed_url, headers=headers, data=data, timeout=30)
+        response = await get_http_pool().post(self.ping_fed_url, headers=headers, data=data, timeout=30)
         
         if response.status_code == 200:
             token_data = response.json()
-            self.access_token = token_data['access_token']
+            print("Fetched new PingFed access token")
             # Cache with 5-minute buffer
-            self.token_expires_at = time.time() + token_data.get('expires_in', 3600) - 300
-            return self.access_token
+            return token_data['access_token'], token_data.get('expires_in', 3600) - 300
         else:
             raise Exception(f"Auth failed: {response.status_code} - {response.text}")
 
 class AzureOpenAIClient:
-    """Azure OpenAI client matching azure.py implementation"""
+    """Azure OpenAI client matching azure.py implementation, on a shared keep-alive connection pool"""
     
     def __init__(self):
         self.auth = AzureOpenAIAuth()
@@ -61,12 +125,26 @@ class AzureOpenAIClient:
             raise ValueError("Missing config: KGW_ENDPOINT, AOAI_API_VERSION, CHAT_MODEL_DEPLOYMENT_NAME")
         
         self.current_deployment = self.chat_deployment
+        # Identical chat and embedding calls already in flight share one HTTP request
+        self.single_flight = SingleFlight()
         print(f"✅ Using GPT-4o deployment: {self.current_deployment}")
     
     def make_api_call(self, messages, max_tokens=4000, temperature=0.3):
-        """Core API call method matching azure.py"""
+        """Core API call method matching azure.py (blocking wrapper for sync callers)"""
+        return get_http_pool().run(self.make_api_call_async(messages, max_tokens, temperature))
+    
+    async def make_api_call_async(self, messages, max_tokens=4000, temperature=0.3):
+        """Core API call method matching azure.py; joins an identical call already in flight"""
+        key = SingleFlight.key("chat", self.current_deployment, messages, temperature, max_tokens)
+        started = time.perf_counter()
+        response = await self.single_flight.do(key, lambda: self._send_chat_completion(messages, max_tokens, temperature))
+        record_llm_call("chat", self.current_deployment, (time.perf_counter() - started) * 1000,
+                        response.status, response.attempts, response.usage)
+        return response
+    
+    async def _send_chat_completion(self, messages, max_tokens, temperature):
         # Step 1: Get OAuth2 access token
-        access_token = self.auth.get_access_token()
+        access_token = await self.auth.get_access_token_async()
         
         # Step 2: Build Azure OpenAI endpoint URL
         url = f"{self.endpoint}/openai/deployments/{self.current_deployment}/chat/completions?api-version={self.api_version}"
@@ -84,51 +162,145 @@ class AzureOpenAIClient:
             'temperature': temperature
         }
         
-        # Step 5: Make HTTP POST request with retry logic
+        # Step 5: Make HTTP POST request with retry logic, admitted by the shared RPM/TPM limiter
+        limiter = get_rate_limiter(self.current_deployment)
+        estimated_tokens = estimate_request_tokens(messages, max_tokens)
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                response = requests.post(url, headers=headers, json=payload, timeout=120)
+                await limiter.acquire(estimated_tokens)
+                response = await get_http_pool().post(url, headers=headers, json=payload, timeout=120)
+                pause = limiter.observe(response, attempt)
+                LLM_REQUESTS.inc(endpoint="chat", status=response.status_code)
                 
                 if response.status_code == 200:
                     # Success - extract response content
                     result = response.json()
-                    return MockResponse(result['choices'][0]['message']['content'])
+                    record_usage("chat", result.get('usage'))
+                    return MockResponse(result['choices'][0]['message']['content'], result.get('usage'),
+                                        attempts=attempt + 1)
                     
                 elif response.status_code == 429:
-                    # Rate limit - exponential backoff
-                    wait_time = (2 ** attempt) + 3
-                    print(f"Rate limit hit, waiting {wait_time}s...")
-                    time.sleep(wait_time)
+                    # Rate limit - every caller on this deployment now waits out Retry-After in acquire()
+                    print(f"Rate limit hit, waiting {pause:.1f}s...")
+                    LLM_RETRIES.inc(endpoint="chat", reason="rate_limit")
                     continue
                     
                 else:
                     # API error
                     error_msg = f"API Error: {response.status_code} - {response.text}"
                     print(f"ERROR: {error_msg}")
-                    return MockResponse(error_msg)
+                    return MockResponse(error_msg, status=response.status_code, attempts=attempt + 1)
                     
             except Exception as e:
                 if attempt == max_retries - 1:
                     error_msg = f"Request failed after {max_retries} attempts: {str(e)}"
                     print(f"ERROR: {error_msg}")
-                    return MockResponse(error_msg)
+                    return MockResponse(error_msg, status=None, attempts=max_retries)
                     
                 # Wait before retry
                 wait_time = (2 ** attempt) + 2
                 print(f"Request error, retrying in {wait_time}s...")
-                time.sleep(wait_time)
+                LLM_RETRIES.inc(endpoint="chat", reason="error")
+                await asyncio.sleep(wait_time)
         
-        return MockResponse(f"Failed after {max_retries} attempts")
+        return MockResponse(f"Failed after {max_retries} attempts", status=429, attempts=max_retries)
+    
+    async def stream_chat_completion(self, messages, max_tokens=4000, temperature=0.3):
+        """
+        Stream a chat completion as it is generated
+        
+        Yields:
+            {"type": "token", "content": ...} for each content delta, then one
+            {"type": "usage", "usage": {...}} (None if the API version does not report it)
+        """
+        access_token = await self.auth.get_access_token_async()
+        url = f"{self.endpoint}/openai/deployments/{self.current_deployment}/chat/completions?api-version={self.api_version}"
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {access_token}'
+        }
+        payload = {
+            'messages': messages,
+            'max_completion_tokens': max_tokens,
+            'temperature': temperature,
+            'stream': True,
+            'stream_options': {'include_usage': True}
+        }
+        
+        limiter = get_rate_limiter(self.current_deployment)
+        estimated_tokens = estimate_request_tokens(messages, max_tokens)
+        max_retries = 3
+        attempt = 0
+        usage = None
+        started = time.perf_counter()
+        first_token_ms = None
+        
+        def on_response(response):
+            limiter.observe(response, attempt)
+            LLM_REQUESTS.inc(endpoint="chat_stream", status=response.status_code)
+        
+        while True:
+            try:
+                await limiter.acquire(estimated_tokens)
+                stream = get_http_pool().stream_lines("POST", url, headers=headers, json=payload, timeout=120,
+                                                      on_response=on_response)
+                async with contextlib.aclosing(stream) as lines:
+                    async for line in lines:
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        usage = chunk.get("usage") or usage
+                        for choice in chunk.get("choices") or []:
+                            content = (choice.get("delta") or {}).get("content")
+                            if content:
+                                if first_token_ms is None:
+                                    first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                                yield {"type": "token", "content": content}
+                break
+            except RuntimeError as e:
+                # Older API versions reject stream_options; retry once without usage reporting
+                if 'stream_options' in payload and "stream_options" in str(e):
+                    payload.pop('stream_options')
+                    continue
+                # Rate limited before any token was sent: acquire() waits out Retry-After
+                if str(e).startswith("API Error: 429") and attempt < max_retries - 1:
+                    attempt += 1
+                    print("Rate limit hit while starting stream, retrying...")
+                    LLM_RETRIES.inc(endpoint="chat_stream", reason="rate_limit")
+                    continue
+                record_llm_call("chat_stream", self.current_deployment, (time.perf_counter() - started) * 1000,
+                                None, attempt + 1, error=str(e)[:200])
+                raise
+        
+        record_usage("chat_stream", usage)
+        record_llm_call("chat_stream", self.current_deployment, (time.perf_counter() - started) * 1000,
+                        200, attempt + 1, usage, first_token_ms=first_token_ms)
+        yield {"type": "usage", "usage": usage}
     
     def chat_completions_create(self, model="gpt-4o", messages=None, temperature=0.3, max_tokens=4000):
         """Create chat completion using Azure OpenAI"""
         return self.make_api_call(messages or [], max_tokens, temperature)
     
     def embeddings_create(self, model="text-embedding-ada-002", input_text=None):
-        """Create embeddings using Azure OpenAI"""
+        """Create embeddings using Azure OpenAI (blocking wrapper for sync callers)"""
+        return get_http_pool().run(self.embeddings_create_async(model, input_text))
+    
+    async def embeddings_create_async(self, model="text-embedding-ada-002", input_text=None):
+        """Create embeddings using Azure OpenAI; joins an identical call already in flight"""
+        key = SingleFlight.key("embeddings", model, input_text or [])
+        started = time.perf_counter()
+        response = await self.single_flight.do(key, lambda: self._send_embeddings(model, input_text))
+        record_llm_call("embeddings", model, (time.perf_counter() - started) * 1000,
+                        response.status, response.attempts, response.usage, inputs=len(input_text or []))
+        return response
+    
+    async def _send_embeddings(self, model, input_text):
         # For embeddings, we'll use the same auth pattern but different endpoint
-        access_token = self.auth.get_access_token()
+        access_token = await self.auth.get_access_token_async()
         
         # Assume embeddings deployment name matches model name
         deployment_name = model
@@ -143,24 +315,53 @@ class AzureOpenAIClient:
             'input': input_text or []
         }
         
+        limiter = get_rate_limiter(deployment_name)
+        estimated_tokens = sum(estimate_tokens(text) for text in payload['input'])
+        max_retries = 3
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
-            
-            if response.status_code == 200:
-                result = response.json()
-                return MockEmbeddingResponse([data['embedding'] for data in result['data']])
-            else:
-                print(f"Embeddings API Error: {response.status_code} - {response.text}")
-                return MockEmbeddingResponse([])
+            for attempt in range(max_retries):
+                await limiter.acquire(estimated_tokens)
+                response = await get_http_pool().post(url, headers=headers, json=payload, timeout=60)
+                pause = limiter.observe(response, attempt)
+                LLM_REQUESTS.inc(endpoint="embeddings", status=response.status_code)
+                
+                if response.status_code == 200:
+                    result = response.json()
+                    record_usage("embeddings", result.get('usage'))
+                    return MockEmbeddingResponse([data['embedding'] for data in result['data']], result.get('usage'),
+                                                 attempts=attempt + 1)
+                elif response.status_code == 429 and attempt < max_retries - 1:
+                    print(f"Embeddings rate limit hit, waiting {pause:.1f}s...")
+                    LLM_RETRIES.inc(endpoint="embeddings", reason="rate_limit")
+                    continue
+                else:
+                    print(f"Embeddings API Error: {response.status_code} - {response.text}")
+                    return MockEmbeddingResponse([], status=response.status_code, attempts=attempt + 1)
                 
         except Exception as e:
             print(f"Embeddings Request Error: {str(e)}")
-            return MockEmbeddingResponse([])
+            return MockEmbeddingResponse([], status=None)
 
 class MockResponse:
     """Mock response object to match OpenAI client interface"""
-    def __init__(self, content):
+    def __init__(self, content, usage=None, status=200, attempts=1):
         self.choices = [MockChoice(content)]
+        # Token usage, final HTTP status (None if no response) and requests sent, for the flight recorder
+        self.usage = usage
+        self.status = status
+        self.attempts = attempts
+
+def completion_content(response, failure):
+    """
+    The message content of a chat completion
+    
+    Raises:
+        AnalysisError: "<failure>: <error text>" if the call failed, since failed calls come
+            back as a response whose content is the error message
+    """
+    if response.status != 200:
+        raise AnalysisError(f"{failure}: {response.choices[0].message.content}")
+    return response.choices[0].message.content
 
 class MockChoice:
     """Mock choice object"""
@@ -174,8 +375,11 @@ class MockMessage:
 
 class MockEmbeddingResponse:
     """Mock embedding response object"""
-    def __init__(self, embeddings):
+    def __init__(self, embeddings, usage=None, status=200, attempts=1):
         self.data = [MockEmbeddingData(emb) for emb in embeddings]
+        self.usage = usage
+        self.status = status
+        self.attempts = attempts
 
 class MockEmbeddingData:
     """Mock embedding data object"""
@@ -185,8 +389,20 @@ class MockEmbeddingData:
 # Initialize Azure OpenAI client
 client = AzureOpenAIClient()
 
-def get_gpt4o_script(prompt, target_file="test.txt"):
-    """Have GPT-4o write a Python script for the given prompt"""
+def get_coalescing_stats():
+    """Counters for chat and embedding calls that joined an identical one in flight"""
+    return client.single_flight.get_stats()
+
+@timed_stage("get_gpt4o_script")
+def get_gpt4o_script(prompt, target_file="test.txt", artifact_note="", temperature=0.3, variant_hint=""):
+    """
+    Have GPT-4o write a Python script for the given prompt
+    
+    Args:
+        artifact_note: Description of the pre-parsed SQLite artifact available next to the file, if any
+        temperature: Sampling temperature
+        variant_hint: Extra instruction that steers a speculative candidate away from the others
+    """
     
     system_prompt = f"""
     You are a Python script generator. Write a complete, executable Python script that:
@@ -206,18 +422,18 @@ def get_gpt4o_script(prompt, target_file="test.txt"):
     - Always include proper error handling and data validation
     
     Start your response immediately with Python code, nothing else.
-    """
+    """ + artifact_note
     
     response = client.chat_completions_create(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Write a Python script to: {prompt}"}
+            {"role": "user", "content": f"Write a Python script to: {prompt}" + (f"\n{variant_hint}" if variant_hint else "")}
         ],
-        temperature=0.3
+        temperature=temperature
     )
     
-    script_content = response.choices[0].message.content.strip()
+    script_content = completion_content(response, "Error generating script").strip()
     
     # Remove markdown code blocks if they somehow still appear
     if script_content.startswith("```python"):
@@ -229,35 +445,47 @@ def get_gpt4o_script(prompt, target_file="test.txt"):
 
     return script_content.strip()
 
-def execute_script_and_analyze(script_content, script_name="generated_script.py"):
-    """Execute the script and analyze if more processing is needed"""
+@timed_stage("execute_script_and_analyze")
+def execute_script_and_analyze(script_content, script_name="generated_script.py", workspace=None, cancel=None):
+    """
+    Execute the script (in workspace, if given) and analyze if more processing is needed
+    
+    Args:
+        cancel: Optional CancelToken; cancelling it abandons the run
+    """
     
     # Write script to file
-    with open(script_name, 'w', encoding='utf-8') as f:
+    script_path = os.path.join(workspace, script_name) if workspace else script_name
+    with open(script_path, 'w', encoding='utf-8') as f:
         f.write(script_content)
     
     print(f"Script content preview (first 200 chars):")
     print(script_content[:200] + "..." if len(script_content) > 200 else script_content)
     print("-" * 40)
     
-    # Execute script
+    # Execute script in a pre-warmed sandbox worker (the file on disk is kept for tracebacks and debugging)
+    started = time.perf_counter()
     try:
-        result = subprocess.run(['python', script_name], 
-                              capture_output=True, text=True, timeout=30)
+        result = run_script(script_content, script_name, cwd=workspace, timeout=30, cancel=cancel)
+        record_script_run(script_name, result['returncode'], (time.perf_counter() - started) * 1000,
+                          output_chars=len(result['stdout']), error_chars=len(result['stderr']),
+                          timed_out=result['timed_out'], cancelled=result.get('cancelled', False))
         return {
-            'success': result.returncode == 0,
-            'output': result.stdout,
-            'error': result.stderr,
-            'script_file': script_name
+            'success': result['returncode'] == 0,
+            'output': result['stdout'],
+            'error': result['stderr'],
+            'script_file': script_path
         }
     except Exception as e:
+        record_script_run(script_name, None, (time.perf_counter() - started) * 1000, error=str(e)[:200])
         return {
             'success': False,
             'output': '',
             'error': str(e),
-            'script_file': script_name
+            'script_file': script_path
         }
 
+@timed_stage("ask_gpt4o_for_decision")
 def ask_gpt4o_for_decision(prompt, execution_result):
     """Ask GPT-4o if another script is needed"""
     
@@ -282,29 +510,115 @@ def ask_gpt4o_for_decision(prompt, execution_result):
         temperature=0.3
     )
     
-    return response.choices[0].message.content
+    return completion_content(response, "Error getting decision")
 
-def autonomous_analysis_loop(user_prompt, max_iterations=3):
-    """Main loop where GPT-4o writes and executes scripts autonomously"""
+@contextlib.contextmanager
+def analysis_workspace(target_file):
+    """
+    Private temporary directory for one analysis, with the target file linked in under its own name
     
+    Generated scripts are written to and run in the workspace, so concurrent analyses never
+    share script files, and the whole directory is removed afterwards.
+    
+    Yields:
+        (workspace path, file name the scripts should open)
+    """
+    if WORKSPACE_ROOT:
+        os.makedirs(WORKSPACE_ROOT, exist_ok=True)
+    workspace = tempfile.mkdtemp(prefix="analysis-", dir=WORKSPACE_ROOT)
+    file_name = os.path.basename(target_file)
+    try:
+        link_into_workspace(target_file, os.path.join(workspace, file_name))
+        yield workspace, file_name
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+def link_into_workspace(source, destination):
+    """Symlink source to destination; hard link or copy where symlinks are not permitted (Windows)"""
+    source = os.path.abspath(source)
+    for link in (os.symlink, os.link):
+        try:
+            link(source, destination)
+            return
+        except (OSError, NotImplementedError):
+            continue
+    shutil.copy2(source, destination)
+
+def link_artifact_into_workspace(target_file, workspace, file_name):
+    """
+    Link the target file's line / page artifact into the workspace as <file_name>.lines.db
+    
+    Returns:
+        The script generator note describing it, or "" when there is none (scripts then parse the text file)
+    """
+    if not SCRIPT_ARTIFACTS_ENABLED:
+        return ""
+    try:
+        artifact = get_document_index_manager().get_artifact(target_file)
+        if artifact is None:
+            return ""
+        artifact_name = f"{file_name}.lines.db"
+        link_into_workspace(artifact["path"], os.path.join(workspace, artifact_name))
+    except Exception as e:
+        print(f"Warning: no line artifact for {target_file}: {e}")
+        return ""
+    annotate(artifact_lines=artifact["lines"], artifact_pages=artifact["pages"])
+    return artifact_prompt(artifact_name, artifact["fts"])
+
+def autonomous_analysis_loop(user_prompt, max_iterations=3, progress=None, target_file="test.txt"):
+    """
+    Main loop where GPT-4o writes and executes scripts autonomously
+    
+    Args:
+        progress: Optional callback receiving a short message as each step starts
+        target_file: File the scripts analyse; it is linked into a private workspace for this run
+    """
+    with analysis_workspace(target_file) as (workspace, file_name):
+        artifact_note = link_artifact_into_workspace(target_file, workspace, file_name)
+        return _run_script_iterations(user_prompt, max_iterations, progress, target_file, workspace, file_name,
+                                      artifact_note)
+
+def _run_script_iterations(user_prompt, max_iterations, progress, target_file, workspace, file_name,
+                           artifact_note=""):
     print(f"Starting autonomous script generation for: {user_prompt}")
     print("=" * 60)
     
+    started = time.perf_counter()
+    original_prompt = user_prompt
+    
+    # 0. A script that already answered this question for a file of the same structure needs no GPT-4o
+    library_answer = run_library_script(user_prompt, target_file, workspace, progress)
+    if library_answer is not None:
+        return library_answer
+    
     for iteration in range(1, max_iterations + 1):
         print(f"\nITERATION {iteration}")
         print("-" * 30)
         
         # 1. GPT-4o writes a script
         print("GPT-4o is writing a Python script...")
+        if progress:
+            progress(f"Iteration {iteration}/{max_iterations}: writing script")
         try:
-            script_content = get_gpt4o_script(user_prompt)
-            
-            script_filename = f"gpt4o_script_iter_{iteration}.py"
-            print(f"Script saved as: {script_filename}")
-            
-            # 2. Execute the script
-            print("Executing script...")
-            execution_result = execute_script_and_analyze(script_content, script_filename)
+            if SPECULATIVE_SCRIPTS > 1:
+                # 1-2. Several candidates are written and executed at once; the first usable one goes on
+                if progress:
+                    progress(f"Iteration {iteration}/{max_iterations}: writing and executing "
+                             f"{SPECULATIVE_SCRIPTS} candidate scripts")
+                script_content, execution_result = run_script_candidates(
+                    user_prompt, file_name, artifact_note, workspace, iteration, SPECULATIVE_SCRIPTS
+                )
+            else:
+                script_content = get_gpt4o_script(user_prompt, file_name, artifact_note)
+                
+                script_filename = f"gpt4o_script_iter_{iteration}.py"
+                print(f"Script saved as: {script_filename}")
+                
+                # 2. Execute the script
+                print("Executing script...")
+                if progress:
+                    progress(f"Iteration {iteration}/{max_iterations}: executing script")
+                execution_result = execute_script_and_analyze(script_content, script_filename, workspace)
             print(f"DEBUG: execution_result type = {type(execution_result)}")
             print(f"DEBUG: execution_result content = {execution_result}")
             
@@ -325,6 +639,8 @@ def autonomous_analysis_loop(user_prompt, max_iterations=3):
             
             # 3. GPT-4o decides if more processing is needed
             print("\nGPT-4o is analyzing results...")
+            if progress:
+                progress(f"Iteration {iteration}/{max_iterations}: analyzing results")
             decision = ask_gpt4o_for_decision(user_prompt, execution_result)
             
             print(f"Decision: {decision}")
@@ -333,6 +649,10 @@ def autonomous_analysis_loop(user_prompt, max_iterations=3):
                 final_answer = decision[5:].strip()
                 print(f"\nFINAL ANSWER: {final_answer}")
                 
+                if script_output_usable(execution_result) and get_script_library().enabled:
+                    get_script_library().put(original_prompt, target_file, script_content,
+                                             (time.perf_counter() - started) * 1000)
+                
                 # If the execution result contains detailed lists or data, return that instead of summary
                 if execution_result and isinstance(execution_result, dict) and execution_result.get('success') and execution_result.get('output'):
                     output_text = execution_result['output']
@@ -348,10 +668,8 @@ def autonomous_analysis_loop(user_prompt, max_iterations=3):
                         output_text.count('\n') > 5 or  # Multi-line detailed output
                         output_text.count('-') > 3):   # Bullet points or numbered items
                         print("SUCCESS: Returning detailed execution result instead of summary")
-                        cleanup_generated_files()  # Clean up before returning
                         return output_text  # Return the actual output text, not the dict
                 
-                cleanup_generated_files()  # Clean up before returning
                 return final_answer
             elif decision.startswith("CONTINUE"):
                 next_step = decision[9:].strip()
@@ -361,118 +679,299 @@ def autonomous_analysis_loop(user_prompt, max_iterations=3):
                 print("WARNING: Unclear decision from GPT-4o, stopping.")
                 break
                 
+        except AnalysisError:
+            # The API call failed: report its error rather than a generic "maximum iterations"
+            raise
         except Exception as e:
             print(f"Error in iteration {iteration}: {str(e)}")
             print(f"Full error details: {type(e).__name__}: {e}")
             break
     
-    # Cleanup: Delete generated script files
-    cleanup_generated_files()
-    
-    return "Analysis completed after maximum iterations"
+    raise AnalysisError("Analysis completed after maximum iterations")
+
+def script_output_usable(execution_result):
+    """A run that exited cleanly and printed something other than a caught error message"""
+    output = execution_result['output'].strip()
+    return (execution_result['success'] and bool(output)
+            and not output.lower().startswith(("error", "file not found", "traceback")))
 
-def cleanup_generated_files():
-    """Delete generated Python script files to keep workspace clean"""
+@timed_stage("run_script_candidates")
+def run_script_candidates(user_prompt, file_name, artifact_note, workspace, iteration, candidates):
+    """
+    Speculative round: GPT-4o writes several candidate scripts concurrently, each runs in the
+    sandbox as soon as it is written, and the first whose output is usable wins
+    
+    The remaining candidates are cancelled: queued or running scripts are abandoned, and
+    generations still in flight are discarded when they return.
+    
+    Returns:
+        (script content, execution result) of the winner; if none is usable, of the
+        lowest-numbered candidate that ran, so the decision step sees its error
+    """
+    cancel = CancelToken()
+    
+    def candidate(k):
+        temperature, variant_hint = SCRIPT_CANDIDATE_VARIANTS[k % len(SCRIPT_CANDIDATE_VARIANTS)]
+        script_content = get_gpt4o_script(user_prompt, file_name, artifact_note, temperature, variant_hint)
+        if cancel.cancelled:
+            return script_content, None
+        script_filename = f"gpt4o_script_iter_{iteration}_{k + 1}.py"
+        return script_content, execute_script_and_analyze(script_content, script_filename, workspace, cancel)
+    
+    print(f"GPT-4o is writing {candidates} candidate scripts...")
+    started = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=candidates, thread_name_prefix="script-candidate")
+    # Each candidate gets a copy of this context so its calls land in the current flight recorder trace
+    futures = {executor.submit(contextvars.copy_context().run, candidate, k): k for k in range(candidates)}
+    winner, fallback, failed = None, None, 0
     try:
-        import glob
-        script_files = glob.glob("gpt4o_script_iter_*.py")
-        for file_path in script_files:
+        for future in as_completed(futures):
+            k = futures[future]
             try:
-                os.remove(file_path)
-                print(f"Cleaned up: {file_path}")
+                script_content, execution_result = future.result()
             except Exception as e:
-                print(f"Could not delete {file_path}: {e}")
-        
-        if script_files:
-            print(f"Cleaned up {len(script_files)} generated script files")
-    except Exception as e:
-        print(f"Cleanup error: {e}")
+                print(f"Candidate {k + 1} failed: {type(e).__name__}: {e}")
+                failed += 1
+                continue
+            if execution_result is None:
+                continue
+            if script_output_usable(execution_result):
+                winner = (k, script_content, execution_result)
+                break
+            failed += 1
+            if fallback is None or k < fallback[0]:
+                fallback = (k, script_content, execution_result)
+    finally:
+        cancel.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    abandoned = candidates - failed - (1 if winner else 0)
+    SPECULATIVE_CANDIDATES.inc(1 if winner else 0, outcome="won")
+    SPECULATIVE_CANDIDATES.inc(failed, outcome="failed")
+    SPECULATIVE_CANDIDATES.inc(abandoned, outcome="cancelled")
+    
+    if winner:
+        print(f"Candidate {winner[0] + 1} of {candidates} succeeded after "
+              f"{time.perf_counter() - started:.2f}s; cancelled {abandoned}")
+        annotate(**{f"speculative_iter_{iteration}": {"candidates": candidates, "winner": winner[0] + 1,
+                                                        "failed": failed, "cancelled": abandoned}})
+        return winner[1], winner[2]
+    
+    print(f"No usable candidate among {candidates}")
+    annotate(**{f"speculative_iter_{iteration}": {"candidates": candidates, "winner": None, "failed": failed}})
+    if fallback:
+        return fallback[1], fallback[2]
+    raise RuntimeError(f"All {candidates} candidate scripts failed to generate")
+
+def run_library_script(prompt, target_file, workspace, progress=None):
+    """
+    Run the script library's script for this prompt and file structure, if there is one
+    
+    Returns:
+        The script's output, or None on a miss or if the stored script no longer works
+        (it is then dropped and GPT-4o writes a new one)
+    """
+    library = get_script_library()
+    if not library.enabled:
+        return None
+    try:
+        entry = library.get(prompt, target_file)
+    except OSError as e:
+        print(f"Script library lookup skipped: {e}")
+        return None
+    if entry is None:
+        CACHE_LOOKUPS.inc(cache="scripts", result="miss")
+        return None
+    
+    print("Script library hit: running stored script")
+    if progress:
+        progress("Running stored script")
+    started = time.perf_counter()
+    execution_result = execute_script_and_analyze(entry["script"], "gpt4o_script_iter_0.py", workspace)
+    # A script that catches its own error exits 0 and prints it: that is a stale entry, not an answer
+    if script_output_usable(execution_result):
+        saved_seconds = max(entry["generation_ms"] / 1000 - (time.perf_counter() - started), 0.0)
+        library.record_saving(saved_seconds)
+        SCRIPT_LIBRARY_SAVED_SECONDS.inc(saved_seconds)
+        CACHE_LOOKUPS.inc(cache="scripts", result="hit")
+        annotate(script_library="hit")
+        return execution_result['output']
+    
+    print("Stored script failed on this file, asking GPT-4o for a new one")
+    library.invalidate(entry)
+    CACHE_LOOKUPS.inc(cache="scripts", result="stale")
+    annotate(script_library="stale")
+    return None
 
 # RAG Implementation
-def create_embeddings(texts):
-    """Create embeddings using ada-002"""
+@timed_stage("create_embeddings")
+def create_embeddings(texts, chunk_params=None):
+    """
+    Create embeddings using ada-002
+
+    Args:
+        texts: List of strings to embed
+        chunk_params: Chunking parameters the texts were produced with. When given,
+            embeddings are served from and stored in the on-disk embedding cache.
+    """
     try:
-        response = client.embeddings_create(
-            model="text-embedding-ada-002",
-            input_text=texts
-        )
-        return [data.embedding for data in response.data]
+        cache = get_embedding_cache()
+        embeddings = [None] * len(texts)
+        if chunk_params is not None:
+            embeddings = cache.get_many(EMBEDDING_MODEL, chunk_params, texts)
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if chunk_params is not None:
+            print(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+            CACHE_LOOKUPS.inc(len(texts) - len(missing), cache="embeddings", result="hit")
+            CACHE_LOOKUPS.inc(len(missing), cache="embeddings", result="miss")
+
+        if missing:
+            # Embed each distinct text once, even if it repeats in the batch
+            missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+            response = client.embeddings_create(
+                model=EMBEDDING_MODEL,
+                input_text=missing_texts
+            )
+            new_embeddings = [data.embedding for data in response.data]
+            if len(new_embeddings) != len(missing_texts):
+                return []
+
+            by_text = dict(zip(missing_texts, new_embeddings))
+            for i in missing:
+                embeddings[i] = by_text[texts[i]]
+
+            if chunk_params is not None:
+                cache.put_many(EMBEDDING_MODEL, chunk_params, missing_texts, new_embeddings)
+
+        return embeddings
     except Exception as e:
         print(f"Error creating embeddings: {e}")
         return []
 
-def prepare_document_chunks(filename, chunk_size=300, debug=True):
-    """Split document into manageable chunks"""
+def chunk_params_key(max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """Identify the chunking parameters embeddings were produced with"""
+    return f"pages:{max_tokens}:{overlap_tokens}:{TOKENIZER_NAME}:{filters_key()}"
+
+@timed_stage("prepare_document_chunks")
+def prepare_document_chunk_records(filename, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, debug=True):
+    """
+    Split document into page-aware chunks with metadata
+    
+    Returns:
+        List of dicts with text, page, byte_start, byte_end and token_count
+    """
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
         if debug:
             print(f"DEBUG - File: {filename}")
-            print(f"DEBUG - Content length: {len(content)} chars")
-            print(f"DEBUG - First 200 chars: {content[:200]}")
+            print(f"DEBUG - File size: {os.path.getsize(filename)} bytes")
         
-        # Simple chunking by words
-        words = content.split()
-        chunks = []
+        # Page headers/footers and near-duplicate chunks are dropped before embedding
+        stats = {}
+        records = list(iter_clean_chunks(filename, max_tokens=max_tokens, overlap_tokens=overlap_tokens, stats=stats))
         
-        for i in range(0, len(words), chunk_size):
-            chunk = ' '.join(words[i:i + chunk_size])
-            chunks.append(chunk)
+        print(f"Document split into {len(records)} chunks "
+              f"({stats['lines_removed']} boilerplate lines, {stats['duplicate_chunks']} duplicate chunks removed)")
         
-        print(f"Document split into {len(chunks)} chunks")
+        if debug and records:
+            print(f"DEBUG - First chunk preview (page {records[0]['page']}): {records[0]['text'][:150]}...")
         
-        if debug and chunks:
-            print(f"DEBUG - First chunk preview: {chunks[0][:150]}...")
-        
-        return chunks
+        return records
         
     except Exception as e:
         print(f"Error preparing chunks: {e}")
         return []
 
-def retrieve_relevant_chunks(query_embedding, chunks, chunk_embeddings, top_k=10, similarity_threshold=0.1, debug=True):
-    """Find most relevant chunks using cosine similarity"""
+def prepare_document_chunks(filename, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, debug=True):
+    """Split document into manageable chunks"""
+    return [record["text"] for record in prepare_document_chunk_records(filename, max_tokens, overlap_tokens, debug)]
+
+def rank_chunks(query_embedding, chunk_embeddings, top_k=10, similarity_threshold=0.1, query_text=None, bm25_index=None):
+    """
+    Indices and scores of the best-matching chunks, best first
+    
+    When query_text and a BM25 index are given (and RETRIEVAL_MODE is "hybrid"), the
+    cosine and BM25 rankings are fused with reciprocal rank fusion and the returned
+    scores are RRF scores rather than similarities.
+    """
+    store = chunk_embeddings if isinstance(chunk_embeddings, VectorStore) else VectorStore(chunk_embeddings)
+    
+    if RETRIEVAL_MODE == "hybrid" and query_text and bm25_index is not None and len(bm25_index):
+        dense_indices, _ = store.search(query_embedding, top_k=HYBRID_CANDIDATES, similarity_threshold=similarity_threshold)
+        lexical_indices, _ = bm25_index.search(query_text, top_k=HYBRID_CANDIDATES)
+        if len(dense_indices) or len(lexical_indices):
+            return reciprocal_rank_fusion([dense_indices, lexical_indices], top_k=top_k)
+    
+    # Get all chunks above similarity threshold, up to top_k
+    indices, scores = store.search(query_embedding, top_k=top_k, similarity_threshold=similarity_threshold)
+    
+    # If no chunks meet threshold, take top 5 anyway
+    if len(indices) == 0:
+        indices, scores = store.search(query_embedding, top_k=5)
+    
+    return indices, scores
+
+def retrieve_relevant_chunks(query_embedding, chunks, chunk_embeddings, top_k=10, similarity_threshold=0.1, debug=True,
+                             query_text=None, bm25_index=None):
+    """
+    Find most relevant chunks using cosine similarity, fused with BM25 when available
+
+    Args:
+        chunk_embeddings: A VectorStore, or raw embeddings to wrap in one
+        query_text: The raw query, used for BM25 scoring
+        bm25_index: BM25Index over the same chunks
+    """
+    relevant_chunks, _, _ = retrieve_relevant_chunks_with_scores(query_embedding, chunks, chunk_embeddings, top_k,
+                                                                 similarity_threshold, debug, query_text, bm25_index)
+    return relevant_chunks
+
+@timed_stage("retrieve_relevant_chunks")
+def retrieve_relevant_chunks_with_scores(query_embedding, chunks, chunk_embeddings, top_k=10, similarity_threshold=0.1,
+                                         debug=True, query_text=None, bm25_index=None):
+    """
+    retrieve_relevant_chunks that also returns where each chunk came from
+    
+    Returns:
+        (relevant_chunks, chunk indices, scores); the fallback to the first chunks has zero scores
+    """
+    fallback = (chunks[:top_k], list(range(min(top_k, len(chunks)))), [0.0] * min(top_k, len(chunks)))
     try:
-        if not query_embedding or not chunk_embeddings:
-            return chunks[:top_k]  # Fallback to first chunks
-            
-        similarities = cosine_similarity([query_embedding], chunk_embeddings)[0]
-        
-        # Get all chunks above similarity threshold, up to top_k
-        relevant_indices = []
-        sorted_indices = np.argsort(similarities)[::-1]  # Sort descending
+        if query_embedding is None or len(query_embedding) == 0 or len(chunk_embeddings) == 0:
+            return fallback  # Fallback to first chunks
         
-        for idx in sorted_indices:
-            if similarities[idx] >= similarity_threshold and len(relevant_indices) < top_k:
-                relevant_indices.append(idx)
-        
-        # If no chunks meet threshold, take top 5 anyway
-        if not relevant_indices:
-            relevant_indices = sorted_indices[:5]
+        relevant_indices, relevant_scores = rank_chunks(query_embedding, chunk_embeddings, top_k, similarity_threshold,
+                                                        query_text=query_text, bm25_index=bm25_index)
         
         relevant_chunks = [chunks[i] for i in relevant_indices]
         print(f"DEBUG Retrieved {len(relevant_chunks)} relevant chunks (threshold: {similarity_threshold})")
         
         if debug:
-            print(f"DEBUG DEBUG - Top similarity scores: {similarities[relevant_indices]}")
+            print(f"DEBUG DEBUG - Top similarity scores: {relevant_scores}")
             print(f"DEBUG DEBUG - Retrieved chunks preview:")
-            for i, (chunk, idx) in enumerate(zip(relevant_chunks, relevant_indices)):
+            for i, (chunk, idx, score) in enumerate(zip(relevant_chunks, relevant_indices, relevant_scores)):
                 # Clean chunk text for safe printing
                 safe_chunk = chunk.replace('\uf0b7', '•').replace('\uf020', ' ').replace('\u2019', "'").replace('\u201c', '"').replace('\u201d', '"')[:150]
                 # Remove any other problematic Unicode characters
                 safe_chunk = ''.join(char if ord(char) < 65536 else '?' for char in safe_chunk)
-                print(f"    Chunk {i+1} (idx {idx}, score {similarities[idx]:.3f}): {safe_chunk}...")
+                print(f"    Chunk {i+1} (idx {idx}, score {score:.3f}): {safe_chunk}...")
                 print(f"    ---")
         
-        return relevant_chunks
+        return relevant_chunks, [int(i) for i in relevant_indices], [float(score) for score in relevant_scores]
         
     except Exception as e:
         print(f"Error retrieving chunks: {e}")
-        return chunks[:top_k]
+        return fallback
 
-def generate_rag_response(prompt, relevant_chunks):
-    """Generate response using retrieved context"""
+def candidate_vectors(chunk_embeddings, indices):
+    """Normalized embeddings of the retrieved chunks, for MMR in pack_context (None if unavailable)"""
+    if not len(indices) or not len(chunk_embeddings):
+        return None
+    if isinstance(chunk_embeddings, VectorStore):
+        return np.asarray(chunk_embeddings.vectors[indices])
+    return normalize_rows(np.asarray([chunk_embeddings[i] for i in indices], dtype=np.float32))
+
+def build_rag_prompt(prompt, relevant_chunks):
+    """Build the answer prompt around the retrieved context"""
     
     context = "\n\n".join(relevant_chunks)
     
@@ -490,58 +989,275 @@ def generate_rag_response(prompt, relevant_chunks):
     - Include specific numbers and counts when available
     - If CAPA information is mentioned, summarize it
     - Be precise and factual in your response
+    - If context passages are labeled with a [Source: ...], name the source document for each fact
+    """
+    return rag_prompt
+
+@timed_stage("generate_rag_response")
+def generate_rag_response(prompt, relevant_chunks):
+    """
+    Generate response using retrieved context
+    
+    Raises:
+        AnalysisError: If the chat completion failed (its error text is never returned as an answer)
     """
     
     try:
         response = client.chat_completions_create(
             model="gpt-4o",
-            messages=[{"role": "user", "content": rag_prompt}],
+            messages=[{"role": "user", "content": build_rag_prompt(prompt, relevant_chunks)}],
             temperature=0.3
         )
-        
-        return response.choices[0].message.content
-        
     except Exception as e:
-        return f"Error generating RAG response: {e}"
+        raise AnalysisError(f"Error generating RAG response: {e}") from e
+    return completion_content(response, "Error generating RAG response")
 
-def rag_analysis(prompt, target_file="test.txt"):
-    """RAG-based analysis using top 20 most relevant chunks"""
+def retrieve_rag_context(prompt, target_file="test.txt", progress=None, query_embedding=None):
+    """
+    Retrieval half of rag_analysis
     
-    print(f"Starting RAG analysis for: {prompt}")
-    print("=" * 60)
+    Args:
+        query_embedding: The prompt's embedding, if the caller already has it (async callers
+            await it on the shared client); created here otherwise
     
-    # 1. Read and chunk the document
-    print("Preparing document chunks...")
-    chunks = prepare_document_chunks(target_file)
+    Returns:
+        Dict with the packed context passages, the sources they came from ({chunk_id, page,
+        score}), their estimated context_tokens and an error message (None on success)
+    """
+    if progress:
+        progress("Loading document index")
+    
+    # 1-2. Use the ingest-time index if the document has one, otherwise chunk and embed now
+    index = get_document_index_manager().load_index(target_file)
+    if index:
+        print(f"Using prebuilt index for {target_file} ({len(index['chunks'])} chunks)")
+        chunks = index["chunks"]
+        chunk_records = index["chunk_records"]
+        chunk_embeddings = index["vector_store"]
+        bm25_index = index["bm25"]
+    else:
+        print("Preparing document chunks...")
+        chunk_records = prepare_document_chunk_records(target_file)
+        chunks = [record["text"] for record in chunk_records]
+        
+        if not chunks:
+            return {"chunks": [], "sources": [], "error": "Error: Could not process document for RAG analysis"}
+        
+        # Served from the embedding cache when the document is unchanged
+        print("Creating embeddings for document chunks...")
+        chunk_embeddings = create_embeddings(chunks, chunk_params=chunk_params_key())
+        bm25_index = BM25Index.build(chunks) if RETRIEVAL_MODE == "hybrid" else None
     
-    if not chunks:
-        return "Error: Could not process document for RAG analysis"
+    # 3. Create query embedding
+    if query_embedding is None:
+        print("Creating query embedding...")
+        query_embeddings = create_embeddings([prompt], chunk_params=QUERY_EMBEDDING_PARAMS)
+        
+        if not query_embeddings:
+            return {"chunks": [], "sources": [], "error": "Error: Could not create query embedding"}
+        
+        query_embedding = query_embeddings[0]
     
-    # 2. Create embeddings for chunks
-    print("Creating embeddings for document chunks...")
-    chunk_embeddings = create_embeddings(chunks)
+    if progress:
+        progress("Retrieving relevant chunks")
     
-    # 3. Create query embedding
-    print("Creating query embedding...")
-    query_embeddings = create_embeddings([prompt])
+    # 4. Find the most relevant chunks
+    print(f"DEBUG Finding top {RAG_TOP_K} most relevant chunks ({RETRIEVAL_MODE})...")
+    relevant_chunks, indices, scores = retrieve_relevant_chunks_with_scores(
+        query_embedding, chunks, chunk_embeddings, top_k=RAG_TOP_K, similarity_threshold=0.05,
+        query_text=prompt, bm25_index=bm25_index
+    )
     
-    if not query_embeddings:
-        return "Error: Could not create query embedding"
+    # 5. Fit the best candidates into the context budget, merging neighbours and skipping near-duplicates
+    candidates = [
+        dict(chunk_records[i], chunk_id=i, score=score) if i < len(chunk_records) else {"text": chunk, "chunk_id": i, "score": score}
+        for chunk, i, score in zip(relevant_chunks, indices, scores)
+    ]
+    packed = pack_context(candidates, vectors=candidate_vectors(chunk_embeddings, indices))
+    print(f"DEBUG Packed {len(candidates) - len(packed['dropped'])} of {len(candidates)} chunks into "
+          f"{len(packed['passages'])} passages ({packed['token_count']} tokens)")
+    
+    score_by_chunk = dict(zip(indices, scores))
+    sources = [
+        {"chunk_id": i, "page": passage["page"], "score": round(score_by_chunk[i], 4)}
+        for passage in packed["passages"] for i in passage["chunk_ids"]
+    ]
+    return {
+        "chunks": [passage["text"] for passage in packed["passages"]],
+        "sources": sources,
+        "context_tokens": packed["token_count"],
+        "error": None
+    }
+
+def rag_analysis(prompt, target_file="test.txt", progress=None):
+    """
+    RAG-based analysis over the most relevant chunks that fit the context budget
     
-    query_embedding = query_embeddings[0]
+    Raises:
+        AnalysisError: If retrieval or answer generation failed
+    """
+    
+    print(f"Starting RAG analysis for: {prompt}")
+    print("=" * 60)
     
-    # 4. Find top 25 most relevant chunks
-    print("DEBUG Finding top 25 most relevant chunks...")
-    relevant_chunks = retrieve_relevant_chunks(query_embedding, chunks, chunk_embeddings, top_k=25, similarity_threshold=0.05)
+    context = retrieve_rag_context(prompt, target_file, progress)
+    if context["error"]:
+        raise AnalysisError(context["error"])
+    
+    if progress:
+        progress("Generating answer")
     
     # 5. Generate answer with context
     print("AI Generating response with context...")
-    response = generate_rag_response(prompt, relevant_chunks)
+    response = generate_rag_response(prompt, context["chunks"])
     
     print("RAG analysis completed")
     return response
 
-def manual_query_processor(prompt, method="extraction", target_file="test.txt"):
+async def stream_rag_analysis(prompt, target_file="test.txt", bypass_cache=False, request_id=None):
+    """
+    rag_analysis that streams the answer as it is generated
+    
+    Yields:
+        (event, data) pairs: "start" with the request id (sent at once, so the client can
+        find the run's trace or cancel it), "retrieval" with the sources, one "token" per
+        content delta, then "done" with timing and token usage, or "error"
+    """
+    with trace("reasoning", prompt, target_file, request_id) as current:
+        yield "start", {"request_id": current.request_id}
+        annotate(document_hash=await asyncio.to_thread(_document_hash, target_file), streamed=True)
+        started = time.perf_counter()
+        
+        def elapsed_ms():
+            return round((time.perf_counter() - started) * 1000, 1)
+        
+        # A cached answer is replayed as a single token event
+        hit = None if bypass_cache else await asyncio.to_thread(lookup_cached_answer, prompt, "reasoning", target_file)
+        if hit is not None:
+            answer = hit.pop("answer")
+            yield "retrieval", {"sources": [], "cache": hit, "retrieval_ms": elapsed_ms()}
+            yield "token", {"content": answer}
+            yield "done", {"timing": {"retrieval_ms": 0.0, "first_token_ms": elapsed_ms(), "total_ms": elapsed_ms()},
+                           "usage": None, "cache": hit, "request_id": current.request_id}
+            return
+        
+        # Retrieval is synchronous NumPy / SQLite work: keep it off the event loop
+        context = await asyncio.to_thread(retrieve_rag_context, prompt, target_file)
+        retrieval_ms = elapsed_ms()
+        if context["error"]:
+            mark_error(context["error"])
+            yield "error", {"message": context["error"]}
+            return
+        yield "retrieval", {"sources": context["sources"], "context_tokens": context["context_tokens"], "cache": None,
+                            "retrieval_ms": retrieval_ms}
+        
+        first_token_ms = None
+        answer_parts = []
+        usage = None
+        generation_started = time.perf_counter()
+        try:
+            messages = [{"role": "user", "content": build_rag_prompt(prompt, context["chunks"])}]
+            async for event in client.stream_chat_completion(messages, temperature=0.3):
+                if event["type"] == "token":
+                    if first_token_ms is None:
+                        first_token_ms = elapsed_ms()
+                    answer_parts.append(event["content"])
+                    yield "token", {"content": event["content"]}
+                elif event["type"] == "usage":
+                    usage = event["usage"]
+        except Exception as e:
+            STAGE_ERRORS.inc(stage="generate_rag_response")
+            mark_error(e)
+            yield "error", {"message": f"Error generating RAG response: {e}"}
+            return
+        STAGE_SECONDS.observe(time.perf_counter() - generation_started, stage="generate_rag_response")
+        
+        answer = "".join(answer_parts)
+        if usage is None:
+            usage = {"completion_tokens": estimate_tokens(answer), "estimated": True}
+        await asyncio.to_thread(store_cached_answer, prompt, "reasoning", target_file, answer)
+        
+        yield "done", {
+            "timing": {"retrieval_ms": retrieval_ms, "first_token_ms": first_token_ms, "total_ms": elapsed_ms()},
+            "usage": usage,
+            "cache": None,
+            "request_id": current.request_id
+        }
+
+def corpus_rag_analysis(prompt, file_paths=None, top_k=RAG_TOP_K, similarity_threshold=0.05, request_id=None):
+    """
+    RAG analysis over many indexed documents in one ranked pass
+    
+    Args:
+        prompt: User query
+        file_paths: Documents to search; defaults to every indexed file in uploads/
+    
+    Returns:
+        Dict with the answer, per-chunk source attribution and any files not yet indexed
+    """
+    with trace("corpus", prompt, request_id=request_id):
+        annotate(files=len(file_paths) if file_paths is not None else None)
+        
+        print(f"Starting corpus RAG analysis for: {prompt}")
+        print("=" * 60)
+        
+        # 1. The merged corpus index is built once per process and extended as documents arrive
+        corpus, unindexed = get_document_index_manager().load_corpus(file_paths)
+        if unindexed:
+            print(f"WARNING: Skipping documents without a ready index: {unindexed}")
+        
+        if not corpus.chunk_records:
+            mark_error("No indexed documents available for corpus analysis")
+            return {
+                "result": "Error: No indexed documents available for corpus analysis",
+                "sources": [],
+                "unindexed_files": unindexed
+            }
+        
+        print(f"Searching {len(corpus.documents)} documents ({len(corpus.chunk_records)} chunks)")
+        
+        # 2. Create query embedding
+        query_embeddings = create_embeddings([prompt], chunk_params=QUERY_EMBEDDING_PARAMS)
+        if not query_embeddings:
+            mark_error("Could not create query embedding")
+            return {"result": "Error: Could not create query embedding", "sources": [], "unindexed_files": unindexed}
+        
+        # 3. Rank chunks across every document at once
+        indices, scores = rank_chunks(query_embeddings[0], corpus.vector_store, top_k, similarity_threshold,
+                                      query_text=prompt, bm25_index=corpus.bm25)
+        
+        # 4. Fit the best candidates into the context budget
+        candidates = [dict(corpus.chunk_records[idx], score=float(score)) for idx, score in zip(indices, scores)]
+        packed = pack_context(candidates, vectors=candidate_vectors(corpus.vector_store, indices))
+        
+        score_by_chunk = {(c["source"], c["chunk_id"]): c["score"] for c in candidates}
+        sources = []
+        labeled_chunks = []
+        for passage in packed["passages"]:
+            for chunk_id in passage["chunk_ids"]:
+                sources.append({
+                    "file_path": passage["source"],
+                    "chunk_id": chunk_id,
+                    "score": round(score_by_chunk[(passage["source"], chunk_id)], 4)
+                })
+            chunk_label = ", ".join(str(chunk_id) for chunk_id in passage["chunk_ids"])
+            label = "chunks" if len(passage["chunk_ids"]) > 1 else "chunk"
+            labeled_chunks.append(f"[Source: {passage['source']}, {label} {chunk_label}]\n{passage['text']}")
+        
+        print(f"DEBUG Packed {len(sources)} of {len(candidates)} chunks from {len(set(s['file_path'] for s in sources))} "
+              f"documents ({packed['token_count']} tokens)")
+        
+        # 5. Generate answer with attributed context
+        try:
+            response = generate_rag_response(prompt, labeled_chunks)
+        except AnalysisError as e:
+            mark_error(e)
+            response = str(e)
+        
+        print("Corpus RAG analysis completed")
+        return {"result": response, "sources": sources, "unindexed_files": unindexed}
+
+def manual_query_processor(prompt, method="extraction", target_file="test.txt", progress=None):
     """
     Process query with manual method selection
     
@@ -549,19 +1265,249 @@ def manual_query_processor(prompt, method="extraction", target_file="test.txt"):
         prompt: User query
         method: "extraction" or "reasoning"
         target_file: File to analyze
+        progress: Optional callback receiving a short message as each step starts
     """
     
+    with trace(method, prompt, target_file):
+        try:
+            return run_analysis(prompt, method, target_file, progress)
+        except AnalysisError as e:
+            mark_error(e)
+            return str(e)
+
+def run_analysis(prompt, method, target_file, progress=None):
+    """
+    Run the selected analysis method
+    
+    Raises:
+        AnalysisError: If the run produced no answer
+    """
+    annotate(document_hash=_document_hash(target_file))
     if method == "extraction":
         print(f"Using SCRIPT GENERATION for: {prompt[:50]}...")
-        return autonomous_analysis_loop(prompt)
+        return autonomous_analysis_loop(prompt, progress=progress, target_file=target_file)
+    
+    elif method == "reasoning":
+        print(f"Using RAG ANALYSIS for: {prompt[:50]}...")
+        return rag_analysis(prompt, target_file, progress=progress)
+    
+    else:
+        raise ValueError("Method must be 'extraction' or 'reasoning'")
+
+def cached_query_processor(prompt, method="extraction", target_file="test.txt", bypass_cache=False, progress=None,
+                           request_id=None):
+    """
+    manual_query_processor behind the answer cache
+    
+    Answers are keyed by the document's content hash, the method and the normalized prompt;
+    prompts that are near-duplicates of a cached one (by embedding similarity) also hit.
+    
+    Args:
+        bypass_cache: Always run the analysis (the fresh answer still replaces the cached one)
+        progress: Optional callback receiving a short message as each step starts
+        request_id: Id of the flight recorder trace (a new one is generated if omitted)
+    
+    Returns:
+        (result, cache_info) where cache_info describes the hit, or is None on a miss
+    """
+    with trace(method, prompt, target_file, request_id):
+        if not get_answer_cache().enabled:
+            return manual_query_processor(prompt, method, target_file, progress), None
+        
+        hit = None if bypass_cache else lookup_cached_answer(prompt, method, target_file)
+        if hit is not None:
+            return hit.pop("answer"), hit
+        
+        # Only a run that produced an answer is cached; a failure is returned once and retried next time
+        try:
+            result = run_analysis(prompt, method, target_file, progress)
+        except AnalysisError as e:
+            mark_error(e)
+            return str(e), None
+        store_cached_answer(prompt, method, target_file, result)
+        return result, None
+
+def _document_hash(target_file):
+    """Content hash of the analysed document for the trace; None if it cannot be read"""
+    try:
+        return get_document_index_manager().content_hash(target_file)
+    except OSError:
+        return None
+
+def _prompt_embedding(prompt):
+    # Served from the embedding cache for repeated prompts, and reused by rag_analysis
+    query_embeddings = create_embeddings([prompt], chunk_params=QUERY_EMBEDDING_PARAMS)
+    return query_embeddings[0] if query_embeddings else None
+
+def lookup_cached_answer(prompt, method, target_file, prompt_embedding=None):
+    """
+    Exact, then near-duplicate, answer cache lookup; returns the hit dict or None
+    
+    Args:
+        prompt_embedding: The prompt's embedding, if the caller already has it
+    """
+    cache = get_answer_cache()
+    if not cache.enabled:
+        return None
+    
+    doc_hash = get_document_index_manager().content_hash(target_file)
+    annotate(document_hash=doc_hash)
+    hit = cache.get_exact(doc_hash, method, prompt)
+    if hit is None and cache.semantic_enabled:
+        hit = cache.get_similar(doc_hash, method, prompt, prompt_embedding or _prompt_embedding(prompt))
+    
+    if hit is None:
+        cache.record_miss()
+        CACHE_LOOKUPS.inc(cache="answers", result="miss")
+    else:
+        print(f"Answer cache {hit['match']} hit (similarity {hit['similarity']}) for: {prompt[:50]}...")
+        CACHE_LOOKUPS.inc(cache="answers", result=f"{hit['match']}_hit")
+        annotate(cache={"match": hit["match"], "similarity": hit["similarity"]})
+    return hit
+
+def store_cached_answer(prompt, method, target_file, result, prompt_embedding=None):
+    """Cache the answer of a run that succeeded; callers never pass failures here"""
+    cache = get_answer_cache()
+    if not cache.enabled or not result:
+        return
+    
+    if cache.semantic_enabled and prompt_embedding is None:
+        prompt_embedding = _prompt_embedding(prompt)
+    cache.put(get_document_index_manager().content_hash(target_file), method, prompt, result, prompt_embedding)
+
+# Async pipeline: the embeddings and chat completion requests are awaited on the shared
+# client, so a request waiting on Azure holds no thread. Disk and NumPy work (caches, index
+# loads, ranking) runs via asyncio.to_thread.
+
+@timed_stage("create_embeddings")
+async def create_query_embedding_async(prompt):
+    """
+    create_embeddings([prompt]) for async callers, behind the same embedding cache
+    
+    Returns:
+        The prompt's embedding, or None if it could not be created
+    """
+    cache = get_embedding_cache()
+    cached = (await asyncio.to_thread(cache.get_many, EMBEDDING_MODEL, QUERY_EMBEDDING_PARAMS, [prompt]))[0]
+    CACHE_LOOKUPS.inc(cache="embeddings", result="hit" if cached is not None else "miss")
+    if cached is not None:
+        return cached
+    
+    try:
+        response = await client.embeddings_create_async(model=EMBEDDING_MODEL, input_text=[prompt])
+    except Exception as e:
+        print(f"Error creating embeddings: {e}")
+        return None
+    if len(response.data) != 1:
+        return None
+    
+    embedding = response.data[0].embedding
+    await asyncio.to_thread(cache.put_many, EMBEDDING_MODEL, QUERY_EMBEDDING_PARAMS, [prompt], [embedding])
+    return embedding
+
+@timed_stage("generate_rag_response")
+async def generate_rag_response_async(prompt, relevant_chunks):
+    """
+    generate_rag_response for async callers
+    
+    Raises:
+        AnalysisError: If the chat completion failed
+    """
+    messages = [{"role": "user", "content": build_rag_prompt(prompt, relevant_chunks)}]
+    try:
+        response = await client.make_api_call_async(messages, temperature=0.3)
+    except Exception as e:
+        raise AnalysisError(f"Error generating RAG response: {e}") from e
+    return completion_content(response, "Error generating RAG response")
+
+async def rag_analysis_async(prompt, target_file="test.txt", query_embedding=None):
+    """
+    rag_analysis for async callers
+    
+    Raises:
+        AnalysisError: If retrieval or answer generation failed
+    """
+    print(f"Starting RAG analysis for: {prompt}")
+    print("=" * 60)
+    
+    if query_embedding is None:
+        query_embedding = await create_query_embedding_async(prompt)
+    if query_embedding is None:
+        raise AnalysisError("Error: Could not create query embedding")
+    
+    context = await asyncio.to_thread(retrieve_rag_context, prompt, target_file, None, query_embedding)
+    if context["error"]:
+        raise AnalysisError(context["error"])
+    
+    print("AI Generating response with context...")
+    response = await generate_rag_response_async(prompt, context["chunks"])
+    
+    print("RAG analysis completed")
+    return response
+
+async def run_analysis_async(prompt, method, target_file, query_embedding=None):
+    """
+    run_analysis for async callers
+    
+    Script generation alternates GPT-4o calls with blocking sandbox runs and file I/O, so the
+    extraction method still runs on a worker thread; reasoning awaits its API calls.
+    
+    Raises:
+        AnalysisError: If the run produced no answer
+    """
+    if method == "extraction":
+        return await asyncio.to_thread(run_analysis, prompt, method, target_file)
     
     elif method == "reasoning":
+        annotate(document_hash=await asyncio.to_thread(_document_hash, target_file))
         print(f"Using RAG ANALYSIS for: {prompt[:50]}...")
-        return rag_analysis(prompt, target_file)
+        return await rag_analysis_async(prompt, target_file, query_embedding)
     
     else:
         raise ValueError("Method must be 'extraction' or 'reasoning'")
 
+async def manual_query_processor_async(prompt, method="extraction", target_file="test.txt"):
+    """manual_query_processor for async callers"""
+    with trace(method, prompt, target_file):
+        try:
+            return await run_analysis_async(prompt, method, target_file)
+        except AnalysisError as e:
+            mark_error(e)
+            return str(e)
+
+async def cached_query_processor_async(prompt, method="extraction", target_file="test.txt", bypass_cache=False,
+                                       request_id=None):
+    """
+    cached_query_processor for async callers
+    
+    Returns:
+        (result, cache_info) where cache_info describes the hit, or is None on a miss
+    """
+    with trace(method, prompt, target_file, request_id):
+        cache = get_answer_cache()
+        if not cache.enabled:
+            return await manual_query_processor_async(prompt, method, target_file), None
+        
+        # One embedding serves the near-duplicate lookup, retrieval and the stored entry
+        prompt_embedding = None
+        if cache.semantic_enabled or method == "reasoning":
+            prompt_embedding = await create_query_embedding_async(prompt)
+        
+        hit = None
+        if not bypass_cache:
+            hit = await asyncio.to_thread(lookup_cached_answer, prompt, method, target_file, prompt_embedding)
+        if hit is not None:
+            return hit.pop("answer"), hit
+        
+        # Only a run that produced an answer is cached; a failure is returned once and retried next time
+        try:
+            result = await run_analysis_async(prompt, method, target_file, prompt_embedding)
+        except AnalysisError as e:
+            mark_error(e)
+            return str(e), None
+        await asyncio.to_thread(store_cached_answer, prompt, method, target_file, result, prompt_embedding)
+        return result, None
+
 def check_requirements():
     """Check if all requirements are met"""
     
@@ -602,11 +1548,10 @@ def check_requirements():
     
     # Check for required packages
     try:
-        import sklearn
         import numpy
     except ImportError as e:
         print(f"ERROR Missing required package: {e}")
-        print("Please install: pip install scikit-learn numpy")
+        print("Please install: pip install numpy")
         return False
     
     # Check for test.txt
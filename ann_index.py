@@ -0,0 +1,186 @@
+"""
+ANN Index
+Inverted-file (IVF-flat) approximate nearest-neighbour index implemented on NumPy
+"""
+
+import os
+import json
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+from vector_store import normalize_rows
+
+# Stores with fewer vectors than this are searched exhaustively
+ANN_MIN_VECTORS = int(os.getenv('ANN_MIN_VECTORS', '20000'))
+# Number of inverted lists scanned per query: higher = better recall, slower queries
+ANN_NPROBE = int(os.getenv('ANN_NPROBE', '32'))
+
+
+def default_list_count(vector_count: int) -> int:
+    """Rule of thumb: about 4 * sqrt(N) inverted lists"""
+    return max(1, min(vector_count, int(4 * np.sqrt(vector_count))))
+
+
+class IVFFlatIndex:
+    """
+    Spherical k-means coarse quantizer with exact dot-product scoring inside the probed lists
+
+    The index stores only centroids and per-list vector ids; the vectors themselves stay
+    in the VectorStore matrix passed to search(), so no embedding is held twice.
+    """
+
+    def __init__(self, n_probe: int = ANN_NPROBE):
+        self.n_probe = n_probe
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.lists: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self.lists)
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    def build(self, vectors: np.ndarray, n_lists: Optional[int] = None, iterations: int = 10,
+              max_training_vectors: int = 100000, seed: int = 0) -> "IVFFlatIndex":
+        """
+        Train centroids on (a sample of) unit-length vectors and assign every vector to a list
+
+        Args:
+            vectors: Row-normalized float32 matrix, e.g. VectorStore.vectors
+            n_lists: Number of inverted lists (defaults to ~4 * sqrt(N))
+            iterations: k-means iterations
+            max_training_vectors: Sample size used to train the centroids
+        """
+        count = vectors.shape[0]
+        if count == 0:
+            raise ValueError("Cannot build an ANN index over zero vectors")
+
+        n_lists = min(n_lists or default_list_count(count), count)
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(count, max(max_training_vectors, n_lists))
+        sample_ids = np.sort(rng.choice(count, size=sample_size, replace=False)) if sample_size < count else np.arange(count)
+        sample = np.asarray(vectors[sample_ids], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = self._assign(sample, centroids)
+            counts = np.bincount(assignments, minlength=n_lists)
+
+            # Per-list sums via one sort + reduceat (np.add.at is an order of magnitude slower)
+            order = np.argsort(assignments, kind='stable')
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(centroids)
+            filled = counts > 0
+            sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+
+            # Re-seed empty lists from random sample vectors so no list stays dead
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()), replace=False)]
+            centroids = normalize_rows(sums)
+
+        self.centroids = centroids
+        self.lists = [np.zeros(0, dtype=np.int64) for _ in range(n_lists)]
+        self.add(vectors, np.arange(count, dtype=np.int64))
+        return self
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+        """Index of the nearest centroid for every vector, computed in batches"""
+        assignments = np.empty(vectors.shape[0], dtype=np.int64)
+        for start in range(0, vectors.shape[0], batch_size):
+            batch = np.asarray(vectors[start:start + batch_size], dtype=np.float32)
+            assignments[start:start + batch_size] = np.argmax(batch @ centroids.T, axis=1)
+        return assignments
+
+    def copy(self) -> "IVFFlatIndex":
+        """An index that can be added to without changing this one (list arrays are shared until replaced)"""
+        index = IVFFlatIndex(n_probe=self.n_probe)
+        index.centroids = self.centroids
+        index.lists = list(self.lists)
+        return index
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        """Assign new vectors (already normalized) to their nearest lists"""
+        if self.n_lists == 0:
+            raise ValueError("ANN index must be built before vectors can be added")
+
+        assignments = self._assign(vectors, self.centroids)
+        order = np.argsort(assignments, kind='stable')
+        sorted_lists = assignments[order]
+        sorted_ids = np.asarray(ids, dtype=np.int64)[order]
+        boundaries = np.searchsorted(sorted_lists, np.arange(self.n_lists + 1))
+
+        for list_id in range(self.n_lists):
+            start, end = boundaries[list_id], boundaries[list_id + 1]
+            if start < end:
+                self.lists[list_id] = np.concatenate([self.lists[list_id], sorted_ids[start:end]])
+
+    def search(self, vectors: np.ndarray, query: np.ndarray, top_k: int = 10,
+               n_probe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k by scanning the n_probe lists closest to the query
+
+        Args:
+            vectors: The normalized matrix the index was built over
+            query: Normalized query vector
+
+        Returns:
+            (indices, scores) ordered by descending score
+        """
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        centroid_scores = self.centroids @ query
+        if n_probe < self.n_lists:
+            probe = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        else:
+            probe = np.arange(self.n_lists)
+
+        candidates = np.concatenate([self.lists[list_id] for list_id in probe])
+        if len(candidates) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        # Gathering in id order keeps memory-mapped reads sequential
+        candidates.sort()
+        scores = np.asarray(vectors[candidates], dtype=np.float32) @ query
+
+        k = min(top_k, len(candidates))
+        if k < len(candidates):
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(candidates))
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return candidates[best], scores[best]
+
+    def save(self, directory: Union[str, Path]) -> None:
+        """Persist centroids and inverted lists next to the vectors file"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        lengths = np.array([len(ids) for ids in self.lists], dtype=np.int64)
+        ids = np.concatenate(self.lists) if self.lists else np.zeros(0, dtype=np.int64)
+
+        np.save(directory / "ann_centroids.npy", self.centroids)
+        np.save(directory / "ann_list_ids.npy", ids)
+        np.save(directory / "ann_list_lengths.npy", lengths)
+        with open(directory / "ann_config.json", 'w', encoding='utf-8') as f:
+            json.dump({"type": "ivf-flat", "n_lists": self.n_lists, "n_probe": self.n_probe, "size": len(ids)}, f)
+
+    @classmethod
+    def load(cls, directory: Union[str, Path], n_probe: Optional[int] = None) -> Optional["IVFFlatIndex"]:
+        """Load an index saved with save(); returns None if there is none"""
+        directory = Path(directory)
+        if not (directory / "ann_config.json").exists():
+            return None
+
+        with open(directory / "ann_config.json", 'r', encoding='utf-8') as f:
+            config = json.load(f)
+
+        index = cls(n_probe=n_probe or config.get("n_probe", ANN_NPROBE))
+        index.centroids = np.load(directory / "ann_centroids.npy")
+        ids = np.load(directory / "ann_list_ids.npy")
+        lengths = np.load(directory / "ann_list_lengths.npy")
+        index.lists = np.split(ids, np.cumsum(lengths)[:-1]) if len(lengths) else []
+        return index
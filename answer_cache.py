@@ -0,0 +1,239 @@
+"""
+Answer Cache
+Persistent cache of final answers keyed by document content, method and normalized prompt,
+with optional (off by default) near-duplicate matching on prompt embeddings
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from embedding_cache import text_sha256
+
+_WHITESPACE = re.compile(r"\s+")
+_NUMBER = re.compile(r"\d+(?:[.,:/-]\d+)*")
+_WORD = re.compile(r"[A-Za-z][A-Za-z'-]*")
+# Words that flip or narrow a question's meaning while barely moving its embedding
+_NEGATIONS = {"not", "no", "never", "none", "without", "except", "excluding", "neither", "nor"}
+_NEGATION_PREFIX = re.compile(r"^(?:un|non|in|dis|im|ir)[a-z]{4,}$")
+# Capitalized words that start questions rather than name something
+_QUESTION_WORDS = {"how", "what", "which", "who", "when", "where", "why", "list", "show", "give", "count",
+                   "please", "state", "provide", "analyze", "analyse", "summarize", "summarise", "find",
+                   "identify", "is", "are", "was", "were", "do", "does", "did", "can", "the", "a", "an", "in",
+                   "for", "of", "and", "i"}
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    return _WHITESPACE.sub(" ", prompt.strip().lower()).rstrip(" ?.!")
+
+
+def prompt_guard(prompt: str) -> frozenset:
+    """
+    Numbers, named entities (capitalized words) and negations in a prompt
+
+    Prompts that differ in any of these ("Israel" / "Germany", "substantiated" /
+    "unsubstantiated", "2023" / "2024") can sit above the similarity threshold on ada-002
+    embeddings, so a near-duplicate match also requires the same guard.
+    """
+    terms = set(_NUMBER.findall(prompt))
+    for word in _WORD.findall(prompt):
+        lower = word.lower()
+        if lower in _NEGATIONS or lower.endswith("n't") or _NEGATION_PREFIX.match(lower):
+            terms.add(lower)
+        elif word[0].isupper() and lower not in _QUESTION_WORDS:
+            terms.add(lower)
+    return frozenset(terms)
+
+
+class AnswerCache:
+    """On-disk answer cache with TTL expiry and LRU eviction over a maximum entry count"""
+
+    def __init__(self, storage_dir: str = "answer_cache", max_entries: int = 1000, ttl_seconds: float = 86400,
+                 similarity_threshold: float = 0.985, semantic: bool = False, enabled: bool = True):
+        self.storage_dir = Path(storage_dir)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Near-duplicate prompts must be at least this similar (and share their prompt_guard terms)
+        self.similarity_threshold = similarity_threshold
+        self.semantic = semantic
+        self.enabled = enabled
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if self.enabled:
+            self.storage_dir.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.storage_dir / "answers.db"), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS answers (
+                    doc_hash TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    prompt_hash TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    prompt_embedding BLOB,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (doc_hash, method, prompt_hash)
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_last_access ON answers (last_access)")
+            self._conn.commit()
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.enabled and self.semantic and self.similarity_threshold <= 1.0
+
+    def _hit(self, doc_hash: str, method: str, row: tuple, match: str, similarity: float) -> Dict:
+        prompt_hash, prompt, answer, created_at = row
+        self._conn.execute(
+            "UPDATE answers SET last_access = ? WHERE doc_hash = ? AND method = ? AND prompt_hash = ?",
+            (time.time(), doc_hash, method, prompt_hash)
+        )
+        self._conn.commit()
+        if match == "exact":
+            self.exact_hits += 1
+        else:
+            self.semantic_hits += 1
+        return {
+            "answer": json.loads(answer),
+            "match": match,
+            "similarity": round(similarity, 4),
+            "cached_prompt": prompt,
+            "cached_at": created_at
+        }
+
+    def get_exact(self, doc_hash: str, method: str, prompt: str) -> Optional[Dict]:
+        """Look up an answer for the same normalized prompt"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT prompt_hash, prompt, answer, created_at FROM answers "
+                "WHERE doc_hash = ? AND method = ? AND prompt_hash = ? AND created_at >= ?",
+                (doc_hash, method, text_sha256(normalize_prompt(prompt)), time.time() - self.ttl_seconds)
+            ).fetchone()
+            return self._hit(doc_hash, method, row, "exact", 1.0) if row else None
+
+    def get_similar(self, doc_hash: str, method: str, prompt: str, prompt_embedding: List[float]) -> Optional[Dict]:
+        """
+        Look up the most similar cached prompt for the document above similarity_threshold
+
+        Only cached prompts with the same numbers, entities and negations (see prompt_guard)
+        are candidates.
+        """
+        if not self.semantic_enabled or prompt_embedding is None:
+            return None
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT prompt_hash, prompt, answer, created_at, prompt_embedding FROM answers "
+                "WHERE doc_hash = ? AND method = ? AND created_at >= ? AND prompt_embedding IS NOT NULL",
+                (doc_hash, method, time.time() - self.ttl_seconds)
+            ).fetchall()
+            guard = prompt_guard(prompt)
+            rows = [row for row in rows if prompt_guard(row[1]) == guard]
+            if not rows:
+                return None
+
+            query = np.asarray(prompt_embedding, dtype=np.float32)
+            query /= max(float(np.linalg.norm(query)), 1e-12)
+            matrix = np.stack([np.frombuffer(row[4], dtype=np.float32) for row in rows])
+            similarities = (matrix @ query) / np.maximum(np.linalg.norm(matrix, axis=1), 1e-12)
+
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+            return self._hit(doc_hash, method, rows[best][:4], "semantic", float(similarities[best]))
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def put(self, doc_hash: str, method: str, prompt: str, answer, prompt_embedding: Optional[List[float]] = None) -> None:
+        """Store an answer and evict expired and least recently used entries"""
+        if not self.enabled:
+            return
+
+        now = time.time()
+        blob = np.asarray(prompt_embedding, dtype=np.float32).tobytes() if prompt_embedding is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (doc_hash, method, prompt_hash, prompt, prompt_embedding, answer, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (doc_hash, method, text_sha256(normalize_prompt(prompt)), prompt, blob, json.dumps(answer), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """Drop expired entries, then least recently used ones beyond max_entries"""
+        expired = self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        excess = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM answers WHERE rowid IN (SELECT rowid FROM answers ORDER BY last_access ASC LIMIT ?)",
+                (excess,)
+            )
+        self.evictions += expired + max(excess, 0)
+
+    def clear(self) -> None:
+        """Remove every cached answer"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+    def get_stats(self) -> Dict:
+        """Get hit/miss counters and entry count"""
+        entries = 0
+        if self.enabled:
+            with self._lock:
+                entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "semantic": self.semantic_enabled,
+            "similarity_threshold": self.similarity_threshold
+        }
+
+
+# Global instance
+answer_cache = AnswerCache(
+    storage_dir=os.getenv('ANSWER_CACHE_DIR', 'answer_cache'),
+    max_entries=int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '1000')),
+    ttl_seconds=float(os.getenv('ANSWER_CACHE_TTL_SECONDS', '86400')),
+    similarity_threshold=float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.985')),
+    semantic=os.getenv('ANSWER_CACHE_SEMANTIC', 'false').lower() == 'true',
+    enabled=os.getenv('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+)
+
+def get_answer_cache() -> AnswerCache:
+    """Get the global answer cache instance"""
+    return answer_cache
@@ -1,11 +1,13 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import os
 import json
+import asyncio
+import contextlib
 import uvicorn
 from dotenv import load_dotenv
 
@@ -35,10 +37,25 @@ try:
     from analysis_engine import (
         autonomous_analysis_loop,
         rag_analysis,
+        corpus_rag_analysis,
         manual_query_processor,
+        cached_query_processor,
+        manual_query_processor_async,
+        cached_query_processor_async,
+        stream_rag_analysis,
+        get_coalescing_stats,
         check_requirements
     )
     from element_manager import get_element_manager
+    from embedding_cache import get_embedding_cache
+    from answer_cache import get_answer_cache
+    from script_library import get_script_library
+    from job_manager import get_job_manager
+    from rate_limiter import get_rate_limit_stats
+    from metrics import render_metrics, METRICS_ENABLED
+    from flight_recorder import get_flight_recorder, new_request_id
+    from script_sandbox import get_sandbox_pool, SANDBOX_POOL_ENABLED
+    from document_index import get_document_index_manager, INDEXABLE_EXTENSIONS
     print("Analysis engine imported successfully")
 except ImportError as e:
     print(f"Warning: Could not import analysis engine: {e}")
@@ -46,6 +63,12 @@ except ImportError as e:
     def manual_query_processor(prompt, method, target_file):
         return f"Analysis engine not available. Query: {prompt}, Method: {method}, File: {target_file}"
     
+    async def manual_query_processor_async(prompt, method, target_file):
+        return manual_query_processor(prompt, method, target_file)
+    
+    async def cached_query_processor_async(prompt, method, target_file, bypass_cache=False, request_id=None):
+        return manual_query_processor(prompt, method, target_file), None
+    
     def check_requirements():
         return False
 
@@ -66,6 +89,8 @@ class ProcessRequest(BaseModel):
     model: str = "gpt-4o-mini"
     data: List[DataItem] = []
     files: List[FileItem] = []
+    corpus: bool = False  # reasoning only: search every indexed upload (or all of `files`) at once
+    bypass_cache: bool = False  # skip the answer cache and run the analysis again
 
 class ConfigRequest(BaseModel):
     default_prompt: str = "Tell me about this document"
@@ -73,6 +98,8 @@ class ConfigRequest(BaseModel):
     method: str = "extraction"
     document_sources: List[str] = []
     referenced_elements: List[str] = []
+    corpus: bool = False
+    bypass_cache: bool = False
 
 # Global configuration storage (in production, use a database)
 app_config = {
@@ -80,9 +107,84 @@ app_config = {
     "model": "gpt-4o-mini",
     "method": "extraction",
     "document_sources": [],
-    "referenced_elements": []
+    "referenced_elements": [],
+    "corpus": False
 }
 
+# request_id -> cancel flag of each answer this process is streaming
+active_streams: Dict[str, asyncio.Event] = {}
+
+def resolve_document_path(file_path: str) -> str:
+    """Resolve a document path and make sure it stays inside the project directory"""
+    base_dir = os.path.realpath(".")
+    resolved = os.path.realpath(file_path)
+    if os.path.commonpath([base_dir, resolved]) != base_dir:
+        raise HTTPException(status_code=400, detail="File path must be inside the project directory")
+    return os.path.relpath(resolved, base_dir)
+
+def resolve_corpus_files(candidates: List[List[str]]) -> Optional[List[str]]:
+    """
+    Pick the existing path for each requested document
+    
+    Every candidate must resolve inside the project directory (see resolve_document_path):
+    these paths are indexed, and so sent to Azure OpenAI, if they are not already.
+    
+    Args:
+        candidates: Potential paths per requested document, in order of preference
+    
+    Returns:
+        Resolved paths relative to the project directory, or None to search every indexed upload
+    
+    Raises:
+        HTTPException: 400 if a path points outside the project directory
+    """
+    if not candidates:
+        return None
+    
+    resolved = []
+    for paths in candidates:
+        for path in paths:
+            path = resolve_document_path(path)
+            if os.path.isfile(path):
+                resolved.append(path)
+                break
+        else:
+            print(f"Corpus document not found: {paths[0]}")
+    return resolved
+
+def resolve_target_file(request: ProcessRequest) -> str:
+    """Pick the document a ProcessRequest refers to (test.txt if no files are given)"""
+    # For now, we'll use the default test.txt file if no files are provided
+    target_file = "test.txt"
+    
+    if request.files:
+        print(f"Files specified: {[f.file_name for f in request.files]}")
+        
+        # Check if any of the specified files exist in uploads directory
+        for file_item in request.files:
+            potential_path = f"uploads/{file_item.file_name}.{file_item.file_type.lower()}"
+            if os.path.exists(potential_path):
+                target_file = potential_path
+                break
+    
+    # Check if target file exists
+    if not os.path.exists(target_file):
+        print(f"Target file not found: {target_file}")
+        raise HTTPException(status_code=404, detail=f"Target file '{target_file}' not found")
+    
+    return target_file
+
+def run_corpus_analysis(prompt: str, file_paths: Optional[List[str]], request_id: Optional[str] = None) -> Dict:
+    """Run a corpus-wide reasoning query and queue any requested documents that are not indexed"""
+    if 'corpus_rag_analysis' not in globals():
+        raise HTTPException(status_code=500, detail="Corpus analysis not available")
+    
+    corpus_result = corpus_rag_analysis(prompt, file_paths, request_id=request_id)
+    for file_path in corpus_result["unindexed_files"]:
+        if file_path.lower().endswith(INDEXABLE_EXTENSIONS):
+            get_document_index_manager().enqueue(file_path)
+    return corpus_result
+
 # Create necessary directories on startup
 def initialize_app():
     """Initialize application directories and check requirements"""
@@ -98,6 +200,10 @@ def initialize_app():
             else:
                 print("Warning: Some requirements are not met!")
         
+        # Start the script workers now so the first extraction query finds them warm
+        if 'get_sandbox_pool' in globals() and SANDBOX_POOL_ENABLED:
+            get_sandbox_pool()
+        
         return True
     except Exception as e:
         print(f"Error initializing app: {e}")
@@ -147,32 +253,44 @@ async def process_configuration(request: ProcessRequest):
         if request.method not in ["extraction", "reasoning"]:
             raise HTTPException(status_code=400, detail="Method must be 'extraction' or 'reasoning'")
         
-        # For now, we'll use the default test.txt file if no files are provided
-        target_file = "test.txt"
+        # Id of this query's flight recorder trace, returned so it can be looked up in /api/traces
+        request_id = new_request_id() if 'new_request_id' in globals() else None
         
-        if request.files:
-            print(f"Files specified: {[f.file_name for f in request.files]}")
+        # Corpus mode: one ranked retrieval pass across many documents
+        if request.corpus:
+            if request.method != "reasoning":
+                raise HTTPException(status_code=400, detail="Corpus mode is only supported for the 'reasoning' method")
             
-            # Check if any of the specified files exist in uploads directory
-            for file_item in request.files:
-                potential_path = f"uploads/{file_item.file_name}.{file_item.file_type.lower()}"
-                if os.path.exists(potential_path):
-                    target_file = potential_path
-                    break
-        
-        # Check if target file exists
-        if not os.path.exists(target_file):
-            print(f"Target file not found: {target_file}")
-            raise HTTPException(status_code=404, detail=f"Target file '{target_file}' not found")
+            file_paths = resolve_corpus_files([
+                [f.file_path, f"uploads/{f.file_name}.{f.file_type.lower()}", f"uploads/{f.file_name}"]
+                for f in request.files
+            ])
+            corpus_result = await asyncio.to_thread(run_corpus_analysis, request.user_prompt, file_paths, request_id)
+            
+            return {
+                "success": True,
+                "result": corpus_result["result"],
+                "method_used": request.method,
+                "user_prompt": request.user_prompt,
+                "model": request.model,
+                "corpus": True,
+                "sources": corpus_result["sources"],
+                "unindexed_files": corpus_result["unindexed_files"],
+                "files_processed": sorted(set(source["file_path"] for source in corpus_result["sources"])),
+                "request_id": request_id
+            }
         
+        target_file = resolve_target_file(request)
         print(f"Using file: {target_file}")
         
         # Process the configuration using the existing analysis engine
         try:
-            result = manual_query_processor(
+            result, cache_info = await cached_query_processor_async(
                 prompt=request.user_prompt,
                 method=request.method,
-                target_file=target_file
+                target_file=target_file,
+                bypass_cache=request.bypass_cache,
+                request_id=request_id
             )
             print("Analysis completed successfully")
         except Exception as analysis_error:
@@ -185,7 +303,9 @@ async def process_configuration(request: ProcessRequest):
             "method_used": request.method,
             "user_prompt": request.user_prompt,
             "model": request.model,
-            "files_processed": [f.file_name for f in request.files] if request.files else [target_file]
+            "files_processed": [f.file_name for f in request.files] if request.files else [target_file],
+            "cache": cache_info,
+            "request_id": request_id
         }
         
     except HTTPException:
@@ -195,6 +315,167 @@ async def process_configuration(request: ProcessRequest):
         print(f"[ERROR] Unexpected error in process_configuration: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing configuration: {str(e)}")
 
+@app.post("/api/process/stream")
+async def process_configuration_stream(request: ProcessRequest):
+    """
+    Stream a reasoning answer as Server-Sent Events
+    
+    Events: "start" (the request_id, for /api/traces and /api/process/stream/{request_id}/cancel),
+    "retrieval" (sources, sent before generation starts), "token" (answer text deltas), then
+    "done" (timing and token usage), "error" or "cancelled".
+    """
+    try:
+        if 'stream_rag_analysis' not in globals():
+            raise HTTPException(status_code=500, detail="Streaming analysis not available")
+        
+        if request.method != "reasoning":
+            raise HTTPException(status_code=400, detail="Streaming is only supported for the 'reasoning' method")
+        if request.corpus:
+            raise HTTPException(status_code=400, detail="Streaming is not supported in corpus mode")
+        
+        target_file = resolve_target_file(request)
+        request_id = new_request_id() if 'new_request_id' in globals() else None
+        print(f"Streaming analysis of {target_file}: {request.user_prompt[:50]}...")
+        
+        async def event_stream():
+            cancelled = asyncio.Event()
+            if request_id:
+                active_streams[request_id] = cancelled
+            stream = stream_rag_analysis(request.user_prompt, target_file, request.bypass_cache, request_id=request_id)
+            try:
+                # Closing the generator on cancel records the trace as cancelled
+                async with contextlib.aclosing(stream) as events:
+                    async for event, data in events:
+                        yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                        if cancelled.is_set():
+                            yield f"event: cancelled\ndata: {json.dumps({'request_id': request_id})}\n\n"
+                            break
+            finally:
+                active_streams.pop(request_id, None)
+        
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        if request_id:
+            headers["X-Request-ID"] = request_id
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            # Stop proxies from buffering the stream, which would defeat the point
+            headers=headers
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error starting stream: {str(e)}")
+
+@app.post("/api/process/stream/{request_id}/cancel")
+async def cancel_stream(request_id: str):
+    """Stop a streamed answer after its next event (the id is in the stream's first event)"""
+    cancelled = active_streams.get(request_id)
+    if cancelled is None:
+        raise HTTPException(status_code=404, detail=f"No active stream: {request_id}")
+    cancelled.set()
+    return {"success": True, "request_id": request_id, "cancel_requested": True}
+
+# Background Job Endpoints
+@app.post("/api/jobs")
+async def create_job(request: ProcessRequest):
+    """Queue an analysis and return its job id immediately"""
+    try:
+        if 'get_job_manager' not in globals():
+            raise HTTPException(status_code=500, detail="Job manager not available")
+        
+        if request.method not in ["extraction", "reasoning"]:
+            raise HTTPException(status_code=400, detail="Method must be 'extraction' or 'reasoning'")
+        
+        if request.corpus:
+            if request.method != "reasoning":
+                raise HTTPException(status_code=400, detail="Corpus mode is only supported for the 'reasoning' method")
+            
+            file_paths = resolve_corpus_files([
+                [f.file_path, f"uploads/{f.file_name}.{f.file_type.lower()}", f"uploads/{f.file_name}"]
+                for f in request.files
+            ])
+            
+            def runner(progress):
+                progress("Searching indexed documents")
+                return run_corpus_analysis(request.user_prompt, file_paths)
+            
+            job_request = {"user_prompt": request.user_prompt, "method": request.method, "corpus": True,
+                           "files": file_paths}
+        else:
+            target_file = resolve_target_file(request)
+            
+            def runner(progress):
+                result, cache_info = cached_query_processor(
+                    prompt=request.user_prompt,
+                    method=request.method,
+                    target_file=target_file,
+                    bypass_cache=request.bypass_cache,
+                    progress=progress
+                )
+                return {"result": result, "cache": cache_info}
+            
+            job_request = {"user_prompt": request.user_prompt, "method": request.method, "corpus": False,
+                           "files": [target_file]}
+        
+        job = get_job_manager().submit(job_request, runner)
+        return {
+            "success": True,
+            "job_id": job["job_id"],
+            "status": job["status"]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating job: {str(e)}")
+
+@app.get("/api/jobs")
+async def list_jobs(limit: int = 50):
+    """List recent jobs (without results)"""
+    try:
+        if 'get_job_manager' not in globals():
+            raise HTTPException(status_code=500, detail="Job manager not available")
+        
+        return {"success": True, "jobs": get_job_manager().list_jobs(limit)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error listing jobs: {str(e)}")
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get a job's status, progress and (once completed) result"""
+    try:
+        if 'get_job_manager' not in globals():
+            raise HTTPException(status_code=500, detail="Job manager not available")
+        
+        job = get_job_manager().get_job(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        
+        return {"success": True, "job": job}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting job: {str(e)}")
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    try:
+        if 'get_job_manager' not in globals():
+            raise HTTPException(status_code=500, detail="Job manager not available")
+        
+        job = get_job_manager().cancel(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        
+        return {"success": True, "job": job}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error cancelling job: {str(e)}")
+
 @app.get("/api/config")
 async def get_config():
     """Get current configuration"""
@@ -207,7 +488,7 @@ async def get_config():
 async def update_config(config: ConfigRequest):
     """Update application configuration"""
     try:
-        app_config.update(config.dict())
+        app_config.update(config.dict(exclude={"bypass_cache"}))
         return {"success": True, "message": "Configuration updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating configuration: {str(e)}")
@@ -219,7 +500,7 @@ async def process_config_and_continue(config: ConfigRequest):
         print("Processing configuration for editor transition...")
         
         # Update the global configuration
-        app_config.update(config.dict())
+        app_config.update(config.dict(exclude={"bypass_cache"}))
         
         # Build the JSON structure similar to test_config.json
         process_request = {
@@ -255,6 +536,26 @@ async def process_config_and_continue(config: ConfigRequest):
         
         print(f"Built process request: {process_request}")
         
+        # Corpus mode: search every selected source (or every indexed upload) at once
+        if config.corpus and process_request["method"] == "reasoning":
+            file_paths = resolve_corpus_files([
+                [source, f"uploads/{source}"] for source in config.document_sources
+            ])
+            corpus_result = await asyncio.to_thread(run_corpus_analysis, process_request["user_prompt"], file_paths)
+            
+            return {
+                "success": True,
+                "result": corpus_result["result"],
+                "method_used": process_request["method"],
+                "model_used": process_request["model"],
+                "user_prompt": process_request["user_prompt"],
+                "files_processed": sorted(set(source["file_path"] for source in corpus_result["sources"])),
+                "sources": corpus_result["sources"],
+                "unindexed_files": corpus_result["unindexed_files"],
+                "referenced_elements": config.referenced_elements if config.referenced_elements else [],
+                "message": "Configuration processed successfully, ready for editor"
+            }
+        
         # Process using the existing analysis engine
         target_file = "test.txt"  # Default file
         
@@ -291,16 +592,18 @@ async def process_config_and_continue(config: ConfigRequest):
         
         try:
             # Use the actual analysis engine
-            ai_result = manual_query_processor(
+            ai_result, cache_info = await cached_query_processor_async(
                 prompt=process_request["user_prompt"],
                 method=process_request["method"],
-                target_file=target_file
+                target_file=target_file,
+                bypass_cache=config.bypass_cache
             )
             print(f"Real AI analysis completed successfully")
             print(f"AI result content: {str(ai_result)[:200]}...")  # Debug: Show first 200 chars
             
         except Exception as e:
             print(f"Error with real AI analysis: {e}")
+            cache_info = None
             # Fallback to demo if real analysis fails
             elements_str = "kpi-table" if config.referenced_elements else "None specified"
             method_name = "Extraction" if process_request['method'] == 'extraction' else "Reasoning"
@@ -326,6 +629,7 @@ Please check the server logs for more details about the analysis error."""
             "user_prompt": process_request["user_prompt"],
             "files_processed": [target_file],
             "referenced_elements": config.referenced_elements if config.referenced_elements else [],
+            "cache": cache_info,
             "message": "Configuration processed successfully, ready for editor"
         }
         
@@ -347,16 +651,67 @@ async def upload_file(file: UploadFile = File(...)):
             content = await file.read()
             buffer.write(content)
         
+        # Chunk and embed in the background so queries only pay for the query embedding
+        index_status = None
+        if 'get_document_index_manager' in globals() and file_path.lower().endswith(INDEXABLE_EXTENSIONS):
+            index_status = get_document_index_manager().enqueue(file_path)
+        
         return {
             "success": True,
             "filename": file.filename,
             "file_path": file_path,
+            "index_status": index_status,
             "message": f"File '{file.filename}' uploaded successfully"
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
 
+# Document Index Endpoints
+@app.get("/api/index")
+async def list_index_status():
+    """Get index status for all known documents"""
+    try:
+        if 'get_document_index_manager' not in globals():
+            return {"success": True, "documents": []}
+        
+        return {"success": True, "documents": get_document_index_manager().list_status()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error listing index status: {str(e)}")
+
+@app.get("/api/index/{file_path:path}")
+async def get_index_status(file_path: str):
+    """Get index status for a single document"""
+    try:
+        if 'get_document_index_manager' not in globals():
+            raise HTTPException(status_code=500, detail="Document index not available")
+        
+        file_path = resolve_document_path(file_path)
+        return {"success": True, **get_document_index_manager().get_status(file_path)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting index status: {str(e)}")
+
+@app.post("/api/index/{file_path:path}")
+async def reindex_document(file_path: str):
+    """Queue a document for (re)indexing"""
+    try:
+        if 'get_document_index_manager' not in globals():
+            raise HTTPException(status_code=500, detail="Document index not available")
+        
+        file_path = resolve_document_path(file_path)
+        if not os.path.exists(file_path):
+            raise HTTPException(status_code=404, detail=f"File '{file_path}' not found")
+        if not file_path.lower().endswith(INDEXABLE_EXTENSIONS):
+            raise HTTPException(status_code=400, detail=f"Unsupported file type for indexing: {file_path}")
+        
+        return {"success": True, **get_document_index_manager().enqueue(file_path)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error queuing document for indexing: {str(e)}")
+
 @app.get("/api/files")
 async def list_files():
     """List available document files"""
@@ -399,6 +754,117 @@ async def health_check():
             "error": str(e)
         }
 
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Get cache hit/miss and in-flight coalescing statistics"""
+    try:
+        if 'get_embedding_cache' not in globals():
+            raise HTTPException(status_code=500, detail="Embedding cache not available")
+        
+        return {
+            "success": True,
+            "embeddings": get_embedding_cache().get_stats(),
+            "answers": get_answer_cache().get_stats() if 'get_answer_cache' in globals() else None,
+            "scripts": get_script_library().get_stats() if 'get_script_library' in globals() else None,
+            "coalescing": get_coalescing_stats() if 'get_coalescing_stats' in globals() else None
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting cache stats: {str(e)}")
+
+@app.get("/api/rate-limits")
+async def rate_limit_stats():
+    """Get Azure OpenAI rate limiter state per deployment"""
+    try:
+        if 'get_rate_limit_stats' not in globals():
+            raise HTTPException(status_code=500, detail="Rate limiter not available")
+        
+        return {
+            "success": True,
+            "deployments": await asyncio.to_thread(get_rate_limit_stats)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting rate limit stats: {str(e)}")
+
+@app.get("/api/sandbox/stats")
+async def sandbox_stats():
+    """Get the generated-script worker pool's run, timeout, crash and recycling counters"""
+    try:
+        if 'get_sandbox_pool' not in globals():
+            raise HTTPException(status_code=500, detail="Script sandbox not available")
+        
+        return {
+            "success": True,
+            "enabled": SANDBOX_POOL_ENABLED,
+            "pool": get_sandbox_pool().get_stats() if SANDBOX_POOL_ENABLED else None
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting sandbox stats: {str(e)}")
+
+@app.get("/api/metrics")
+async def prometheus_metrics():
+    """Per-stage latency, LLM request and cache metrics in the Prometheus text format"""
+    try:
+        if 'render_metrics' not in globals():
+            raise HTTPException(status_code=500, detail="Metrics not available")
+        if not METRICS_ENABLED:
+            raise HTTPException(status_code=404, detail="Metrics are disabled (set METRICS_ENABLED=true)")
+        
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error rendering metrics: {str(e)}")
+
+@app.get("/api/traces")
+async def list_traces(limit: int = 50, method: Optional[str] = None, status: Optional[str] = None,
+                      min_total_ms: Optional[float] = None, min_tokens: Optional[int] = None, sort: str = "recent"):
+    """
+    Query the flight recorder: per-query traces of LLM calls, tokens, retries and script runs
+    
+    sort is "recent", "total_ms" or "tokens" (the last two most expensive first).
+    """
+    try:
+        if 'get_flight_recorder' not in globals():
+            raise HTTPException(status_code=500, detail="Flight recorder not available")
+        if sort not in ("recent", "total_ms", "tokens"):
+            raise HTTPException(status_code=400, detail="sort must be 'recent', 'total_ms' or 'tokens'")
+        
+        recorder = get_flight_recorder()
+        traces = await asyncio.to_thread(recorder.query, max(1, min(limit, 1000)), method, status,
+                                         min_total_ms, min_tokens, sort)
+        return {
+            "success": True,
+            "traces": traces,
+            "count": len(traces),
+            "recorder": recorder.get_stats()
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading traces: {str(e)}")
+
+@app.get("/api/traces/{request_id}")
+async def get_trace(request_id: str):
+    """Get the flight recorder trace of one query"""
+    try:
+        if 'get_flight_recorder' not in globals():
+            raise HTTPException(status_code=500, detail="Flight recorder not available")
+        
+        record = await asyncio.to_thread(get_flight_recorder().get, request_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail=f"Trace not found: {request_id}")
+        return {"success": True, "trace": record}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading trace: {str(e)}")
+
 # Chat Iteration Endpoints
 @app.post("/api/chat/iterate")
 async def chat_iterate(iteration_request: dict):
@@ -445,7 +911,7 @@ Method: {method}
         
         # Process using analysis engine
         print(f"[AI] Processing with {method} method...")
-        result = manual_query_processor(
+        result = await manual_query_processor_async(
             prompt=enhanced_prompt,
             method=method,
             target_file=target_file
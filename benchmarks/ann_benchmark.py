@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+ANN Benchmark
+Compares the IVF-flat ANN index with exhaustive VectorStore search on synthetic embeddings
+
+Usage:
+    python benchmarks/ann_benchmark.py
+    python benchmarks/ann_benchmark.py --sizes 10000,100000 --dim 1536 --nprobe 4,16,64
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import VectorStore, normalize_rows
+
+
+def synthetic_embeddings(count, dim, clusters=256, seed=0):
+    """Clustered unit vectors, which resemble real document embeddings better than pure noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, 100000):
+        end = min(count, start + 100000)
+        labels = rng.integers(0, clusters, size=end - start)
+        vectors[start:end] = centers[labels] + 0.6 * rng.standard_normal((end - start, dim)).astype(np.float32)
+    return normalize_rows(vectors)
+
+
+def time_queries(search, queries):
+    """Run search for every query; return per-query latencies in ms and the results"""
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search(query))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return np.array(latencies), results
+
+
+def recall_at_k(approximate, exact):
+    """Fraction of the exact top-k ids the approximate search also returned"""
+    hits = sum(len(np.intersect1d(a[0], e[0])) for a, e in zip(approximate, exact))
+    total = sum(len(e[0]) for e in exact)
+    return hits / total if total else 1.0
+
+
+def run(sizes, dim, n_probes, top_k, query_count):
+    rows = []
+    for size in sizes:
+        print(f"\n=== {size:,} chunks x {dim} dims ===")
+        vectors = synthetic_embeddings(size, dim)
+        queries = synthetic_embeddings(query_count, dim, seed=1)
+        store = VectorStore(vectors, normalized=True)
+
+        exact_ms, exact_results = time_queries(lambda q: store.search(q, top_k=top_k, exact=True), queries)
+        print(f"exhaustive      p50 {np.percentile(exact_ms, 50):8.2f} ms  p95 {np.percentile(exact_ms, 95):8.2f} ms")
+        rows.append({
+            "size": size, "dim": dim, "method": "exhaustive", "n_probe": None, "build_seconds": 0.0,
+            "p50_ms": float(np.percentile(exact_ms, 50)), "p95_ms": float(np.percentile(exact_ms, 95)),
+            f"recall@{top_k}": 1.0
+        })
+
+        started = time.perf_counter()
+        store.build_ann()
+        build_seconds = time.perf_counter() - started
+        print(f"ivf-flat build  {build_seconds:8.2f} s   ({store.ann.n_lists} lists)")
+
+        for n_probe in n_probes:
+            ann_ms, ann_results = time_queries(lambda q: store.search(q, top_k=top_k, n_probe=n_probe), queries)
+            recall = recall_at_k(ann_results, exact_results)
+            print(f"ivf nprobe={n_probe:<4} p50 {np.percentile(ann_ms, 50):8.2f} ms  p95 {np.percentile(ann_ms, 95):8.2f} ms  recall@{top_k} {recall:.3f}")
+            rows.append({
+                "size": size, "dim": dim, "method": "ivf-flat", "n_probe": n_probe, "build_seconds": build_seconds,
+                "p50_ms": float(np.percentile(ann_ms, 50)), "p95_ms": float(np.percentile(ann_ms, 95)),
+                f"recall@{top_k}": recall
+            })
+
+        del vectors, store
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ANN vs exhaustive retrieval")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated chunk counts")
+    parser.add_argument("--dim", type=int, default=256,
+                        help="Embedding dimensions (ada-002 is 1536; 1M x 1536 needs ~6 GB of RAM)")
+    parser.add_argument("--nprobe", default="8,32,128", help="Comma-separated n_probe values to try")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    rows = run(
+        sizes=[int(size) for size in args.sizes.split(",")],
+        dim=args.dim,
+        n_probes=[int(n) for n in args.nprobe.split(",")],
+        top_k=args.top_k,
+        query_count=args.queries
+    )
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
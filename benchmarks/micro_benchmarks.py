@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Micro-Benchmarks
+Times document chunking, chunk retrieval and element storage on synthetic data of growing size,
+and fails when results regress against a stored baseline
+
+Usage:
+    python benchmarks/micro_benchmarks.py                          # small scale, compare with baseline
+    python benchmarks/micro_benchmarks.py --scale large --json results.json
+    python benchmarks/micro_benchmarks.py --suites retrieval --update-baseline
+    python benchmarks/micro_benchmarks.py --threshold 0.5          # allow 50% slowdowns
+
+Scales (chunking text / retrieval chunks / saved elements):
+    small   1 MB            / 1k             / 100
+    medium  up to 10 MB     / up to 10k      / up to 1k
+    large   up to 100 MB    / up to 100k     / up to 10k
+    full    up to 1 GB      / up to 1M       / up to 100k
+
+Baselines are machine specific: regenerate with --update-baseline after changing hardware.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The Azure client is built at import time but never called here
+for _name, _value in {
+    "PING_FED_URL": "http://127.0.0.1:8100/as/token.oauth2", "KGW_CLIENT_ID": "benchmark",
+    "KGW_CLIENT_SECRET": "benchmark", "KGW_ENDPOINT": "http://127.0.0.1:8100",
+    "AOAI_API_VERSION": "2024-06-01", "CHAT_MODEL_DEPLOYMENT_NAME": "gpt-4o"
+}.items():
+    os.environ.setdefault(_name, _value)
+
+from analysis_engine import prepare_document_chunks, retrieve_relevant_chunks
+from ann_index import ANN_MIN_VECTORS
+from bm25_index import BM25Index
+from chunking import TOKENIZER_NAME
+from element_manager import ElementManager
+from vector_store import VectorStore
+
+from ann_benchmark import synthetic_embeddings
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+SCALES = {
+    "small": {"chunking_mb": [1], "retrieval_chunks": [1000], "elements": [100]},
+    "medium": {"chunking_mb": [1, 10], "retrieval_chunks": [1000, 10000], "elements": [100, 1000]},
+    "large": {"chunking_mb": [1, 10, 100], "retrieval_chunks": [1000, 10000, 100000], "elements": [100, 1000, 10000]},
+    "full": {"chunking_mb": [1, 10, 100, 1000], "retrieval_chunks": [1000, 10000, 100000, 1000000],
+             "elements": [100, 1000, 10000, 100000]}
+}
+
+WORDS = np.array((
+    "batch deviation capa review product quality material supplier specification analysis result "
+    "manufacturing process control trend stability complaint market release disposition investigation "
+    "root cause corrective preventive action change validation audit inspection sample test method "
+    "limit assay impurity content uniformity dissolution packaging label bottle pump spray dose "
+    "period previous current annual report summary conclusion recommendation table appendix section"
+).split())
+
+
+def synthetic_lines(rng, count, words_per_line=12):
+    """Lines of random vocabulary words with an item code, resembling the product review text"""
+    words = WORDS[rng.integers(0, len(WORDS), size=(count, words_per_line))]
+    codes = rng.integers(10**13, 10**14, size=count)
+    return [" ".join(row) + f" {code}" for row, code in zip(words, codes)]
+
+
+def write_corpus(path, size_mb, seed=0):
+    """Write a paged text file of about size_mb megabytes in the PDF extraction format"""
+    rng = np.random.default_rng(seed)
+    target = size_mb * 1024 * 1024
+    written = 0
+    page = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while written < target:
+            page += 1
+            lines = synthetic_lines(rng, 60)
+            # Paragraph breaks every 8 lines give the chunker natural split points
+            body = "\n\n".join("\n".join(lines[i:i + 8]) for i in range(0, len(lines), 8))
+            text = f"\n--- Page {page} ---\n{body}\n"
+            f.write(text)
+            written += len(text)
+
+
+def timed(function, repeat):
+    """Best and median wall time of function() over repeat runs, in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"best_ms": round(min(samples), 3), "median_ms": round(float(np.median(samples)), 3)}
+
+
+def bench_chunking(sizes_mb, workdir, repeat):
+    results = {}
+    for size_mb in sizes_mb:
+        path = os.path.join(workdir, f"corpus_{size_mb}mb.txt")
+        write_corpus(path, size_mb)
+        chunk_count = []
+        # One run for 100 MB and above: these take minutes
+        result = timed(lambda: chunk_count.append(len(prepare_document_chunks(path, debug=False))),
+                       repeat if size_mb < 100 else 1)
+        result["chunks"] = chunk_count[-1]
+        result["mb_per_s"] = round(size_mb / (result["best_ms"] / 1000), 2)
+        results[f"chunking/prepare_document_chunks/{size_mb}MB"] = result
+        print(f"prepare_document_chunks  {size_mb:>6} MB  best {result['best_ms']:>10.1f} ms  "
+              f"({result['chunks']} chunks, {result['mb_per_s']} MB/s)")
+        os.remove(path)
+    return results
+
+
+def bench_retrieval(sizes, dim, repeat, queries=20):
+    results = {}
+    rng = np.random.default_rng(1)
+    for size in sizes:
+        chunks = synthetic_lines(rng, size, words_per_line=40)
+        store = VectorStore(synthetic_embeddings(size, dim), normalized=True)
+        if len(store) >= ANN_MIN_VECTORS:
+            store.build_ann()  # As document_index does for large documents
+        bm25 = BM25Index.build(chunks)
+        query_vectors = synthetic_embeddings(queries, dim, seed=2)
+        query_texts = [" ".join(WORDS[rng.integers(0, len(WORDS), size=6)]) for _ in range(queries)]
+
+        def run_queries(hybrid):
+            for vector, text in zip(query_vectors, query_texts):
+                retrieve_relevant_chunks(vector, chunks, store, top_k=20, similarity_threshold=0.05, debug=False,
+                                         query_text=text if hybrid else None, bm25_index=bm25 if hybrid else None)
+
+        for mode, hybrid in (("dense", False), ("hybrid", True)):
+            result = timed(lambda: run_queries(hybrid), repeat)
+            result = {"best_ms": round(result["best_ms"] / queries, 3), "median_ms": round(result["median_ms"] / queries, 3)}
+            results[f"retrieval/retrieve_relevant_chunks/{mode}/{size}"] = result
+            print(f"retrieve_relevant_chunks {mode:<6} {size:>8} chunks  best {result['best_ms']:>8.2f} ms/query")
+        del chunks, store, bm25
+    return results
+
+
+def synthetic_element(index, rng):
+    output = " ".join(synthetic_lines(rng, 8))
+    return {
+        "element_id": f"element-{index:07d}",
+        "element_name": f"Benchmark element {index}",
+        "saved_version": 2,
+        "output": output,
+        "full_chat_history": ["Summarize the deviations", "Add the CAPA references", "Group by market"],
+        "context_used": output[:300],
+        "created_at": datetime(2024, 1, 1).isoformat(),
+        "saved_at": datetime(2024, 1, 1, 0, 0, index % 60).isoformat(),
+        "all_versions": [{"version": 1, "locked": True}, {"version": 2, "locked": True}]
+    }
+
+
+def bench_elements(sizes, workdir, repeat, lookups=200):
+    results = {}
+    rng = np.random.default_rng(3)
+    for size in sizes:
+        storage_dir = os.path.join(workdir, f"elements_{size}")
+        os.makedirs(storage_dir)
+        with open(os.path.join(storage_dir, "elements.json"), 'w', encoding='utf-8') as f:
+            json.dump({"elements": [synthetic_element(i, rng) for i in range(size)]}, f, indent=2)
+
+        manager = None
+
+        def load():
+            nonlocal manager
+            manager = ElementManager(storage_dir=storage_dir)
+
+        ids = [f"element-{random.Random(i).randrange(size):07d}" for i in range(lookups)]
+        update = synthetic_element(size // 2, rng)
+        added = iter(range(size, size + repeat))
+
+        measurements = {
+            "load": timed(load, repeat),
+            "save_update": timed(lambda: manager.save_element(dict(update)), repeat),
+            "save_new": timed(lambda: manager.save_element(synthetic_element(next(added), rng)), repeat),
+            "list": timed(manager.get_all_elements, repeat),
+            "get": timed(lambda: [manager.get_element(element_id) for element_id in ids], repeat)
+        }
+        measurements["get"] = {key: round(value / lookups, 4) for key, value in measurements["get"].items()}
+
+        for operation, result in measurements.items():
+            results[f"elements/{operation}/{size}"] = result
+        print(f"ElementManager {size:>7} elements  " + "  ".join(
+            f"{operation} {result['best_ms']:.2f} ms" for operation, result in measurements.items()))
+        shutil.rmtree(storage_dir)
+    return results
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """
+    Regressions: benchmarks whose best time grew by more than threshold (a fraction) over the
+    baseline, and by at least min_delta_ms, so timer noise on sub-millisecond results is ignored
+    """
+    regressions = []
+    print(f"\n{'benchmark':<55} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in sorted(results.items()):
+        previous = baseline.get(name)
+        if not previous or not previous.get("best_ms"):
+            print(f"{name:<55} {'-':>12} {result['best_ms']:>10.3f}ms {'new':>8}")
+            continue
+        change = result["best_ms"] / previous["best_ms"] - 1
+        regressed = change > threshold and result["best_ms"] - previous["best_ms"] >= min_delta_ms
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<55} {previous['best_ms']:>10.3f}ms {result['best_ms']:>10.3f}ms {change:>+7.0%}{flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunking, retrieval and element storage")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--suites", default="chunking,retrieval,elements", help="Comma-separated suites to run")
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimensions for retrieval (ada-002 is 1536)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per benchmark; the best run is compared")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before failing (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.25,
+                        help="Ignore slowdowns smaller than this many milliseconds")
+    parser.add_argument("--update-baseline", action="store_true", help="Merge these results into the baseline")
+    args = parser.parse_args()
+
+    scale = SCALES[args.scale]
+    suites = [suite.strip() for suite in args.suites.split(",")]
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    try:
+        if "chunking" in suites:
+            results.update(bench_chunking(scale["chunking_mb"], workdir, args.repeat))
+        if "retrieval" in suites:
+            results.update(bench_retrieval(scale["retrieval_chunks"], args.dim, args.repeat))
+        if "elements" in suites:
+            results.update(bench_elements(scale["elements"], workdir, args.repeat))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "tokenizer": TOKENIZER_NAME,
+            "dim": args.dim
+        },
+        "results": results
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        baseline.update(created_at=report["created_at"], environment=report["environment"])
+        baseline.setdefault("results", {}).update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline updated: {args.baseline}")
+        return
+
+    regressions = compare(results, baseline.get("results", {}), args.threshold, args.min_delta_ms)
+    if regressions:
+        print(f"\nFAILED: {len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+    print("\nNo regressions" if baseline else f"\nNo baseline at {args.baseline}; run with --update-baseline to create one")
+
+
+if __name__ == "__main__":
+    main()
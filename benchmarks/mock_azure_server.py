@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Mock Azure OpenAI Server
+Local stand-in for PingFed and Azure OpenAI (token, chat completions with streaming, embeddings)
+with configurable latency, 429 injection and error rates, for offline benchmarking and load tests
+
+Usage:
+    python benchmarks/mock_azure_server.py --port 8100
+    python benchmarks/mock_azure_server.py --chat-latency lognormal:800:0.5 --rate-429 0.05 --error-rate 0.01
+
+Point the application at it with:
+    PING_FED_URL=http://127.0.0.1:8100/as/token.oauth2
+    KGW_ENDPOINT=http://127.0.0.1:8100
+    KGW_CLIENT_ID=mock
+    KGW_CLIENT_SECRET=mock
+    AOAI_API_VERSION=2024-06-01
+    CHAT_MODEL_DEPLOYMENT_NAME=gpt-4o
+
+Latency specs are in milliseconds: "300" (fixed), "uniform:LOW:HIGH", "normal:MEAN:STDDEV"
+or "lognormal:MEDIAN:SIGMA". Scripted completions come from a JSON file holding a list of
+{"match": "<regex>", "content": "<completion>"} rules, tried in order against the request's
+messages; requests no rule matches get a canned completion.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import defaultdict, deque
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import estimate_tokens
+
+_WORDS = re.compile(r"\w+")
+_STREAM_PIECES = re.compile(r"\S+\s*|\s+")
+_TARGET_FILE = re.compile(r"analyzes the file '([^']+)'")
+
+# Canned script for the extraction method's script-generation prompt; {target_file} is filled in
+CANNED_SCRIPT = '''import sys
+
+try:
+    with open({target_file!r}, 'r', encoding='utf-8', errors='replace') as f:
+        lines = f.readlines()
+except FileNotFoundError:
+    print("File not found: {target_file}")
+    sys.exit(1)
+
+print("Mock analysis of {target_file}")
+print(f"- Lines: {{len(lines)}}")
+print(f"- Words: {{sum(len(line.split()) for line in lines)}}")
+print(f"- Non-empty lines: {{sum(1 for line in lines if line.strip())}}")
+'''
+
+
+def parse_latency(spec: str, rng: random.Random) -> Callable[[], float]:
+    """Turn a latency spec (milliseconds) into a function returning a delay in seconds"""
+    kind, _, params = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+    values = [float(value) for value in params.split(":")] if params else []
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0] / 1000
+    if kind == "uniform" and len(values) == 2:
+        return lambda: rng.uniform(values[0], values[1]) / 1000
+    if kind == "normal" and len(values) == 2:
+        return lambda: max(rng.gauss(values[0], values[1]), 0.0) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        return lambda: values[0] * rng.lognormvariate(0.0, values[1]) / 1000
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+def hashed_embedding(text: str, dim: int) -> List[float]:
+    """
+    Deterministic bag-of-words embedding (feature hashing of lower-cased words)
+
+    Texts that share words get similar vectors, so retrieval over mock embeddings still
+    ranks relevant chunks first, unlike random vectors.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in _WORDS.findall(text.lower()):
+        digest = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+        vector[digest % dim] += 1.0 if digest >> 63 else -1.0
+    norm = float(np.linalg.norm(vector))
+    if norm == 0.0:
+        seed = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=4).digest(), 'little')
+        vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+        norm = float(np.linalg.norm(vector))
+    return (vector / norm).tolist()
+
+
+class QuotaWindow:
+    """Sliding 60-second request and token counts for one deployment, like Azure's RPM/TPM quota"""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.events = deque()  # (timestamp, tokens)
+
+    def _expire(self, now: float) -> None:
+        while self.events and now - self.events[0][0] >= 60:
+            self.events.popleft()
+
+    def admit(self, tokens: int) -> Optional[float]:
+        """Record the request, or return seconds until it would fit the quota"""
+        now = time.time()
+        self._expire(now)
+        used_tokens = sum(t for _, t in self.events)
+        if (self.rpm and len(self.events) + 1 > self.rpm) or (self.tpm and used_tokens + tokens > self.tpm):
+            return 60 - (now - self.events[0][0]) if self.events else 1.0
+        self.events.append((now, tokens))
+        return None
+
+    def headers(self) -> Dict[str, str]:
+        self._expire(time.time())
+        headers = {}
+        if self.rpm:
+            headers["x-ratelimit-limit-requests"] = str(self.rpm)
+            headers["x-ratelimit-remaining-requests"] = str(max(self.rpm - len(self.events), 0))
+        if self.tpm:
+            headers["x-ratelimit-limit-tokens"] = str(self.tpm)
+            headers["x-ratelimit-remaining-tokens"] = str(max(self.tpm - sum(t for _, t in self.events), 0))
+        return headers
+
+
+def create_app(args) -> FastAPI:
+    """Build the mock server app from parsed command-line options"""
+    rng = random.Random(args.seed)
+    latency = {
+        "token": parse_latency(args.token_latency, rng),
+        "chat": parse_latency(args.chat_latency, rng),
+        "stream_token": parse_latency(args.stream_token_interval, rng),
+        "embeddings": parse_latency(args.embedding_latency, rng)
+    }
+    rules = []
+    if args.responses:
+        with open(args.responses, 'r', encoding='utf-8') as f:
+            rules = [(re.compile(rule["match"], re.IGNORECASE | re.DOTALL), rule["content"]) for rule in json.load(f)]
+
+    quotas: Dict[str, QuotaWindow] = defaultdict(lambda: QuotaWindow(args.rpm, args.tpm))
+    stats = defaultdict(int)
+    app = FastAPI(title="Mock Azure OpenAI")
+
+    def error(status: int, message: str, headers: Optional[Dict] = None) -> JSONResponse:
+        return JSONResponse({"error": {"code": str(status), "message": message}}, status_code=status, headers=headers)
+
+    def inject_fault(route: str, deployment: str, tokens: int):
+        """A 429 or 5xx response if this request is throttled or picked for a failure, else None"""
+        retry_after = quotas[deployment].admit(tokens) if (args.rpm or args.tpm) else None
+        if retry_after is None and rng.random() < args.rate_429:
+            retry_after = args.retry_after_ms / 1000
+        if retry_after is not None:
+            stats[f"{route}_429"] += 1
+            return error(429, "Requests to the deployment have exceeded the rate limit.", {
+                "retry-after-ms": str(int(retry_after * 1000)),
+                "retry-after": str(max(int(retry_after + 0.999), 1)),
+                **quotas[deployment].headers()
+            })
+        if rng.random() < args.error_rate:
+            stats[f"{route}_errors"] += 1
+            return error(500, "The server had an error while processing your request.")
+        return None
+
+    def authorized(request: Request) -> bool:
+        return args.skip_auth_check or request.headers.get("authorization", "").startswith("Bearer mock-")
+
+    def completion_for(messages: List[Dict]) -> str:
+        text = "\n".join(str(message.get("content") or "") for message in messages)
+        for pattern, content in rules:
+            if pattern.search(text):
+                return content
+        if "Python script generator" in text:
+            target = _TARGET_FILE.search(text)
+            return CANNED_SCRIPT.format(target_file=target.group(1) if target else "test.txt")
+        if '"DONE: [final answer summary]"' in text:
+            return "DONE: The mock analysis script ran and answered the query."
+        question = re.search(r"QUESTION:\s*(.+)", text)
+        subject = (question.group(1) if question else text.strip().splitlines()[-1] if text.strip() else "").strip()
+        return f"This is a mock answer to: {subject[:200]}"
+
+    @app.post("/token")
+    @app.post("/as/token.oauth2")
+    async def token():
+        stats["token_requests"] += 1
+        await asyncio.sleep(latency["token"]())
+        return {
+            "access_token": f"mock-{uuid.uuid4().hex}",
+            "token_type": "Bearer",
+            "expires_in": args.token_lifetime
+        }
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request):
+        if not authorized(request):
+            return error(401, "Access denied due to invalid subscription key or wrong API endpoint.")
+        body = await request.json()
+        messages = body.get("messages") or []
+        max_tokens = body.get("max_completion_tokens") or body.get("max_tokens") or 4000
+        prompt_tokens = sum(estimate_tokens(str(message.get("content") or "")) + 4 for message in messages)
+
+        stats["chat_requests"] += 1
+        fault = inject_fault("chat", deployment, prompt_tokens + max_tokens)
+        if fault is not None:
+            return fault
+
+        content = completion_for(messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": estimate_tokens(content),
+            "total_tokens": prompt_tokens + estimate_tokens(content)
+        }
+        response_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        headers = quotas[deployment].headers()
+
+        if not body.get("stream"):
+            pieces = _STREAM_PIECES.findall(content)
+            await asyncio.sleep(latency["chat"]() + sum(latency["stream_token"]() for _ in pieces))
+            return JSONResponse({
+                "id": response_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": deployment,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage
+            }, headers=headers)
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        async def events():
+            def event(choices, **extra):
+                chunk = {"id": response_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": deployment, "choices": choices, **extra}
+                return f"data: {json.dumps(chunk)}\n\n"
+
+            await asyncio.sleep(latency["chat"]())
+            yield event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+            for i, piece in enumerate(_STREAM_PIECES.findall(content)):
+                if i:
+                    await asyncio.sleep(latency["stream_token"]())
+                yield event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            yield event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if include_usage:
+                yield event([], usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+    @app.post("/openai/deployments/{deployment}/embeddings")
+    async def embeddings(deployment: str, request: Request):
+        if not authorized(request):
+            return error(401, "Access denied due to invalid subscription key or wrong API endpoint.")
+        body = await request.json()
+        inputs = body.get("input") or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        prompt_tokens = sum(estimate_tokens(text) for text in inputs)
+
+        stats["embedding_requests"] += 1
+        stats["embedding_inputs"] += len(inputs)
+        fault = inject_fault("embeddings", deployment, prompt_tokens)
+        if fault is not None:
+            return fault
+
+        await asyncio.sleep(latency["embeddings"]())
+        return JSONResponse({
+            "object": "list",
+            "model": deployment,
+            "data": [
+                {"object": "embedding", "index": i, "embedding": hashed_embedding(text, args.embedding_dim)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}
+        }, headers=quotas[deployment].headers())
+
+    @app.get("/stats")
+    async def get_stats():
+        """Request, 429 and error counts since startup"""
+        return dict(stats)
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        stats.clear()
+        return {"success": True}
+
+    return app
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Local stand-in for PingFed and Azure OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--token-latency", default="20", help="Token endpoint latency spec (ms)")
+    parser.add_argument("--chat-latency", default="300", help="Time to first token spec (ms)")
+    parser.add_argument("--stream-token-interval", default="15",
+                        help="Delay between completion tokens (ms); also added to non-streamed responses")
+    parser.add_argument("--embedding-latency", default="50", help="Embeddings latency spec (ms)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after-ms", type=int, default=1000, help="Retry-After sent with injected 429s")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--rpm", type=int, default=0, help="Enforce a requests-per-minute quota per deployment")
+    parser.add_argument("--tpm", type=int, default=0, help="Enforce a tokens-per-minute quota per deployment")
+    parser.add_argument("--token-lifetime", type=int, default=3600, help="expires_in of issued tokens (s)")
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    parser.add_argument("--responses", help="JSON file of scripted completions")
+    parser.add_argument("--skip-auth-check", action="store_true", help="Accept requests without a mock bearer token")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latency sampling and fault injection")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    print(f"Mock Azure OpenAI listening on http://{args.host}:{args.port}")
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
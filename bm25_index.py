@@ -0,0 +1,178 @@
+"""
+BM25 Index
+Compact inverted index with BM25 scoring and reciprocal rank fusion for hybrid retrieval
+"""
+
+import re
+import json
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+import numpy as np
+
+# Identifier-friendly tokens: keeps "qe-008854", "capa-001" and "10000000036908" whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+SUBTOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase tokens; compound identifiers also yield their parts so "008854" matches "QE-008854" """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(SUBTOKEN_PATTERN.findall(token))
+    return tokens
+
+
+class BM25Index:
+    """Inverted index of chunk postings stored as flat NumPy arrays"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.terms: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)     # postings of term t: offsets[t]:offsets[t+1]
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.term_freqs = np.zeros(0, dtype=np.uint16)
+        self.doc_lengths = np.zeros(0, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, texts: Iterable[str], **params) -> "BM25Index":
+        """Tokenize texts (one per chunk) and build their postings"""
+        builder = BM25Builder()
+        for text in texts:
+            builder.add(text)
+        return builder.build(**params)
+
+    @classmethod
+    def concat(cls, indexes: Sequence["BM25Index"], **params) -> "BM25Index":
+        """Merge indexes over consecutive chunk ranges without re-tokenizing any text"""
+        postings = defaultdict(list)
+        offset = 0
+        for index in indexes:
+            for term, term_id in index.terms.items():
+                start, end = index.offsets[term_id], index.offsets[term_id + 1]
+                postings[term].append((index.doc_ids[start:end] + offset, index.term_freqs[start:end]))
+            offset += len(index)
+
+        merged = cls(**params)
+        merged.doc_lengths = np.concatenate([index.doc_lengths for index in indexes]) if indexes else merged.doc_lengths
+        merged._set_postings({
+            term: (np.concatenate([ids for ids, _ in parts]), np.concatenate([freqs for _, freqs in parts]))
+            for term, parts in postings.items()
+        })
+        return merged
+
+    @classmethod
+    def _from_postings(cls, postings: Dict[str, List[Tuple[int, int]]], doc_lengths: np.ndarray, **params) -> "BM25Index":
+        index = cls(**params)
+        index.doc_lengths = doc_lengths
+        index._set_postings({
+            term: (np.array([doc_id for doc_id, _ in entries], dtype=np.int32),
+                   np.array([min(freq, 65535) for _, freq in entries], dtype=np.uint16))
+            for term, entries in postings.items()
+        })
+        return index
+
+    def _set_postings(self, postings: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> None:
+        terms = sorted(postings)
+        self.terms = {term: term_id for term_id, term in enumerate(terms)}
+        lengths = np.array([len(postings[term][0]) for term in terms], dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self.doc_ids = np.concatenate([postings[term][0] for term in terms]).astype(np.int32) if terms else np.zeros(0, dtype=np.int32)
+        self.term_freqs = np.concatenate([postings[term][1] for term in terms]).astype(np.uint16) if terms else np.zeros(0, dtype=np.uint16)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every chunk for the query"""
+        scores = np.zeros(len(self), dtype=np.float32)
+        if len(self) == 0:
+            return scores
+
+        avg_length = max(float(self.doc_lengths.mean()), 1.0)
+        length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / avg_length)
+
+        for term in set(tokenize(query)):
+            term_id = self.terms.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            ids = self.doc_ids[start:end]
+            freqs = self.term_freqs[start:end].astype(np.float32)
+            idf = np.log(1 + (len(self) - len(ids) + 0.5) / (len(ids) + 0.5))
+            # Each doc id appears once per term, so plain fancy-index addition is safe
+            scores[ids] += idf * freqs * (self.k1 + 1) / (freqs + length_norm[ids])
+        return scores
+
+    def search(self, query: str, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k chunks with a positive BM25 score, best first"""
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched], kind='stable')]
+        return matched, scores[matched]
+
+    def save(self, directory: Union[str, Path]) -> None:
+        """Persist the index as bm25.npz plus its vocabulary"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.savez(directory / "bm25.npz", offsets=self.offsets, doc_ids=self.doc_ids,
+                 term_freqs=self.term_freqs, doc_lengths=self.doc_lengths)
+        with open(directory / "bm25_terms.json", 'w', encoding='utf-8') as f:
+            json.dump({"k1": self.k1, "b": self.b, "terms": sorted(self.terms, key=self.terms.get)}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: Union[str, Path]) -> "BM25Index":
+        """Load an index saved with save()"""
+        directory = Path(directory)
+        with open(directory / "bm25_terms.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        index = cls(k1=meta["k1"], b=meta["b"])
+        index.terms = {term: term_id for term_id, term in enumerate(meta["terms"])}
+        with np.load(directory / "bm25.npz") as arrays:
+            index.offsets = arrays["offsets"]
+            index.doc_ids = arrays["doc_ids"]
+            index.term_freqs = arrays["term_freqs"]
+            index.doc_lengths = arrays["doc_lengths"]
+        return index
+
+
+class BM25Builder:
+    """Accumulates postings one chunk at a time, for ingest pipelines that stream chunks"""
+
+    def __init__(self):
+        self.postings = defaultdict(list)
+        self.doc_lengths: List[int] = []
+
+    def add(self, text: str) -> None:
+        doc_id = len(self.doc_lengths)
+        counts = Counter(tokenize(text))
+        self.doc_lengths.append(sum(counts.values()))
+        for term, freq in counts.items():
+            self.postings[term].append((doc_id, freq))
+
+    def build(self, **params) -> BM25Index:
+        return BM25Index._from_postings(self.postings, np.array(self.doc_lengths, dtype=np.int32), **params)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[np.ndarray], k: int = 60, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuse ranked id lists: score(d) = sum over rankings of 1 / (k + rank of d)
+
+    Returns:
+        (ids, fused scores) ordered by descending fused score
+    """
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[int(doc_id)] += 1.0 / (k + rank + 1)
+
+    ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    ids = np.array([doc_id for doc_id, _ in ordered], dtype=np.int64)
+    scores = np.array([score for _, score in ordered], dtype=np.float32)
+    return ids, scores
@@ -0,0 +1,150 @@
+"""
+Document Chunking
+Streaming, page- and paragraph-aware chunker with token-based sizing and overlap
+"""
+
+import re
+from typing import Callable, Dict, Iterator, List, Optional
+
+# "--- Page N ---" separators written by our PDF text extraction
+PAGE_MARKER = re.compile(r"^\s*--- Page (\d+) ---\s*$")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+    TOKENIZER_NAME = "cl100k_base"
+
+    def estimate_tokens(text: str) -> int:
+        """Count tokens with the GPT-4 / ada-002 tokenizer"""
+        return len(_encoding.encode(text, disallowed_special=()))
+except ImportError:
+    TOKENIZER_NAME = "approx-chars4"
+
+    def estimate_tokens(text: str) -> int:
+        """Approximate token count (about 4 characters per token for English text)"""
+        return (len(text) + 3) // 4
+
+
+def iter_line_events(filename: str, encoding: str = 'utf-8') -> Iterator[Dict]:
+    """Read a file line by line, tracking page numbers, paragraph breaks and byte offsets"""
+    page = None
+    offset = 0
+    with open(filename, 'rb') as f:
+        for raw in f:
+            start, offset = offset, offset + len(raw)
+            line = raw.decode(encoding, errors='replace').rstrip('\r\n')
+            if start == 0:
+                line = line.lstrip('\ufeff')
+
+            marker = PAGE_MARKER.match(line)
+            if marker:
+                page = int(marker.group(1))
+                yield {"kind": "page", "page": page}
+            elif not line.strip():
+                yield {"kind": "paragraph_break"}
+            else:
+                yield {"kind": "line", "text": line, "page": page, "byte_start": start, "byte_end": offset,
+                       "tokens": estimate_tokens(line)}
+
+
+def _split_long_line(unit: Dict, max_tokens: int) -> Iterator[Dict]:
+    """Split a single line that exceeds the budget at word boundaries"""
+    piece, piece_tokens = [], 0
+    for word in unit["text"].split():
+        word_tokens = estimate_tokens(word + " ")
+        if piece and piece_tokens + word_tokens > max_tokens:
+            yield dict(unit, text=" ".join(piece), tokens=piece_tokens)
+            piece, piece_tokens = [], 0
+        piece.append(word)
+        piece_tokens += word_tokens
+    if piece:
+        yield dict(unit, text=" ".join(piece), tokens=piece_tokens)
+
+
+def _make_chunk(units: List[Dict]) -> Dict:
+    return {
+        "text": "\n".join(unit["text"] for unit in units),
+        "page": units[0]["page"],
+        "byte_start": units[0]["byte_start"],
+        "byte_end": units[-1]["byte_end"],
+        "token_count": sum(unit["tokens"] for unit in units)
+    }
+
+
+def iter_document_chunks(filename: str, max_tokens: int = 400, overlap_tokens: int = 50,
+                         encoding: str = 'utf-8', line_filter: Optional[Callable[[Dict], bool]] = None) -> Iterator[Dict]:
+    """
+    Stream chunks from a text file without loading it into memory
+
+    Chunks never span a "--- Page N ---" marker, prefer to end at a blank-line paragraph
+    break, and otherwise end between lines, so table rows and lines stay whole. Only a
+    single line longer than max_tokens is split mid-line (at word boundaries).
+
+    Args:
+        filename: Text file to chunk
+        max_tokens: Token budget per chunk
+        overlap_tokens: Trailing lines of up to this many tokens are repeated at the start
+            of the next chunk on the same page
+        line_filter: Optional predicate over line events (text, page, byte_start, ...);
+            lines for which it returns False are dropped
+
+    Yields:
+        Dicts with text, page, byte_start, byte_end (offsets into the file) and token_count
+    """
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    current: List[Dict] = []
+    current_tokens = 0
+    paragraph_end = 0   # units in current up to the last paragraph break
+    fresh = 0           # units in current that are not overlap carried from the previous chunk
+
+    def overlap_tail(units: List[Dict]) -> List[Dict]:
+        tail, tokens = [], 0
+        for unit in reversed(units):
+            tokens += unit["tokens"]
+            if tokens > overlap_tokens:
+                break
+            tail.insert(0, unit)
+        return tail
+
+    for event in iter_line_events(filename, encoding):
+        if event["kind"] == "page":
+            if fresh:
+                yield _make_chunk(current)
+            current, current_tokens, paragraph_end, fresh = [], 0, 0, 0
+            continue
+
+        if event["kind"] == "paragraph_break":
+            paragraph_end = len(current)
+            continue
+
+        if line_filter is not None and not line_filter(event):
+            continue
+
+        units = [event] if event["tokens"] <= max_tokens else list(_split_long_line(event, max_tokens))
+        for unit in units:
+            while current_tokens + unit["tokens"] > max_tokens and fresh:
+                # Cut at the last paragraph break if that keeps the chunk at least half full
+                cut = len(current)
+                if paragraph_end > len(current) - fresh and sum(u["tokens"] for u in current[:paragraph_end]) >= max_tokens // 2:
+                    cut = paragraph_end
+                emitted, remainder = current[:cut], current[cut:]
+                yield _make_chunk(emitted)
+
+                tail = overlap_tail(emitted)
+                if sum(u["tokens"] for u in tail + remainder) + unit["tokens"] > max_tokens:
+                    tail = []
+                current = tail + remainder
+                current_tokens = sum(u["tokens"] for u in current)
+                fresh = len(remainder)
+                paragraph_end = 0
+
+            if current_tokens + unit["tokens"] > max_tokens:
+                # Only carried-over overlap is left and it does not fit with this line
+                current, current_tokens = [], 0
+
+            current.append(unit)
+            current_tokens += unit["tokens"]
+            fresh += 1
+
+    if fresh:
+        yield _make_chunk(current)
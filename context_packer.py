@@ -0,0 +1,148 @@
+"""
+Context Packer
+Fits retrieved chunks into a prompt token budget: MMR-diversified selection in relevance order,
+with adjacent chunks from the same page merged into one passage
+"""
+
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from chunking import estimate_tokens
+
+# Prompt tokens of retrieved context sent with each question
+CONTEXT_TOKEN_BUDGET = int(os.getenv('RAG_CONTEXT_TOKENS', '3000'))
+# MMR trade-off: 1.0 ranks purely by relevance, lower values favour coverage of different content
+MMR_LAMBDA = float(os.getenv('RAG_MMR_LAMBDA', '0.7'))
+# Chunks on the same page this close together (or overlapping) are merged into one passage
+MERGE_GAP_BYTES = 16
+
+
+def mmr_order(scores: List[float], vectors: Optional[np.ndarray], mmr_lambda: float = MMR_LAMBDA) -> List[int]:
+    """
+    Order candidates by maximal marginal relevance
+
+    Args:
+        scores: Retrieval scores, best first (cosine similarities or RRF scores)
+        vectors: L2-normalized candidate embeddings, one row per score; None keeps score order
+        mmr_lambda: Weight of relevance against similarity to the candidates already chosen
+
+    Returns:
+        Candidate positions in the order they should be considered
+    """
+    n = len(scores)
+    if vectors is None or n < 2 or mmr_lambda >= 1.0:
+        return list(range(n))
+
+    # Scores from different retrievers are on different scales; relevance is relative to the best
+    relevance = np.asarray(scores, dtype=np.float32)
+    best_score = float(relevance.max())
+    relevance = relevance / best_score if best_score > 0 else np.ones(n, dtype=np.float32)
+
+    similarity = vectors @ vectors.T
+    order = [0]
+    max_similarity = similarity[0].copy()
+    remaining = np.ones(n, dtype=bool)
+    remaining[0] = False
+    while remaining.any():
+        mmr = mmr_lambda * relevance - (1 - mmr_lambda) * max_similarity
+        mmr[~remaining] = -np.inf
+        best = int(np.argmax(mmr))
+        order.append(best)
+        remaining[best] = False
+        max_similarity = np.maximum(max_similarity, similarity[best])
+    return order
+
+
+def merge_texts(first: str, second: str) -> str:
+    """Join two consecutive chunks, dropping the lines the second repeats from the end of the first"""
+    first_lines = first.split("\n")
+    second_lines = second.split("\n")
+    for overlap in range(min(len(first_lines), len(second_lines)), 0, -1):
+        if first_lines[-overlap:] == second_lines[:overlap]:
+            return "\n".join(first_lines + second_lines[overlap:])
+    return first + "\n" + second
+
+
+def _is_adjacent(passage: Dict, record: Dict) -> bool:
+    if record.get("byte_start") is None or passage["byte_start"] is None:
+        return False
+    return (record.get("source") == passage["source"] and record.get("page") == passage["page"]
+            and record["byte_start"] <= passage["byte_end"] + MERGE_GAP_BYTES
+            and passage["byte_start"] <= record["byte_end"] + MERGE_GAP_BYTES)
+
+
+def _merged_text(passage: Dict, record: Dict) -> str:
+    if passage["byte_start"] <= record["byte_start"] and record["byte_end"] <= passage["byte_end"]:
+        return passage["text"]  # Already covered by the passage
+    if record["byte_start"] < passage["byte_start"]:
+        return merge_texts(record["text"], passage["text"])
+    return merge_texts(passage["text"], record["text"])
+
+
+def pack_context(candidates: List[Dict], budget_tokens: int = CONTEXT_TOKEN_BUDGET,
+                 vectors: Optional[np.ndarray] = None, mmr_lambda: float = MMR_LAMBDA) -> Dict:
+    """
+    Choose and merge retrieved chunks to fill a token budget
+
+    Candidates are considered in MMR order; each is added if its tokens still fit, merged
+    into a passage it overlaps or touches on the same page (costing only the new lines),
+    and otherwise skipped in favour of smaller ones further down. The best candidate is
+    always included, even if it alone exceeds the budget.
+
+    Args:
+        candidates: Retrieved chunk records, best first: dicts with text, chunk_id and score,
+            and optionally page, byte_start, byte_end, token_count and source (records without
+            byte offsets are never merged)
+        budget_tokens: Maximum estimated tokens of context
+        vectors: L2-normalized embeddings of the candidates for MMR; None keeps score order
+
+    Returns:
+        Dict with the passages (text, chunk_ids, page, source, score, token_count) in relevance
+        order, the total token_count and the chunk_ids left out
+    """
+    order = mmr_order([c.get("score", 0.0) for c in candidates], vectors, mmr_lambda)
+
+    passages: List[Dict] = []
+    used = 0
+    dropped = []
+    for position in order:
+        record = candidates[position]
+        tokens = record.get("token_count") or estimate_tokens(record["text"])
+
+        passage = next((p for p in passages if _is_adjacent(p, record)), None)
+        if passage is not None:
+            text = _merged_text(passage, record)
+            cost = estimate_tokens(text) - passage["token_count"]
+        else:
+            cost = tokens
+
+        if passages and used + cost > budget_tokens:
+            dropped.append(record.get("chunk_id"))
+            continue
+
+        used += cost
+        if passage is not None:
+            passage.update(
+                text=text,
+                token_count=passage["token_count"] + cost,
+                byte_start=min(passage["byte_start"], record["byte_start"]),
+                byte_end=max(passage["byte_end"], record["byte_end"])
+            )
+            passage["chunk_ids"] = sorted(passage["chunk_ids"] + [record["chunk_id"]])
+        else:
+            passages.append({
+                "text": record["text"],
+                "chunk_ids": [record.get("chunk_id")],
+                "page": record.get("page"),
+                "source": record.get("source"),
+                "score": record.get("score", 0.0),
+                "token_count": tokens,
+                "byte_start": record.get("byte_start"),
+                "byte_end": record.get("byte_end")
+            })
+
+    for passage in passages:
+        del passage["byte_start"], passage["byte_end"]
+    return {"passages": passages, "token_count": used, "dropped": dropped}
@@ -0,0 +1,172 @@
+"""
+Document Artifact
+Pre-parsed line / page table of a document in SQLite, built at ingest so generated extraction scripts
+can query lines and pages in milliseconds instead of re-reading and re-parsing the raw text
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from chunking import PAGE_MARKER
+
+ARTIFACT_FILE = "lines.db"
+# Bump when the tables change so older artifacts are rebuilt
+ARTIFACT_VERSION = 1
+INSERT_BATCH_SIZE = 5000
+
+# A page seen again after another page (out-of-order markers) has its new lines appended
+_UPSERT_PAGE = """
+    INSERT INTO pages VALUES (?, ?, ?, ?)
+    ON CONFLICT (page) DO UPDATE SET
+        last_line = excluded.last_line,
+        text = CASE WHEN excluded.text = '' THEN pages.text
+                    WHEN pages.text = '' THEN excluded.text
+                    ELSE pages.text || char(10) || excluded.text END
+"""
+
+# Described to GPT-4o in the script generator prompt
+ARTIFACT_SCHEMA = """
+    CREATE TABLE lines (
+        line_no INTEGER PRIMARY KEY,  -- 1-based line number in the text file
+        page INTEGER,                 -- page from the nearest preceding "--- Page N ---" marker (NULL before the first)
+        text TEXT NOT NULL,           -- the line without its newline ('' for blank lines)
+        is_marker INTEGER NOT NULL    -- 1 for the "--- Page N ---" marker lines themselves
+    );
+    CREATE TABLE pages (
+        page INTEGER PRIMARY KEY,
+        first_line INTEGER NOT NULL,  -- line_no range of the page, marker line included
+        last_line INTEGER NOT NULL,
+        text TEXT NOT NULL            -- the page's lines joined with newlines, marker excluded
+    );
+    CREATE INDEX idx_lines_page ON lines (page);
+"""
+FTS_SCHEMA = """
+    CREATE VIRTUAL TABLE lines_fts USING fts5(text, content='lines', content_rowid='line_no');
+    -- e.g. SELECT line_no, page, text FROM lines WHERE line_no IN
+    --      (SELECT rowid FROM lines_fts WHERE lines_fts MATCH '"batch number"')
+"""
+
+
+def _fts5_available(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(text)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def build_artifact(file_path: str, output_path: str, content_sha256: str, encoding: str = 'utf-8') -> Dict:
+    """
+    Parse a text document into a SQLite line / page table
+
+    The database is written to a temp file and swapped in, so scripts reading the previous
+    version never see a half-built one. Lines are written in batches and each page's text
+    as soon as the page ends, so memory stays flat however long the document is.
+
+    Returns:
+        Metadata: line and page counts and whether full-text search is available
+    """
+    tmp_path = f"{output_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(ARTIFACT_SCHEMA)
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+        page = None
+        current = None  # [first_line, last_line, lines] of the page being read
+        batch = []
+        line_count = 0
+
+        def flush_page():
+            if current is not None:
+                conn.execute(_UPSERT_PAGE, (page, current[0], current[1], "\n".join(current[2])))
+
+        with open(file_path, 'rb') as f:
+            for line_no, raw in enumerate(f, start=1):
+                text = raw.decode(encoding, errors='replace').rstrip('\r\n')
+                if line_no == 1:
+                    text = text.lstrip('\ufeff')
+
+                marker = PAGE_MARKER.match(text)
+                if marker:
+                    number = int(marker.group(1))
+                    # Repeated markers for one page extend it rather than restarting it
+                    if number != page:
+                        flush_page()
+                        page, current = number, [line_no, line_no, []]
+                elif current is not None:
+                    current[2].append(text)
+                if current is not None:
+                    current[1] = line_no
+
+                batch.append((line_no, page, text, 1 if marker else 0))
+                line_count = line_no
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    conn.executemany("INSERT INTO lines VALUES (?, ?, ?, ?)", batch)
+                    batch = []
+        if batch:
+            conn.executemany("INSERT INTO lines VALUES (?, ?, ?, ?)", batch)
+        flush_page()
+        page_count = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+        fts = _fts5_available(conn)
+        if fts:
+            conn.executescript(FTS_SCHEMA)
+            conn.execute("INSERT INTO lines_fts (lines_fts) VALUES ('rebuild')")
+
+        meta = {
+            "version": ARTIFACT_VERSION,
+            "content_sha256": content_sha256,
+            "lines": line_count,
+            "pages": page_count,
+            "fts": fts,
+            "built_at": datetime.now().isoformat()
+        }
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", ((key, str(value)) for key, value in meta.items()))
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, output_path)
+    return meta
+
+
+def read_artifact_meta(artifact_path: Path) -> Optional[Dict]:
+    """The artifact's metadata, or None if it is missing or unreadable"""
+    if not artifact_path.exists():
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{artifact_path}?mode=ro", uri=True)
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    return {
+        "version": int(meta.get("version", 0)),
+        "content_sha256": meta.get("content_sha256"),
+        "lines": int(meta.get("lines", 0)),
+        "pages": int(meta.get("pages", 0)),
+        "fts": meta.get("fts") == "True",
+        "built_at": meta.get("built_at")
+    }
+
+
+def artifact_prompt(artifact_name: str, fts: bool) -> str:
+    """Script generator instructions for a document's artifact, linked into the workspace as artifact_name"""
+    return f"""
+    A pre-parsed copy of the file is available as the SQLite database '{artifact_name}'. Prefer it over
+    reading the text file line by line: filter and aggregate in SQL, and only fall back to the text
+    file if the database cannot answer the query. Open it read-only:
+        conn = sqlite3.connect('file:{artifact_name}?mode=ro', uri=True)
+    Schema:
+    {ARTIFACT_SCHEMA}{FTS_SCHEMA if fts else ""}
+    """
@@ -0,0 +1,544 @@
+"""
+Document Index
+Ingest-time pipeline that chunks, embeds and persists a ready-to-query index per document
+"""
+
+import os
+import json
+import queue
+import shutil
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from vector_store import VECTOR_FORMAT, VectorStore, normalize_rows
+from ann_index import ANN_MIN_VECTORS, IVFFlatIndex
+from bm25_index import BM25Builder, BM25Index
+from ingest_filters import iter_clean_chunks
+from document_artifact import ARTIFACT_FILE, ARTIFACT_VERSION, build_artifact, read_artifact_meta
+
+INDEXABLE_EXTENSIONS = (".txt", ".md", ".csv", ".json")
+EMBEDDING_BATCH_SIZE = 256
+# Merged corpus indexes kept in memory, one per distinct document set; least recently used are dropped
+CORPUS_CACHE_SIZE = int(os.getenv('CORPUS_CACHE_SIZE', '4'))
+
+
+def file_sha256(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """Return the SHA-256 hex digest of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DocumentIndexManager:
+    """Builds document indexes on a background worker and serves them to the RAG path"""
+
+    def __init__(self, storage_dir: str = "indexes"):
+        self.storage_dir = Path(storage_dir)
+        self.storage_dir.mkdir(exist_ok=True)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._active: Dict[str, Dict] = {}   # file key -> in-flight status
+        self._loaded: Dict[str, Dict] = {}   # file key -> loaded index
+        self._hash_cache: Dict[str, tuple] = {}  # file key -> (mtime, size, sha256)
+        self._manifest_cache: Dict[Path, tuple] = {}  # manifest file -> (mtime_ns, manifest)
+        self._corpus_lock = threading.Lock()
+        self._corpora: "OrderedDict[object, CorpusIndex]" = OrderedDict()  # scope -> merged index, LRU order
+        self._artifact_lock = threading.Lock()
+
+    def _file_key(self, file_path: str) -> str:
+        """Normalize a file path so the same document always maps to one index"""
+        return os.path.relpath(os.path.abspath(file_path)).replace(os.sep, "/")
+
+    def _index_dir(self, file_key: str) -> Path:
+        """Directory holding the persisted index for a document"""
+        path_hash = hashlib.sha256(file_key.encode('utf-8')).hexdigest()[:16]
+        return self.storage_dir / f"{Path(file_key).name}-{path_hash}"
+
+    def content_hash(self, file_path: str) -> str:
+        """SHA-256 of a file, memoized on (mtime, size) so large documents are hashed once"""
+        file_key = self._file_key(file_path)
+        stat = os.stat(file_path)
+        cached = self._hash_cache.get(file_key)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+
+        sha = file_sha256(file_path)
+        self._hash_cache[file_key] = (stat.st_mtime, stat.st_size, sha)
+        return sha
+
+    def _read_manifest(self, file_key: str) -> Optional[Dict]:
+        return self._read_manifest_file(self._index_dir(file_key) / "manifest.json")
+
+    def _read_manifest_file(self, manifest_file: Path) -> Optional[Dict]:
+        """Read a manifest, re-parsing it only when the file has changed"""
+        try:
+            mtime = manifest_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        cached = self._manifest_cache.get(manifest_file)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            self._manifest_cache[manifest_file] = (mtime, manifest)
+            return manifest
+        except Exception as e:
+            print(f"Error reading index manifest {manifest_file}: {e}")
+            return None
+
+    def _write_manifest(self, file_key: str, manifest: Dict) -> None:
+        index_dir = self._index_dir(file_key)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = index_dir / "manifest.json.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_file, index_dir / "manifest.json")
+
+    def _set_status(self, file_key: str, status: str, **extra) -> Dict:
+        with self._lock:
+            return self._set_status_locked(file_key, status, **extra)
+
+    def _set_status_locked(self, file_key: str, status: str, **extra) -> Dict:
+        entry = self._active.setdefault(file_key, {"file_path": file_key})
+        entry.update(extra)
+        entry["status"] = status
+        entry["updated_at"] = datetime.now().isoformat()
+        return dict(entry)
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._worker_loop, name="document-indexer", daemon=True)
+                self._worker.start()
+
+    def _worker_loop(self) -> None:
+        while True:
+            file_key = self._queue.get()
+            try:
+                self.build_index(file_key)
+            except Exception as e:
+                print(f"Error indexing {file_key}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def enqueue(self, file_path: str) -> Dict:
+        """Queue a document for background indexing and return its status"""
+        file_key = self._file_key(file_path)
+        # Checked and claimed under one lock, so concurrent requests queue a document once
+        with self._lock:
+            current = self._active.get(file_key)
+            if current and current["status"] in ("queued", "indexing"):
+                return dict(current)
+            status = self._set_status_locked(file_key, "queued", error=None)
+
+        self._queue.put(file_key)
+        self._ensure_worker()
+        print(f"Queued {file_key} for indexing")
+        return status
+
+    def build_index(self, file_path: str) -> Dict:
+        """
+        Chunk, embed and persist the index for a document (runs on the worker thread)
+
+        Every file is written to a staging directory and moved into place only once the whole
+        build has succeeded. If a rebuild fails, the previous ready index keeps serving and its
+        manifest records the failure under last_failure.
+        """
+        # Imported lazily: analysis_engine depends on this module for the query path
+        from analysis_engine import (
+            CHUNK_MAX_TOKENS,
+            CHUNK_OVERLAP_TOKENS,
+            EMBEDDING_MODEL,
+            chunk_params_key,
+            create_embeddings
+        )
+
+        file_key = self._file_key(file_path)
+        started = datetime.now()
+        self._set_status(file_key, "indexing")
+        index_dir = self._index_dir(file_key)
+        staging_dir = index_dir / "staging"
+
+        try:
+            content_sha = self.content_hash(file_key)
+            chunk_params = chunk_params_key(CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS)
+            if staging_dir.exists():
+                shutil.rmtree(staging_dir)
+            staging_dir.mkdir(parents=True)
+
+            # Stream chunks in batches: the file is never held in memory as a whole,
+            # only its vectors accumulate. Everything is written to the staging directory
+            # and swapped in at the end, so readers holding a memory map of the previous
+            # vectors never see a truncated file.
+            bm25_builder = BM25Builder()
+            vector_batches = []
+            chunk_count = 0
+            filter_stats = {}
+            chunks = iter_clean_chunks(file_key, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                                       stats=filter_stats)
+
+            with open(staging_dir / "chunks.json", 'w', encoding='utf-8') as chunks_file:
+                chunks_file.write("[")
+                while True:
+                    batch = list(itertools.islice(chunks, EMBEDDING_BATCH_SIZE))
+                    if not batch:
+                        break
+
+                    texts = [record["text"] for record in batch]
+                    embeddings = create_embeddings(texts, chunk_params=chunk_params)
+                    if len(embeddings) != len(texts):
+                        raise ValueError("Embedding request failed")
+                    vector_batches.append(normalize_rows(embeddings))
+
+                    for record in batch:
+                        record = {"chunk_id": chunk_count, "source": file_key, **record}
+                        chunks_file.write(("," if chunk_count else "") + json.dumps(record, ensure_ascii=False))
+                        bm25_builder.add(record["text"])
+                        chunk_count += 1
+
+                    self._set_status(file_key, "indexing", chunks_indexed=chunk_count)
+                chunks_file.write("]")
+
+            if not chunk_count:
+                raise ValueError("Document produced no chunks")
+
+            store = VectorStore(np.concatenate(vector_batches), normalized=True)
+            store.save(staging_dir / "vectors.npy")
+
+            # Large documents also get an ANN index; small ones are searched exhaustively
+            if len(store) >= ANN_MIN_VECTORS:
+                store.build_ann()
+                store.ann.save(staging_dir)
+
+            # Inverted index for exact identifiers (material numbers, CAPA / complaint IDs)
+            bm25_builder.build().save(staging_dir)
+
+            # Line / page table for generated extraction scripts
+            artifact = build_artifact(file_key, str(staging_dir / ARTIFACT_FILE), content_sha)
+
+            # The build succeeded: move it into place. The manifest is written last, so it
+            # only ever points at a complete set of files
+            if store.ann is None and (index_dir / "ann_config.json").exists():
+                (index_dir / "ann_config.json").unlink()
+            for staged_file in staging_dir.iterdir():
+                os.replace(staged_file, index_dir / staged_file.name)
+            staging_dir.rmdir()
+
+            manifest = {
+                "file_path": file_key,
+                "status": "ready",
+                "content_sha256": content_sha,
+                "embedding_model": EMBEDDING_MODEL,
+                "chunk_params": chunk_params,
+                "chunk_count": chunk_count,
+                "boilerplate_lines_removed": filter_stats["lines_removed"],
+                "duplicate_chunks_removed": filter_stats["duplicate_chunks"],
+                "dimensions": store.dimensions,
+                "vector_format": VECTOR_FORMAT,
+                "ann_lists": store.ann.n_lists if store.ann is not None else None,
+                "bm25": True,
+                "line_artifact": {key: artifact[key] for key in ("lines", "pages", "fts")},
+                "indexed_at": datetime.now().isoformat(),
+                "duration_seconds": round((datetime.now() - started).total_seconds(), 3),
+                "error": None
+            }
+            self._write_manifest(file_key, manifest)
+
+            with self._lock:
+                self._active.pop(file_key, None)
+                self._loaded.pop(file_key, None)
+
+            print(f"Indexed {file_key}: {chunk_count} chunks")
+            return manifest
+
+        except Exception as e:
+            print(f"Indexing failed for {file_key}: {e}")
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            failure = {"error": str(e), "failed_at": datetime.now().isoformat()}
+            previous = self._read_manifest(file_key)
+            if previous and previous.get("status") == "ready":
+                # One transient error (an embeddings outage, say) must not take away a usable index
+                manifest = dict(previous, last_failure=failure)
+            else:
+                manifest = {
+                    "file_path": file_key,
+                    "status": "failed",
+                    "error": str(e),
+                    "indexed_at": failure["failed_at"]
+                }
+            self._write_manifest(file_key, manifest)
+            with self._lock:
+                self._active.pop(file_key, None)
+            return manifest
+
+    def get_artifact(self, file_path: str, build: bool = True) -> Optional[Dict]:
+        """
+        The pre-parsed line / page SQLite artifact for a document's current contents
+
+        Built at ingest; with build set, documents that were never indexed (or changed since)
+        get one on demand, which needs no embedding calls.
+
+        Returns:
+            Dict with the artifact path, line and page counts and fts flag, or None
+        """
+        file_key = self._file_key(file_path)
+        if not os.path.exists(file_key):
+            return None
+        content_sha = self.content_hash(file_key)
+        artifact_path = self._index_dir(file_key) / ARTIFACT_FILE
+
+        with self._artifact_lock:
+            meta = read_artifact_meta(artifact_path)
+            if not meta or meta["content_sha256"] != content_sha or meta["version"] != ARTIFACT_VERSION:
+                if not build:
+                    return None
+                artifact_path.parent.mkdir(parents=True, exist_ok=True)
+                meta = build_artifact(file_key, str(artifact_path), content_sha)
+                print(f"Built line artifact for {file_key}: {meta['lines']} lines, {meta['pages']} pages")
+        return {"path": str(artifact_path), **meta}
+
+    def get_status(self, file_path: str) -> Dict:
+        """Get the index status for a document"""
+        file_key = self._file_key(file_path)
+        with self._lock:
+            if file_key in self._active:
+                return dict(self._active[file_key])
+
+        manifest = self._read_manifest(file_key)
+        if not manifest:
+            return {"file_path": file_key, "status": "not_indexed"}
+
+        status = dict(manifest)
+        if status["status"] in ("queued", "indexing"):
+            # Left behind by a process that exited mid-build
+            status["status"] = "failed"
+            status["error"] = "Indexing was interrupted"
+        elif status["status"] == "ready":
+            if not os.path.exists(file_key):
+                status["status"] = "missing"
+            elif self.content_hash(file_key) != status.get("content_sha256"):
+                status["status"] = "stale"
+                status["stale_reason"] = "content"
+            elif status.get("chunk_params") != self._current_chunk_params():
+                # CHUNK_MAX_TOKENS, the overlap or the ingest filters changed since it was built
+                status["status"] = "stale"
+                status["stale_reason"] = "chunk_params"
+        return status
+
+    def _current_chunk_params(self) -> str:
+        from analysis_engine import chunk_params_key
+        return chunk_params_key()
+
+    def _known_file_keys(self) -> List[str]:
+        file_keys = set(self._active.keys())
+        for manifest_file in self.storage_dir.glob("*/manifest.json"):
+            manifest = self._read_manifest_file(manifest_file)
+            if manifest:
+                file_keys.add(manifest["file_path"])
+        return sorted(file_keys)
+
+    def list_status(self) -> List[Dict]:
+        """Get the index status for every known document"""
+        return [self.get_status(file_key) for file_key in self._known_file_keys()]
+
+    def _is_loadable(self, status: Dict) -> bool:
+        """Whether a status describes an index the current query path can use"""
+        from analysis_engine import EMBEDDING_MODEL
+        return (
+            status["status"] == "ready"
+            and status.get("embedding_model") == EMBEDDING_MODEL
+            and status.get("vector_format") == VECTOR_FORMAT
+            and status.get("chunk_params") == self._current_chunk_params()
+        )
+
+    def load_index(self, file_path: str) -> Optional[Dict]:
+        """
+        Load a ready index for a document if one matches its current contents
+
+        An index built from an older version of the document, or with other chunking
+        parameters, is queued for rebuilding; the caller chunks the document itself meanwhile.
+
+        Returns:
+            Dict with chunks, chunk metadata, a memory-mapped VectorStore and manifest, or None
+        """
+        file_key = self._file_key(file_path)
+        status = self.get_status(file_key)
+        if status["status"] == "stale" and file_key.lower().endswith(INDEXABLE_EXTENSIONS):
+            self.enqueue(file_key)
+        if not self._is_loadable(status):
+            return None
+
+        with self._lock:
+            loaded = self._loaded.get(file_key)
+            if loaded and loaded["manifest"]["content_sha256"] == status["content_sha256"]:
+                return loaded
+
+        try:
+            index_dir = self._index_dir(file_key)
+            with open(index_dir / "chunks.json", 'r', encoding='utf-8') as f:
+                chunk_records = json.load(f)
+            store = VectorStore.load(index_dir / "vectors.npy", mmap=True)
+            if status.get("ann_lists"):
+                store.ann = IVFFlatIndex.load(index_dir)
+
+            chunks = [record["text"] for record in chunk_records]
+            loaded = {
+                "manifest": status,
+                "chunks": chunks,
+                "chunk_records": chunk_records,
+                "vector_store": store,
+                "bm25": self._load_bm25(index_dir, status, chunks)
+            }
+            with self._lock:
+                self._loaded[file_key] = loaded
+            return loaded
+        except Exception as e:
+            print(f"Error loading index for {file_key}: {e}")
+            return None
+
+    def _load_bm25(self, index_dir: Path, status: Dict, chunks: List[str]) -> BM25Index:
+        """Load the persisted BM25 index, or build one for indexes that predate it"""
+        if status.get("bm25"):
+            try:
+                return BM25Index.load(index_dir)
+            except Exception as e:
+                print(f"Error loading BM25 index from {index_dir}: {e}")
+        return BM25Index.build(chunks)
+
+    def load_corpus(self, file_paths: Optional[List[str]] = None, directory: str = "uploads"):
+        """
+        Get one merged index over many documents, built once and reused across requests
+
+        Args:
+            file_paths: Documents to include; defaults to every indexed file under directory
+
+        Returns:
+            (CorpusIndex, list of requested files that have no usable index yet)
+        """
+        if file_paths is None:
+            prefix = self._file_key(directory).rstrip("/") + "/"
+            candidates = [file_key for file_key in self._known_file_keys() if file_key.startswith(prefix)]
+            scope = ("directory", prefix)
+        else:
+            candidates = sorted(set(self._file_key(path) for path in file_paths))
+            scope = ("files", tuple(candidates))
+
+        documents, unindexed = {}, []
+        for file_key in candidates:
+            status = self.get_status(file_key)
+            if self._is_loadable(status):
+                documents[file_key] = status
+            else:
+                unindexed.append(file_key)
+
+        with self._corpus_lock:
+            corpus = self._corpora.get(scope)
+            wanted = {file_key: status["content_sha256"] for file_key, status in documents.items()}
+
+            if corpus is None or not corpus.can_extend_to(wanted):
+                corpus = CorpusIndex()
+
+            # Only documents new since the last request are read from disk
+            added = [file_key for file_key in sorted(wanted) if file_key not in corpus.documents]
+            entries = [self._read_corpus_entry(file_key, documents[file_key]) for file_key in added]
+            entries = [entry for entry in entries if entry is not None]
+            if entries:
+                # Requests may still be searching the cached index: extend a copy and swap it in
+                corpus = corpus.extended(entries)
+                print(f"Corpus index: added {len(entries)} documents ({len(corpus.chunk_records)} chunks total)")
+
+            self._corpora[scope] = corpus
+            self._corpora.move_to_end(scope)
+            while len(self._corpora) > max(CORPUS_CACHE_SIZE, 1):
+                self._corpora.popitem(last=False)
+            return corpus, unindexed
+
+    def _read_corpus_entry(self, file_key: str, status: Dict) -> Optional[tuple]:
+        index_dir = self._index_dir(file_key)
+        try:
+            with open(index_dir / "chunks.json", 'r', encoding='utf-8') as f:
+                chunk_records = json.load(f)
+            # Read fully rather than memory-map: a corpus can span thousands of files
+            vectors = VectorStore.load(index_dir / "vectors.npy", mmap=False).vectors
+            bm25 = self._load_bm25(index_dir, status, [record["text"] for record in chunk_records])
+            return file_key, status["content_sha256"], chunk_records, vectors, bm25
+        except Exception as e:
+            print(f"Error adding {file_key} to corpus index: {e}")
+            return None
+
+
+class CorpusIndex:
+    """
+    Every chunk of a set of documents in one vector store, with per-chunk source attribution
+
+    An index is never changed once it has been handed out: adding documents builds a new one,
+    so concurrent searches always see vectors, BM25 postings and chunk records that agree.
+    """
+
+    def __init__(self):
+        self.vector_store = VectorStore([])
+        self.bm25 = BM25Index()
+        self.chunk_records: List[Dict] = []
+        self.documents: Dict[str, str] = {}  # file key -> content sha256
+
+    @property
+    def chunks(self) -> List[str]:
+        return [record["text"] for record in self.chunk_records]
+
+    def can_extend_to(self, wanted: Dict[str, str]) -> bool:
+        """True if every document already merged is still wanted, unchanged"""
+        return all(wanted.get(file_key) == sha for file_key, sha in self.documents.items())
+
+    def extended(self, entries: List[tuple]) -> "CorpusIndex":
+        """
+        A new index with documents' chunks appended in one batch; this one is left unchanged
+
+        The vector matrix grows by concatenation and an existing ANN index is copied and
+        extended incrementally, so no document already merged is re-read or re-indexed.
+
+        Args:
+            entries: (file_key, content_sha256, chunk_records, vectors, bm25) per document
+        """
+        dimensions = self.vector_store.dimensions or entries[0][3].shape[1]
+        for entry in entries:
+            if entry[3].shape[1] != dimensions:
+                print(f"Skipping {entry[0]}: embedding dimensions do not match the corpus")
+        entries = [entry for entry in entries if entry[3].shape[1] == dimensions]
+        if not entries:
+            return self
+
+        corpus = CorpusIndex()
+        corpus.vector_store = self.vector_store.copy()
+        corpus.vector_store.add(np.concatenate([entry[3] for entry in entries]))
+        corpus.bm25 = BM25Index.concat([self.bm25] + [entry[4] for entry in entries])
+        corpus.chunk_records = self.chunk_records + [record for entry in entries for record in entry[2]]
+        corpus.documents = dict(self.documents)
+        for file_key, content_sha, _, _, _ in entries:
+            corpus.documents[file_key] = content_sha
+
+        # Build the ANN index once the corpus is large enough to benefit from one
+        if corpus.vector_store.ann is None and len(corpus.vector_store) >= ANN_MIN_VECTORS:
+            print(f"Building ANN index over {len(corpus.vector_store)} corpus chunks...")
+            corpus.vector_store.build_ann()
+        return corpus
+
+
+# Global instance
+document_index_manager = DocumentIndexManager(storage_dir=os.getenv('DOCUMENT_INDEX_DIR', 'indexes'))
+
+def get_document_index_manager() -> DocumentIndexManager:
+    """Get the global document index manager instance"""
+    return document_index_manager
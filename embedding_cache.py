@@ -0,0 +1,189 @@
+"""
+Embedding Cache
+Persistent, content-addressed cache for chunk embeddings with size-bounded LRU eviction
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# A full cache is evicted down to this fraction of max_bytes, so the next few puts do not
+# each trigger another eviction pass
+EVICT_TARGET_FRACTION = 0.9
+
+
+def text_sha256(text: str) -> str:
+    """Return the SHA-256 hex digest of a chunk of text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by (model, chunking parameters, SHA-256 of chunk text)"""
+
+    def __init__(self, storage_dir: str = "embedding_cache", max_bytes: int = 512 * 1024 * 1024, enabled: bool = True):
+        self.storage_dir = Path(storage_dir)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        # Bytes stored, kept up to date by put_many so a put never has to SUM the table
+        self._total_bytes = 0
+
+        if self.enabled:
+            self.storage_dir.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.storage_dir / "embeddings.db"), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (model, params, text_hash)
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings (last_access)")
+            self._conn.commit()
+            self._total_bytes = self._stored_bytes()
+
+    def get_many(self, model: str, params: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up embeddings for texts; missing entries are returned as None"""
+        if not self.enabled or not texts:
+            return [None] * len(texts)
+
+        hashes = [text_sha256(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            unique = list(set(hashes))
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND params = ? AND text_hash IN ({placeholders})",
+                    [model, params, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND params = ? AND text_hash = ?",
+                    [(now, model, params, text_hash) for text_hash in found]
+                )
+                self._conn.commit()
+
+            results = [found.get(text_hash) for text_hash in hashes]
+            hit_count = sum(1 for result in results if result is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+
+        return results
+
+    def put_many(self, model: str, params: str, texts: List[str], embeddings: List[List[float]]) -> None:
+        """Store embeddings for texts and evict least recently used entries over the size bound"""
+        if not self.enabled or not texts:
+            return
+
+        now = time.time()
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            blob = np.asarray(embedding, dtype=np.float32).tobytes()
+            rows.append((model, params, text_sha256(text), blob, len(blob), now))
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, params, text_hash, vector, size, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            # Replaced rows and other processes' writes make this an estimate; _evict re-reads the
+            # true size before deleting anything
+            self._total_bytes += sum(row[4] for row in rows)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache is back under its eviction target"""
+        total = self._stored_bytes()
+        if total <= self.max_bytes:
+            self._total_bytes = total
+            return
+
+        excess = total - int(self.max_bytes * EVICT_TARGET_FRACTION)
+        freed = 0
+        victims = []
+        for model, params, text_hash, size in self._conn.execute(
+            "SELECT model, params, text_hash, size FROM embeddings ORDER BY last_access ASC"
+        ):
+            victims.append((model, params, text_hash))
+            freed += size
+            if freed >= excess:
+                break
+
+        self._conn.executemany(
+            "DELETE FROM embeddings WHERE model = ? AND params = ? AND text_hash = ?",
+            victims
+        )
+        self.evictions += len(victims)
+        self._total_bytes = total - freed
+
+    def clear(self) -> None:
+        """Remove every cached embedding"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def get_stats(self) -> Dict:
+        """Get hit/miss counters and storage usage"""
+        entries, total_bytes = 0, 0
+        if self.enabled:
+            with self._lock:
+                entries, total_bytes = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings"
+                ).fetchone()
+
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_bytes": total_bytes,
+            "max_bytes": self.max_bytes
+        }
+
+
+# Global instance
+embedding_cache = EmbeddingCache(
+    storage_dir=os.getenv('EMBEDDING_CACHE_DIR', 'embedding_cache'),
+    max_bytes=int(float(os.getenv('EMBEDDING_CACHE_MAX_MB', '512')) * 1024 * 1024),
+    enabled=os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+)
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Get the global embedding cache instance"""
+    return embedding_cache
@@ -0,0 +1,303 @@
+"""
+Flight Recorder
+Per-query traces of every LLM and embedding call (latency, retries, tokens, deployment) and script run,
+written to a rotating JSONL log that /api/traces reads back to find the expensive queries
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+FLIGHT_RECORDER_ENABLED = os.getenv('FLIGHT_RECORDER_ENABLED', 'true').lower() == 'true'
+FLIGHT_RECORDER_FILE = os.getenv('FLIGHT_RECORDER_FILE', 'traces/flight_recorder.jsonl')
+# The log rolls over to .1, .2, ... at this size, keeping this many old files
+FLIGHT_RECORDER_MAX_BYTES = int(os.getenv('FLIGHT_RECORDER_MAX_BYTES', str(10 * 1024 * 1024)))
+FLIGHT_RECORDER_BACKUPS = int(os.getenv('FLIGHT_RECORDER_BACKUPS', '5'))
+# Prompts are stored truncated: enough to recognize the query, not the whole pasted document
+PROMPT_PREVIEW_CHARS = 300
+
+# The trace of the analysis running in this thread / task. Context is copied into asyncio.to_thread,
+# new tasks and coroutines handed to the HTTP pool's loop, so calls made there land in the same trace.
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("flight_recorder_trace", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def _usage_tokens(usage: Optional[Dict]) -> Dict:
+    """Prompt, completion and cached prompt tokens from an Azure OpenAI usage block"""
+    usage = usage or {}
+    return {
+        "prompt_tokens": usage.get("prompt_tokens") or 0,
+        "completion_tokens": usage.get("completion_tokens") or 0,
+        "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    }
+
+
+class Trace:
+    """Everything one analysis did, collected from whichever threads and loops did it"""
+
+    def __init__(self, method: str, prompt: str, target_file: Optional[str] = None, request_id: Optional[str] = None):
+        self.request_id = request_id or new_request_id()
+        self.method = method
+        self.prompt = prompt
+        self.target_file = target_file
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.fields: Dict = {}
+        self.llm_calls: List[Dict] = []
+        self.scripts: List[Dict] = []
+        # Set when the analysis reports a failure without raising (an "Error: ..." answer, say)
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def add_llm_call(self, call: Dict) -> None:
+        with self._lock:
+            self.llm_calls.append(dict(call, at_ms=self.elapsed_ms()))
+
+    def add_script_run(self, run: Dict) -> None:
+        with self._lock:
+            self.scripts.append(dict(run, at_ms=self.elapsed_ms()))
+
+    def to_record(self, status: str, error: Optional[str] = None) -> Dict:
+        with self._lock:
+            llm_calls = list(self.llm_calls)
+            scripts = list(self.scripts)
+        totals = {
+            "llm_calls": len(llm_calls),
+            "llm_ms": round(sum(call["latency_ms"] for call in llm_calls), 1),
+            "retries": sum(call.get("retries", 0) for call in llm_calls),
+            "prompt_tokens": sum(call.get("prompt_tokens", 0) for call in llm_calls),
+            "completion_tokens": sum(call.get("completion_tokens", 0) for call in llm_calls),
+            "cached_tokens": sum(call.get("cached_tokens", 0) for call in llm_calls),
+            "scripts": len(scripts),
+            "script_ms": round(sum(run["duration_ms"] for run in scripts), 1)
+        }
+        totals["total_tokens"] = totals["prompt_tokens"] + totals["completion_tokens"]
+        return {
+            "request_id": self.request_id,
+            "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+            "method": self.method,
+            "prompt": self.prompt[:PROMPT_PREVIEW_CHARS],
+            "target_file": self.target_file,
+            **self.fields,
+            "status": status,
+            "error": error,
+            "total_ms": self.elapsed_ms(),
+            "totals": totals,
+            "llm_calls": llm_calls,
+            "scripts": scripts
+        }
+
+
+class FlightRecorder:
+    """Append-only JSONL trace log with size-based rotation"""
+
+    def __init__(self, log_file: str = FLIGHT_RECORDER_FILE, max_bytes: int = FLIGHT_RECORDER_MAX_BYTES,
+                 backups: int = FLIGHT_RECORDER_BACKUPS, enabled: bool = FLIGHT_RECORDER_ENABLED):
+        self.log_file = Path(log_file)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.enabled = enabled
+        self.written = 0
+        self._lock = threading.Lock()
+
+    def _log_files(self) -> List[Path]:
+        """Current log first, then the rotated ones from newest to oldest"""
+        files = [self.log_file] + [self.log_file.with_name(f"{self.log_file.name}.{i}") for i in range(1, self.backups + 1)]
+        return [path for path in files if path.exists()]
+
+    def _rotate(self) -> None:
+        for i in range(self.backups, 0, -1):
+            source = self.log_file.with_name(f"{self.log_file.name}.{i - 1}") if i > 1 else self.log_file
+            if source.exists():
+                os.replace(source, self.log_file.with_name(f"{self.log_file.name}.{i}"))
+        if self.backups == 0:
+            self.log_file.unlink(missing_ok=True)
+
+    def write(self, record: Dict) -> None:
+        if not self.enabled:
+            return
+        line = json.dumps(record, default=str, ensure_ascii=False) + "\n"
+        try:
+            with self._lock:
+                self.log_file.parent.mkdir(parents=True, exist_ok=True)
+                if self.log_file.exists() and self.log_file.stat().st_size + len(line) > self.max_bytes:
+                    self._rotate()
+                with open(self.log_file, 'a', encoding='utf-8') as f:
+                    f.write(line)
+                self.written += 1
+        except OSError as e:
+            # Tracing must never fail the query it describes
+            print(f"Warning: could not write flight recorder trace: {e}")
+
+    def _records(self) -> Iterator[Dict]:
+        """Every stored record, newest first"""
+        for path in self._log_files():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()
+            except OSError:
+                continue
+            for line in reversed(lines):
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line cut short by a crash mid-write
+
+    def get(self, request_id: str) -> Optional[Dict]:
+        return next((record for record in self._records() if record.get("request_id") == request_id), None)
+
+    def query(self, limit: int = 50, method: Optional[str] = None, status: Optional[str] = None,
+              min_total_ms: Optional[float] = None, min_tokens: Optional[int] = None,
+              sort: str = "recent") -> List[Dict]:
+        """
+        Stored traces matching the filters
+
+        Args:
+            limit: Maximum number of records returned
+            method: Only this analysis method ("extraction", "reasoning", "corpus")
+            status: Only this outcome ("ok", "error", "cancelled")
+            min_total_ms: Only queries that took at least this long
+            min_tokens: Only queries that used at least this many prompt + completion tokens
+            sort: "recent", "total_ms" or "tokens" (the last two most expensive first)
+        """
+        matches = []
+        for record in self._records():
+            if method and record.get("method") != method:
+                continue
+            if status and record.get("status") != status:
+                continue
+            if min_total_ms is not None and record.get("total_ms", 0) < min_total_ms:
+                continue
+            if min_tokens is not None and record.get("totals", {}).get("total_tokens", 0) < min_tokens:
+                continue
+            matches.append(record)
+            if sort == "recent" and len(matches) >= limit:
+                break
+
+        if sort == "total_ms":
+            matches.sort(key=lambda record: record.get("total_ms", 0), reverse=True)
+        elif sort == "tokens":
+            matches.sort(key=lambda record: record.get("totals", {}).get("total_tokens", 0), reverse=True)
+        return matches[:limit]
+
+    def get_stats(self) -> Dict:
+        files = self._log_files()
+        return {
+            "enabled": self.enabled,
+            "log_file": str(self.log_file),
+            "files": len(files),
+            "bytes": sum(path.stat().st_size for path in files),
+            "written": self.written
+        }
+
+
+# Global flight recorder instance
+_flight_recorder = None
+
+def get_flight_recorder() -> FlightRecorder:
+    """Get the global flight recorder instance"""
+    global _flight_recorder
+    if _flight_recorder is None:
+        _flight_recorder = FlightRecorder()
+    return _flight_recorder
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace(method: str, prompt: str, target_file: Optional[str] = None, request_id: Optional[str] = None):
+    """
+    Record one analysis: everything called inside the block lands in the yielded Trace,
+    which is written to the log when the block exits
+
+    Nested blocks (a cached query running the manual one, say) join the outer trace.
+    """
+    active = _current_trace.get()
+    if active is not None:
+        yield active
+        return
+
+    current = Trace(method, prompt, target_file, request_id)
+    token = _current_trace.set(current)
+    status, error = "ok", None
+    try:
+        yield current
+    except (GeneratorExit, KeyboardInterrupt) as e:
+        status, error = "cancelled", type(e).__name__
+        raise
+    except BaseException as e:
+        # asyncio.CancelledError is a BaseException too: a client that went away mid-stream
+        status = "cancelled" if type(e).__name__ == "CancelledError" else "error"
+        error = str(e) or type(e).__name__
+        raise
+    finally:
+        if status == "ok" and current.error:
+            status, error = "error", current.error
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # An async generator closed from a different context than the one it started in
+            _current_trace.set(None)
+        get_flight_recorder().write(current.to_record(status, error))
+
+
+def annotate(**fields) -> None:
+    """Attach fields (document hash, cache hit, ...) to the current trace, if any"""
+    current = _current_trace.get()
+    if current is not None:
+        current.fields.update(fields)
+
+
+def mark_error(message: str) -> None:
+    """Record the current trace as failed even though no exception escaped it"""
+    current = _current_trace.get()
+    if current is not None:
+        current.error = str(message)[:500]
+
+
+def record_llm_call(kind: str, deployment: str, latency_ms: float, status: Optional[int] = 200,
+                    attempts: int = 1, usage: Optional[Dict] = None, **extra) -> None:
+    """
+    Add a chat or embeddings call to the current trace, if any
+
+    Args:
+        kind: "chat", "chat_stream" or "embeddings"
+        status: Final HTTP status; None if no response was received
+        attempts: HTTP requests sent, including retries
+        usage: The response's usage block
+    """
+    current = _current_trace.get()
+    if current is None:
+        return
+    current.add_llm_call({
+        "kind": kind,
+        "deployment": deployment,
+        "latency_ms": round(latency_ms, 1),
+        "status": status,
+        "retries": max(attempts - 1, 0),
+        **_usage_tokens(usage),
+        **extra
+    })
+
+
+def record_script_run(script: str, exit_code: Optional[int], duration_ms: float, **extra) -> None:
+    """Add a generated script execution to the current trace, if any"""
+    current = _current_trace.get()
+    if current is None:
+        return
+    current.add_script_run({"script": script, "exit_code": exit_code, "duration_ms": round(duration_ms, 1), **extra})
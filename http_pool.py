@@ -0,0 +1,201 @@
+"""
+HTTP Pool
+Shared asyncio HTTP client with keep-alive connection pooling for Azure OpenAI calls
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import threading
+import importlib.util
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+# HTTP/2 multiplexes concurrent requests over one connection; needs the optional h2 package
+HTTP2_ENABLED = os.getenv('AOAI_HTTP2', 'false').lower() == 'true'
+MAX_CONNECTIONS = int(os.getenv('AOAI_MAX_CONNECTIONS', '20'))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('AOAI_MAX_KEEPALIVE_CONNECTIONS', '10'))
+KEEPALIVE_EXPIRY_SECONDS = float(os.getenv('AOAI_KEEPALIVE_EXPIRY_SECONDS', '60'))
+
+
+class HTTPPool:
+    """
+    One httpx.AsyncClient running on a dedicated event loop thread
+
+    Every caller shares the same connection pool: async code awaits request() from any
+    event loop, sync code (CLI modes, worker threads) calls run(), and both hop onto the
+    pool's loop, so the pool is never bound to the loop of whichever caller came first.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+        self.http2 = HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+        if HTTP2_ENABLED and not self.http2:
+            print("Warning: AOAI_HTTP2 is enabled but the 'h2' package is not installed; using HTTP/1.1")
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The pool's event loop, started on first use"""
+        with self._lock:
+            if self._loop is None:
+                ready = threading.Event()
+
+                def run_loop():
+                    self._loop = asyncio.new_event_loop()
+                    asyncio.set_event_loop(self._loop)
+                    ready.set()
+                    self._loop.run_forever()
+
+                self._thread = threading.Thread(target=run_loop, name="http-pool", daemon=True)
+                self._thread.start()
+                ready.wait()
+            return self._loop
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Only ever called on the pool's loop thread, so no locking is needed
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS
+                )
+            )
+        return self._client
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self._get_client().request(method, url, **kwargs)
+
+    async def call(self, coro):
+        """Await a coroutine on the pool's loop from any event loop"""
+        loop = self.loop
+        if threading.current_thread() is self._thread:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request through the pool from any event loop"""
+        return await self.call(self._request(method, url, **kwargs))
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def stream_lines(self, method: str, url: str, on_response: Optional[Callable[[httpx.Response], None]] = None,
+                           **kwargs) -> AsyncIterator[str]:
+        """
+        Send a request through the pool and yield the response body line by line as it arrives
+
+        Lines are read on the pool's loop and handed to the caller's loop through a queue.
+        on_response, if given, is called with the response (status and headers) before its body
+        is read. Raises RuntimeError with the response body if the status is not 200.
+        """
+        caller_loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+
+        def put(item):
+            caller_loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        async def pump():
+            try:
+                async with self._get_client().stream(method, url, **kwargs) as response:
+                    if on_response is not None:
+                        on_response(response)
+                    if response.status_code != 200:
+                        body = (await response.aread()).decode('utf-8', errors='replace')
+                        put(RuntimeError(f"API Error: {response.status_code} - {body}"))
+                        return
+                    async for line in response.aiter_lines():
+                        put(line)
+            except Exception as e:
+                put(e)
+            finally:
+                put(finished)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Consumer stopped early (e.g. the browser disconnected): close the upstream stream
+            future.cancel()
+
+    def run(self, coro):
+        """Run a coroutine on the pool's loop and block until it finishes (for sync callers)"""
+        loop = self.loop
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("HTTPPool.run() would deadlock when called from the pool's own event loop")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def close(self) -> None:
+        """Close pooled connections (the loop thread keeps running for later requests)"""
+        if self._client is not None and self._loop is not None:
+            client, self._client = self._client, None
+            asyncio.run_coroutine_threadsafe(client.aclose(), self._loop).result()
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight calls onto one request
+
+    Calls are tracked on the HTTP pool's loop, so callers from any thread or event loop that
+    arrive while an identical call is still running await its result instead of sending a
+    second request. Nothing is kept once the call finishes; this is deduplication, not caching.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def key(*parts) -> str:
+        """Stable key for a call from its JSON-serializable arguments"""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Await factory() for the first caller with this key, and the same result for the rest"""
+        return await get_http_pool().call(self._do(key, factory))
+
+    async def _do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        # Runs on the pool loop, so the lookup and insert cannot race
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._inflight.pop(key, None) if self._inflight.get(key) is done else None)
+        else:
+            self.coalesced += 1
+        # A cancelled caller must not cancel the request the others are waiting on
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> Dict:
+        """Requests sent, calls that joined one already in flight, and calls running now"""
+        total = self.calls + self.coalesced
+        return {
+            "requests": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / total, 4) if total else 0.0,
+            "in_flight": len(self._inflight)
+        }
+
+
+# Global instance
+http_pool = HTTPPool()
+
+def get_http_pool() -> HTTPPool:
+    """Get the global HTTP pool instance"""
+    return http_pool
@@ -0,0 +1,180 @@
+"""
+Ingest Filters
+Strips page boilerplate and drops near-duplicate chunks before they are embedded
+"""
+
+import os
+import re
+import hashlib
+from collections import Counter, defaultdict, deque
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from chunking import iter_document_chunks, iter_line_events
+
+# Remove header/footer/watermark lines repeated across pages
+STRIP_BOILERPLATE = os.getenv('INGEST_STRIP_BOILERPLATE', 'true').lower() == 'true'
+# Drop chunks whose SimHash is within this many bits of an earlier chunk (-1 disables)
+DEDUP_MAX_DISTANCE = int(os.getenv('INGEST_DEDUP_MAX_DISTANCE', '3'))
+
+# A line counts as boilerplate when it appears on at least this share of pages
+BOILERPLATE_PAGE_FRACTION = 0.5
+BOILERPLATE_MIN_PAGES = 3
+# Headers and footers are looked for among the first / last lines of each page, and only
+# removed from there
+EDGE_LINES = 3
+
+SIMHASH_BITS = 64
+SHINGLE_WORDS = 3
+
+_PAGE_NUMBER = re.compile(r"\b(page\s+)\d+(\s*(?:of|/)\s*)\d+\b|\b(page\s+)\d+\b|^\d+$", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def filters_key() -> str:
+    """Describe the active filters, for manifests and chunk params"""
+    parts = []
+    if STRIP_BOILERPLATE:
+        # v2: exact header / footer text, stripped from page edges only
+        parts.append("bp2")
+    if DEDUP_MAX_DISTANCE >= 0:
+        parts.append(f"dd{DEDUP_MAX_DISTANCE}")
+    return "+".join(parts) or "none"
+
+
+def _mask_page_number(match: re.Match) -> str:
+    if match.group(1):
+        return f"{match.group(1)}#{match.group(2)}#"
+    if match.group(3):
+        return f"{match.group(3)}#"
+    return "#"
+
+
+def normalize_line(line: str) -> str:
+    """
+    Collapse whitespace and mask page numbers only, so "Page 2 of 123." matches "Page 7 of 123."
+
+    Every other number is kept: table rows that differ only in their values ("Batch 123456",
+    "Complaint ID: 2024-0042") must not collapse into one repeated shape.
+    """
+    return _PAGE_NUMBER.sub(_mask_page_number, _WHITESPACE.sub(" ", line.strip()))
+
+
+def detect_boilerplate(filename: str, encoding: str = 'utf-8') -> Dict:
+    """
+    Find header / footer lines that repeat across pages in one streaming pass over the file
+
+    Only the first and last EDGE_LINES lines of a page are candidates, and only those
+    positions are stripped, so text in the body of a page is never removed.
+
+    Returns:
+        Dict with "lines", the set of normalized lines (see normalize_line) found to repeat,
+        and "offsets", the byte_start of every edge line carrying one of them
+    """
+    page_counts = Counter()
+    pages = 0
+    # Edge lines of every page as (byte_start, normalized line): a few per page, not the document
+    edges: List[tuple] = []
+    head: List[tuple] = []
+    tail = deque(maxlen=EDGE_LINES)
+
+    def close_page():
+        page_edges = dict(head)
+        page_edges.update(tail)
+        for line in set(page_edges.values()):
+            page_counts[line] += 1
+        edges.extend(page_edges.items())
+
+    for event in iter_line_events(filename, encoding):
+        if event["kind"] == "page":
+            if pages:
+                close_page()
+            pages += 1
+            head = []
+            tail.clear()
+        elif event["kind"] == "line" and pages:
+            entry = (event["byte_start"], normalize_line(event["text"]))
+            if len(head) < EDGE_LINES:
+                head.append(entry)
+            else:
+                tail.append(entry)
+
+    if pages:
+        close_page()
+    if pages < BOILERPLATE_MIN_PAGES:
+        return {"lines": set(), "offsets": set()}
+
+    min_pages = max(BOILERPLATE_MIN_PAGES, int(pages * BOILERPLATE_PAGE_FRACTION))
+    lines = {line for line, count in page_counts.items() if count >= min_pages}
+    return {"lines": lines, "offsets": {offset for offset, line in edges if line in lines}}
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over the distinct word shingles of text"""
+    words = text.lower().split()
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.array([int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'little')
+                       for s in shingles], dtype=np.uint64)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    votes = bits.sum(axis=0) * 2 > len(hashes)
+    return int.from_bytes(np.packbits(votes, bitorder='little').tobytes(), 'little')
+
+
+class NearDuplicateFilter:
+    """Remembers SimHashes of kept chunks and flags chunks within max_distance bits of one"""
+
+    def __init__(self, max_distance: int = DEDUP_MAX_DISTANCE):
+        self.max_distance = max_distance
+        # Pigeonhole: fingerprints within max_distance bits agree exactly on at least one band
+        self.band_count = max_distance + 1
+        self.band_bits = SIMHASH_BITS // self.band_count
+        self.bands: List[Dict[int, List[int]]] = [defaultdict(list) for _ in range(self.band_count)]
+
+    def _band_keys(self, fingerprint: int) -> List[int]:
+        mask = (1 << self.band_bits) - 1
+        return [(fingerprint >> (band * self.band_bits)) & mask for band in range(self.band_count)]
+
+    def is_duplicate(self, text: str) -> bool:
+        """Check text against every chunk seen so far; remembers it if it is new"""
+        fingerprint = simhash(text)
+        keys = self._band_keys(fingerprint)
+        for band, key in enumerate(keys):
+            for other in self.bands[band].get(key, ()):
+                if bin(fingerprint ^ other).count("1") <= self.max_distance:
+                    return True
+
+        for band, key in enumerate(keys):
+            self.bands[band][key].append(fingerprint)
+        return False
+
+
+def iter_clean_chunks(filename: str, max_tokens: int = 400, overlap_tokens: int = 50,
+                      stats: Optional[Dict] = None) -> Iterator[Dict]:
+    """
+    iter_document_chunks with boilerplate lines stripped and near-duplicate chunks dropped
+
+    Args:
+        stats: Optional dict that receives boilerplate_lines, lines_removed and
+            duplicate_chunks counters
+    """
+    stats = stats if stats is not None else {}
+    stats.update(boilerplate_lines=0, lines_removed=0, duplicate_chunks=0)
+
+    boilerplate = detect_boilerplate(filename) if STRIP_BOILERPLATE else {"lines": set(), "offsets": set()}
+    stats["boilerplate_lines"] = len(boilerplate["lines"])
+    edge_offsets = boilerplate["offsets"]
+
+    def keep_line(line: Dict) -> bool:
+        if line["byte_start"] in edge_offsets:
+            stats["lines_removed"] += 1
+            return False
+        return True
+
+    dedup = NearDuplicateFilter() if DEDUP_MAX_DISTANCE >= 0 else None
+    for chunk in iter_document_chunks(filename, max_tokens=max_tokens, overlap_tokens=overlap_tokens,
+                                      line_filter=keep_line if edge_offsets else None):
+        if dedup is not None and dedup.is_duplicate(chunk["text"]):
+            stats["duplicate_chunks"] += 1
+            continue
+        yield chunk
@@ -0,0 +1,283 @@
+"""
+Job Manager
+Bounded background worker pool for long-running analyses, with persisted status and results
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import socket
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+JOB_STATUSES = ("queued", "running", "completed", "failed", "cancelled")
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+# Each process stamps the jobs it owns this often; with several uvicorn workers sharing the
+# job directory, a job whose owner stopped stamping it for JOB_STALE_SECONDS is marked failed
+JOB_HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', '10'))
+JOB_STALE_SECONDS = JOB_HEARTBEAT_SECONDS * 3
+HOSTNAME = socket.gethostname()
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        return True  # os.kill would terminate the process on Windows; rely on the heartbeat
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobCancelled(BaseException):
+    """
+    Raised inside a running job once cancellation is requested
+
+    Derives from BaseException (like asyncio.CancelledError) so the analysis loops'
+    broad `except Exception` retry handlers do not swallow it.
+    """
+
+
+class JobManager:
+    """
+    Runs analysis jobs on a thread pool and keeps one JSON record per job in storage_dir
+
+    Several processes (uvicorn workers) may share storage_dir. Each job records the process
+    that owns it and a heartbeat; a cancel that reaches another process leaves a
+    <job_id>.cancel marker which the owner picks up at the job's next progress checkpoint.
+    """
+
+    def __init__(self, storage_dir: str = "jobs", max_workers: int = 2, max_stored: int = 500):
+        self.storage_dir = Path(storage_dir)
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self.max_stored = max_stored
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict] = {}
+        self._futures: Dict[str, Future] = {}
+        self._cancel_requested = set()
+        self._mark_interrupted()
+        threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True).start()
+
+    def _job_file(self, job_id: str) -> Path:
+        return self.storage_dir / f"{job_id}.json"
+
+    def _cancel_file(self, job_id: str) -> Path:
+        return self.storage_dir / f"{job_id}.cancel"
+
+    def _save(self, job: Dict) -> None:
+        """Write the job record atomically so readers never see a partial file"""
+        job_file = self._job_file(job["job_id"])
+        tmp_file = job_file.with_suffix(".json.tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(job, f, indent=2, default=str)
+        os.replace(tmp_file, job_file)
+
+    def _load(self, job_id: str) -> Optional[Dict]:
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(self._job_file(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading job {job_id}: {e}")
+            return None
+
+    def _owner_alive(self, job: Dict) -> bool:
+        """Whether the process that owns a stored job is still running it"""
+        owner = job.get("owner") or {}
+        if not owner:
+            return False
+        if owner.get("host") == HOSTNAME:
+            # Our own PID on a job we do not hold belonged to a previous process
+            if owner.get("pid") == os.getpid() or not _pid_alive(owner.get("pid", 0)):
+                return False
+        return time.time() - job.get("heartbeat_at", 0) < JOB_STALE_SECONDS
+
+    def _mark_interrupted(self) -> None:
+        """Jobs left queued or running by a process that has exited can never finish"""
+        for job_file in self.storage_dir.glob("*.json"):
+            job_id = job_file.stem
+            with self._lock:
+                if job_id in self._jobs:
+                    continue
+            job = self._load(job_id)
+            if job and job.get("status") not in FINISHED_STATUSES and not self._owner_alive(job):
+                job.update(status="failed", error="Interrupted: the server process running it exited", finished_at=datetime.now().isoformat())
+                self._save(job)
+                self._cancel_file(job_id).unlink(missing_ok=True)
+
+    def _heartbeat_loop(self) -> None:
+        """Stamp our unfinished jobs, act on cancels left by other processes and sweep dead owners' jobs"""
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                with self._lock:
+                    active = [job_id for job_id, job in self._jobs.items() if job["status"] not in FINISHED_STATUSES]
+                for job_id in active:
+                    if self._cancel_file(job_id).exists():
+                        self.cancel(job_id)
+                    else:
+                        self._update(job_id)
+                self._mark_interrupted()
+            except Exception as e:
+                print(f"Job heartbeat error: {e}")
+
+    def _update(self, job_id: str, **fields) -> Dict:
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            job["updated_at"] = datetime.now().isoformat()
+            job["heartbeat_at"] = time.time()
+            self._save(job)
+            return dict(job)
+
+    def submit(self, request: Dict, runner: Callable[[Callable[[str], None]], Any]) -> Dict:
+        """
+        Queue a job
+
+        Args:
+            request: Description of the work, stored with the job (prompt, method, files, ...)
+            runner: Called on a worker thread with a progress(message) callback; its return
+                value becomes the job result. progress() raises JobCancelled once the job
+                has been cancelled, so long-running stages stop at their next checkpoint.
+
+        Returns:
+            The new job record
+        """
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "request": request,
+            "progress": [],
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "owner": {"pid": os.getpid(), "host": HOSTNAME},
+            "heartbeat_at": time.time()
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._save(job)
+            self._futures[job_id] = self._executor.submit(self._run, job_id, runner)
+        self._prune()
+        print(f"Queued job {job_id}")
+        return dict(job)
+
+    def _run(self, job_id: str, runner: Callable) -> None:
+        def progress(message: str) -> None:
+            if job_id in self._cancel_requested or self._cancel_file(job_id).exists():
+                raise JobCancelled()
+            with self._lock:
+                self._jobs[job_id]["progress"].append({"at": datetime.now().isoformat(), "message": message})
+            self._update(job_id)
+
+        try:
+            if job_id in self._cancel_requested:
+                raise JobCancelled()
+            self._update(job_id, status="running", started_at=datetime.now().isoformat())
+            result = runner(progress)
+            if job_id in self._cancel_requested:
+                raise JobCancelled()
+            self._update(job_id, status="completed", result=result, finished_at=datetime.now().isoformat())
+            print(f"Job {job_id} completed")
+        except JobCancelled:
+            self._update(job_id, status="cancelled", finished_at=datetime.now().isoformat())
+            print(f"Job {job_id} cancelled")
+        except Exception as e:
+            self._update(job_id, status="failed", error=str(e), finished_at=datetime.now().isoformat())
+            print(f"Job {job_id} failed: {e}")
+        finally:
+            with self._lock:
+                self._futures.pop(job_id, None)
+                self._cancel_requested.discard(job_id)
+            self._cancel_file(job_id).unlink(missing_ok=True)
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Get a job record, from memory or from a previous run's stored record"""
+        with self._lock:
+            if job_id in self._jobs:
+                job = self._jobs[job_id]
+                return dict(job, progress=list(job["progress"]))
+        return self._load(job_id)
+
+    def list_jobs(self, limit: int = 50) -> List[Dict]:
+        """Most recent jobs first, without their results"""
+        jobs = []
+        for job_file in sorted(self.storage_dir.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)[:limit]:
+            job = self.get_job(job_file.stem)
+            if job:
+                job.pop("result", None)
+                jobs.append(job)
+        return jobs
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """
+        Cancel a queued job immediately, or a running one at its next progress checkpoint
+
+        A job owned by another worker process is flagged with a cancel marker that the
+        owner acts on (within JOB_HEARTBEAT_SECONDS if it is still queued there).
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job["status"] not in FINISHED_STATUSES:
+                self._cancel_requested.add(job_id)
+                future = self._futures.get(job_id)
+
+        if job is None:
+            stored = self._load(job_id)
+            if stored is None or stored.get("status") in FINISHED_STATUSES:
+                return stored
+            self._cancel_file(job_id).touch()
+            return dict(stored, cancel_requested=True)
+        if job["status"] in FINISHED_STATUSES:
+            return dict(job)
+
+        if future is not None and future.cancel():
+            with self._lock:
+                self._futures.pop(job_id, None)
+                self._cancel_requested.discard(job_id)
+            self._cancel_file(job_id).unlink(missing_ok=True)
+            return self._update(job_id, status="cancelled", finished_at=datetime.now().isoformat())
+        return self._update(job_id, cancel_requested=True)
+
+    def _prune(self) -> None:
+        """Delete the oldest finished job records beyond max_stored"""
+        job_files = sorted(self.storage_dir.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        excess = len(job_files) - self.max_stored
+        for job_file in job_files:
+            if excess <= 0:
+                break
+            job = self._load(job_file.stem)
+            if job and job.get("status") in FINISHED_STATUSES:
+                job_file.unlink(missing_ok=True)
+                with self._lock:
+                    self._jobs.pop(job_file.stem, None)
+                excess -= 1
+
+
+# Global instance
+job_manager = JobManager(
+    storage_dir=os.getenv('JOB_STORAGE_DIR', 'jobs'),
+    max_workers=int(os.getenv('JOB_WORKERS', '2')),
+    max_stored=int(os.getenv('JOB_MAX_STORED', '500'))
+)
+
+def get_job_manager() -> JobManager:
+    """Get the global job manager instance"""
+    return job_manager
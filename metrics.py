@@ -0,0 +1,206 @@
+"""
+Metrics
+Dependency-free Prometheus counters and histograms for per-stage pipeline latency, LLM retries,
+tokens and cache hits, rendered in the text exposition format for /api/metrics
+"""
+
+import os
+import time
+import bisect
+import inspect
+import functools
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# Off by default: every recording call then returns after one flag check, and timed stages
+# are left undecorated
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+
+# Seconds; spans a cached lookup up to a slow multi-iteration script run
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic count per label combination"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    """Bucketed observations (usually durations in seconds) per label combination"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label combination: [per-bucket counts (last one is +Inf), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bucket] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted((key, (list(series[0]), series[1], series[2])) for key, series in self._values.items())
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+class MetricsRegistry:
+    """The set of metrics served from /api/metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "rag_stage_duration_seconds", "Time spent in each analysis pipeline stage", ["stage"]
+))
+STAGE_ERRORS = registry.register(Counter(
+    "rag_stage_errors_total", "Pipeline stages that raised an exception", ["stage"]
+))
+LLM_REQUESTS = registry.register(Counter(
+    "rag_llm_requests_total", "Azure OpenAI HTTP responses by endpoint and status code", ["endpoint", "status"]
+))
+LLM_RETRIES = registry.register(Counter(
+    "rag_llm_retries_total", "Azure OpenAI requests retried, by endpoint and reason", ["endpoint", "reason"]
+))
+LLM_TOKENS = registry.register(Counter(
+    "rag_llm_tokens_total", "Tokens reported by Azure OpenAI usage, by endpoint and kind", ["endpoint", "kind"]
+))
+RATE_LIMIT_WAIT_SECONDS = registry.register(Counter(
+    "rag_rate_limit_wait_seconds_total", "Time requests waited for the shared rate limiter (incl. 429 backoff)",
+    ["deployment"]
+))
+CACHE_LOOKUPS = registry.register(Counter(
+    "rag_cache_lookups_total", "Embedding, answer and script library lookups by result", ["cache", "result"]
+))
+SCRIPT_LIBRARY_SAVED_SECONDS = registry.register(Counter(
+    "rag_script_library_saved_seconds_total", "Script generation time skipped by running a stored script"
+))
+SPECULATIVE_CANDIDATES = registry.register(Counter(
+    "rag_speculative_scripts_total", "Candidate scripts in speculative rounds by outcome", ["outcome"]
+))
+
+
+def timed_stage(stage: str) -> Callable:
+    """
+    Decorator recording a function's duration (and exceptions) under the given stage name
+
+    With metrics disabled the function is returned undecorated, so it costs nothing.
+    Coroutine functions are timed until the awaited result is ready.
+    """
+    def decorator(function):
+        if not METRICS_ENABLED:
+            return function
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                except Exception:
+                    STAGE_ERRORS.inc(stage=stage)
+                    raise
+                finally:
+                    STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                STAGE_ERRORS.inc(stage=stage)
+                raise
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+        return wrapper
+    return decorator
+
+
+def record_usage(endpoint: str, usage: Optional[Dict]) -> None:
+    """Count the prompt and completion tokens from an API response's usage block"""
+    if not METRICS_ENABLED or not usage:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.inc(usage[kind], endpoint=endpoint, kind=kind[:-len("_tokens")])
+
+
+def render_metrics() -> str:
+    return registry.render()
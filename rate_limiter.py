@@ -0,0 +1,283 @@
+"""
+Rate Limiter
+Shared token-bucket limiter for Azure OpenAI requests-per-minute and tokens-per-minute quotas,
+fed by the service's rate-limit response headers
+"""
+
+import os
+import copy
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from chunking import estimate_tokens
+from metrics import RATE_LIMIT_WAIT_SECONDS
+
+# Quota per deployment; 0 learns it from the x-ratelimit-limit-* / remaining headers instead
+RPM_LIMIT = int(os.getenv('AOAI_RPM_LIMIT', '0'))
+TPM_LIMIT = int(os.getenv('AOAI_TPM_LIMIT', '0'))
+# Optional SQLite file through which worker processes share one budget per deployment
+RATE_LIMIT_FILE = os.getenv('AOAI_RATE_LIMIT_FILE')
+# Azure enforces quotas over short windows, so the bucket only holds this many seconds' worth
+BURST_SECONDS = float(os.getenv('AOAI_RATE_LIMIT_BURST_SECONDS', '10'))
+# Longest single pause honoured from a Retry-After header
+MAX_PAUSE_SECONDS = 60.0
+# Rough per-message overhead of the chat format, in tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_request_tokens(messages: List[Dict], max_tokens: int = 0) -> int:
+    """
+    Tokens a chat request counts against the TPM quota before it runs
+
+    Azure admits requests on prompt tokens plus max_tokens, so the completion budget
+    is included; the remaining-tokens header corrects the estimate afterwards.
+    """
+    prompt_tokens = sum(estimate_tokens(str(m.get("content") or "")) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+    return prompt_tokens + max_tokens
+
+
+def _header_float(headers, name: str) -> Optional[float]:
+    try:
+        value = headers.get(name)
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _capacity(limit: float) -> float:
+    return limit * BURST_SECONDS / 60
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """Server-requested wait from retry-after-ms or Retry-After (seconds), if present"""
+    retry_after_ms = _header_float(headers, "retry-after-ms")
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000
+    return _header_float(headers, "retry-after")
+
+
+class RateLimiter:
+    """
+    Token buckets for one deployment's requests-per-minute and tokens-per-minute quota
+
+    Every caller in the process shares the same buckets (and, with store_file set, every
+    process using that file does too), so concurrent users queue locally instead of each
+    hitting the service until it answers 429. Buckets refill continuously at limit/60 per
+    second and hold at most BURST_SECONDS of quota; the remaining-requests/tokens headers on
+    each response pull them down to what the service actually reports, and a 429 pauses
+    every caller until Retry-After has passed.
+    """
+
+    def __init__(self, key: str, rpm_limit: int = 0, tpm_limit: int = 0, store_file: Optional[str] = None):
+        """
+        Args:
+            key: Name of the quota, normally the deployment name
+            rpm_limit: Requests per minute; 0 to learn it from response headers
+            tpm_limit: Tokens per minute; 0 to learn it from response headers
+            store_file: Optional SQLite file shared by worker processes
+        """
+        self.key = key
+        self.store_file = store_file
+        self.configured_limits = {"requests": rpm_limit, "tokens": tpm_limit}
+        self.admitted = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._state = self._initial_state()
+        self._conn = None
+        # With a store file, transactions can wait up to the SQLite timeout on another process's
+        # lock; they run on this one thread, in call order, instead of on an event loop
+        self._store_executor = None
+
+        if store_file:
+            Path(store_file).parent.mkdir(parents=True, exist_ok=True)
+            # Autocommit mode so BEGIN IMMEDIATE below controls the transactions
+            self._conn = sqlite3.connect(store_file, timeout=5, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, state TEXT NOT NULL)")
+            self._store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"rate-limit-{key}")
+
+    def _initial_state(self) -> Dict:
+        return {
+            "limits": dict(self.configured_limits),
+            "levels": {name: _capacity(limit) for name, limit in self.configured_limits.items()},
+            "updated_at": time.time(),
+            "paused_until": 0.0
+        }
+
+    def _transact(self, update):
+        """Apply update(state, now) atomically, across processes when a store file is set"""
+        with self._lock:
+            if self._conn is None:
+                return update(self._state, time.time())
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT state FROM buckets WHERE key = ?", (self.key,)).fetchone()
+                state = json.loads(row[0]) if row else self._initial_state()
+                result = update(state, time.time())
+                self._conn.execute("INSERT OR REPLACE INTO buckets (key, state) VALUES (?, ?)", (self.key, json.dumps(state)))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._state = state
+            return result
+
+    async def _transact_async(self, update):
+        """_transact for coroutines: the shared store is only touched off the event loop"""
+        if self._store_executor is None:
+            return self._transact(update)
+        return await asyncio.get_running_loop().run_in_executor(self._store_executor, self._transact, update)
+
+    def _log_store_error(self, future) -> None:
+        if future.exception() is not None:
+            print(f"Rate limiter store update failed for {self.key}: {future.exception()}")
+
+    @staticmethod
+    def _refill(state: Dict, now: float) -> None:
+        elapsed = max(now - state["updated_at"], 0.0)
+        for name, limit in state["limits"].items():
+            if limit:
+                state["levels"][name] = min(_capacity(limit), state["levels"][name] + elapsed * limit / 60)
+        state["updated_at"] = now
+
+    def _try_take(self, state: Dict, now: float, tokens: int) -> float:
+        """Deduct one request and `tokens` tokens, or return how long to wait before trying again"""
+        self._refill(state, now)
+        if now < state["paused_until"]:
+            return state["paused_until"] - now
+
+        cost = {"requests": 1.0, "tokens": float(tokens)}
+        wait = 0.0
+        for name, limit in state["limits"].items():
+            if not limit:
+                continue
+            # A request larger than the whole bucket is admitted once the bucket is full
+            needed = min(cost[name], _capacity(limit))
+            if state["levels"][name] < needed:
+                wait = max(wait, (needed - state["levels"][name]) * 60 / limit)
+        if wait > 0:
+            return wait
+
+        for name, limit in state["limits"].items():
+            if limit:
+                state["levels"][name] -= cost[name]
+        return 0.0
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """
+        Wait until the quota admits a request of `tokens` estimated tokens
+
+        Returns:
+            Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            wait = await self._transact_async(lambda state, now: self._try_take(state, now, tokens))
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+            waited += wait
+
+        with self._lock:
+            self.admitted += 1
+            if waited:
+                self.throttled += 1
+                self.wait_seconds += waited
+        if waited:
+            RATE_LIMIT_WAIT_SECONDS.inc(waited, deployment=self.key)
+        return waited
+
+    def observe(self, response, attempt: int = 0) -> Optional[float]:
+        """
+        Update the buckets from a response's rate-limit headers
+
+        Args:
+            response: The HTTP response (anything with status_code and headers)
+            attempt: Retry attempt number, for the fallback backoff when a 429 has no Retry-After
+
+        Returns:
+            The pause in seconds imposed on every caller if the response was a 429, else None
+        """
+        headers = response.headers
+        remaining = {
+            "requests": _header_float(headers, "x-ratelimit-remaining-requests"),
+            "tokens": _header_float(headers, "x-ratelimit-remaining-tokens")
+        }
+        reported_limits = {
+            "requests": _header_float(headers, "x-ratelimit-limit-requests"),
+            "tokens": _header_float(headers, "x-ratelimit-limit-tokens")
+        }
+        pause = None
+        if response.status_code == 429:
+            pause = min(retry_after_seconds(headers) or (2 ** attempt) + 3, MAX_PAUSE_SECONDS)
+
+        def update(state, now):
+            self._refill(state, now)
+            for name in state["limits"]:
+                if not self.configured_limits[name]:
+                    # Learn the quota: the reported limit, else the highest remaining count seen
+                    learned = reported_limits[name] or max(remaining[name] or 0, state["limits"][name])
+                    if learned != state["limits"][name]:
+                        state["levels"][name] += _capacity(learned) - _capacity(state["limits"][name])
+                        state["limits"][name] = learned
+                if remaining[name] is not None:
+                    # Responses to concurrent requests arrive out of order: only ever lower the level
+                    state["levels"][name] = min(state["levels"][name], remaining[name])
+            if pause is not None:
+                state["paused_until"] = max(state["paused_until"], now + pause)
+
+        if self._store_executor is None:
+            self._transact(update)
+        else:
+            # Called on the HTTP pool's loop: queue the write behind earlier transactions and return.
+            # The pause is already known, and later acquire() calls run after this update
+            self._store_executor.submit(self._transact, update).add_done_callback(self._log_store_error)
+        if pause is not None:
+            with self._lock:
+                self.rate_limited += 1
+        return pause
+
+    def get_stats(self) -> Dict:
+        """Admission counters and current bucket levels"""
+        def snapshot(state, now):
+            self._refill(state, now)
+            return copy.deepcopy(state)
+
+        state = self._transact(snapshot)
+        return {
+            "admitted": self.admitted,
+            "throttled": self.throttled,
+            "wait_seconds": round(self.wait_seconds, 2),
+            "rate_limited_responses": self.rate_limited,
+            "limits": state["limits"],
+            "remaining": {name: round(level, 1) for name, level in state["levels"].items()},
+            "paused_for_seconds": round(max(state["paused_until"] - time.time(), 0.0), 1),
+            "shared_store": self.store_file
+        }
+
+
+# Global registry: Azure quotas are per deployment
+_rate_limiters: Dict[str, RateLimiter] = {}
+_registry_lock = threading.Lock()
+
+def get_rate_limiter(deployment: str) -> RateLimiter:
+    """Get the shared rate limiter for a deployment"""
+    with _registry_lock:
+        if deployment not in _rate_limiters:
+            _rate_limiters[deployment] = RateLimiter(deployment, RPM_LIMIT, TPM_LIMIT, RATE_LIMIT_FILE)
+        return _rate_limiters[deployment]
+
+def get_rate_limit_stats() -> Dict:
+    """Stats for every deployment called so far"""
+    with _registry_lock:
+        limiters = list(_rate_limiters.values())
+    return {limiter.key: limiter.get_stats() for limiter in limiters}
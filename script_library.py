@@ -0,0 +1,215 @@
+"""
+Script Library
+Successful extraction scripts keyed by normalized prompt and a structural fingerprint of the target
+file, so a repeated question against a new version of a document reuses the script without GPT-4o
+"""
+
+import os
+import re
+import csv
+import time
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Optional
+
+from answer_cache import normalize_prompt
+from embedding_cache import text_sha256
+
+# Bytes read from the start of the file to fingerprint its structure
+FINGERPRINT_SAMPLE_BYTES = 64 * 1024
+# Line shapes seen at least this often in the sample count as format markers (page headers, rulers)
+MARKER_MIN_COUNT = 3
+MAX_MARKERS = 10
+
+_DIGITS = re.compile(r"\d+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _line_shape(line: str) -> str:
+    """A line with numbers and whitespace runs collapsed: "--- Page 12 ---" -> "--- page 0 ---" """
+    return _WHITESPACE.sub(" ", _DIGITS.sub("0", line.strip().lower()))
+
+
+def structural_fingerprint(file_path: str) -> str:
+    """
+    Hash of a file's format rather than its content
+
+    Delimited files are identified by delimiter and header row. Text files by their first
+    line and the line shapes that repeat (page markers, separators, running headers), which
+    stay the same across versions of a report while the values in between change.
+    """
+    with open(file_path, 'rb') as f:
+        sample = f.read(FINGERPRINT_SAMPLE_BYTES).decode('utf-8', errors='replace')
+    lines = [line for line in sample.splitlines() if line.strip()]
+    if len(sample) == FINGERPRINT_SAMPLE_BYTES and len(lines) > 1:
+        lines = lines[:-1]  # Probably cut off mid-line
+
+    features = [Path(file_path).suffix.lower()]
+    try:
+        dialect = csv.Sniffer().sniff("\n".join(lines[:20]), delimiters=",;\t|")
+        header = next(csv.reader(lines[:1], dialect))
+        if len(header) > 1:
+            features += ["delimited", dialect.delimiter] + [_line_shape(cell) for cell in header]
+            return text_sha256("\x1f".join(features))[:32]
+    except (csv.Error, StopIteration):
+        pass
+
+    shapes = Counter(_line_shape(line) for line in lines)
+    markers = sorted(shape for shape, count in shapes.most_common() if count >= MARKER_MIN_COUNT)[:MAX_MARKERS]
+    features += ["text", _line_shape(lines[0]) if lines else ""] + markers
+    return text_sha256("\x1f".join(features))[:32]
+
+
+class ScriptLibrary:
+    """On-disk library of scripts that answered a prompt, with LRU eviction over a maximum entry count"""
+
+    def __init__(self, storage_dir: str = "script_library", max_entries: int = 500, enabled: bool = True):
+        self.storage_dir = Path(storage_dir)
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if self.enabled:
+            self.storage_dir.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.storage_dir / "scripts.db"), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS scripts (
+                    prompt_hash TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    target_file TEXT NOT NULL,
+                    script TEXT NOT NULL,
+                    generation_ms REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (prompt_hash, fingerprint)
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_scripts_last_access ON scripts (last_access)")
+            self._conn.commit()
+
+    def get(self, prompt: str, target_file: str) -> Optional[Dict]:
+        """
+        Look up a script for the same normalized prompt and file structure
+
+        Returns:
+            Dict with the script (rewritten to read target_file), the fingerprint and the
+            generation_ms it originally took, or None
+        """
+        if not self.enabled:
+            return None
+
+        fingerprint = structural_fingerprint(target_file)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT prompt_hash, target_file, script, generation_ms FROM scripts "
+                "WHERE prompt_hash = ? AND fingerprint = ?",
+                (text_sha256(normalize_prompt(prompt)), fingerprint)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE scripts SET last_access = ?, hits = hits + 1 WHERE prompt_hash = ? AND fingerprint = ?",
+                (time.time(), row[0], fingerprint)
+            )
+            self._conn.commit()
+            self.hits += 1
+
+        prompt_hash, original_name, script, generation_ms = row
+        file_name = Path(target_file).name
+        return {
+            # Scripts open their input by file name, relative to the analysis workspace
+            "script": script.replace(original_name, file_name) if original_name != file_name else script,
+            "prompt_hash": prompt_hash,
+            "fingerprint": fingerprint,
+            "generation_ms": generation_ms
+        }
+
+    def record_saving(self, seconds: float) -> None:
+        """Count the generation time a hit skipped"""
+        with self._lock:
+            self.saved_seconds += max(seconds, 0.0)
+
+    def invalidate(self, entry: Dict) -> None:
+        """Drop a script that failed on a hit, so the next run regenerates it"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM scripts WHERE prompt_hash = ? AND fingerprint = ?",
+                               (entry["prompt_hash"], entry["fingerprint"]))
+            self._conn.commit()
+            self.stale += 1
+
+    def put(self, prompt: str, target_file: str, script: str, generation_ms: float) -> None:
+        """Store a script that answered the prompt and evict least recently used entries"""
+        if not self.enabled:
+            return
+
+        now = time.time()
+        fingerprint = structural_fingerprint(target_file)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scripts (prompt_hash, fingerprint, prompt, target_file, script, generation_ms, "
+                "created_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (text_sha256(normalize_prompt(prompt)), fingerprint, prompt, Path(target_file).name, script,
+                 generation_ms, now, now)
+            )
+            excess = self._conn.execute("SELECT COUNT(*) FROM scripts").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM scripts WHERE rowid IN (SELECT rowid FROM scripts ORDER BY last_access ASC LIMIT ?)",
+                    (excess,)
+                )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Remove every stored script"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM scripts")
+            self._conn.commit()
+
+    def get_stats(self) -> Dict:
+        """Get hit/miss counters, saved generation time and entry count"""
+        entries = 0
+        if self.enabled:
+            with self._lock:
+                entries = self._conn.execute("SELECT COUNT(*) FROM scripts").fetchone()[0]
+
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 2),
+            "entries": entries,
+            "max_entries": self.max_entries
+        }
+
+
+# Global instance
+script_library = ScriptLibrary(
+    storage_dir=os.getenv('SCRIPT_LIBRARY_DIR', 'script_library'),
+    max_entries=int(os.getenv('SCRIPT_LIBRARY_MAX_ENTRIES', '500')),
+    enabled=os.getenv('SCRIPT_LIBRARY_ENABLED', 'true').lower() == 'true'
+)
+
+def get_script_library() -> ScriptLibrary:
+    """Get the global script library instance"""
+    return script_library
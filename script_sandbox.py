@@ -0,0 +1,528 @@
+"""
+Script Sandbox
+Pool of pre-warmed worker processes that run generated analysis scripts: common modules are imported
+once per worker, each script runs in a forked child with a timeout, and workers are recycled
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import struct
+import tempfile
+import importlib
+import threading
+import traceback
+import subprocess
+from typing import Callable, Dict, List, Optional
+
+SANDBOX_POOL_ENABLED = os.getenv('SANDBOX_POOL_ENABLED', 'true').lower() == 'true'
+SANDBOX_WORKERS = int(os.getenv('SANDBOX_WORKERS', '2'))
+# A worker is replaced after this many scripts (and whenever one crashes or times out)
+SANDBOX_MAX_RUNS = int(os.getenv('SANDBOX_MAX_RUNS', '50'))
+SANDBOX_TIMEOUT_SECONDS = float(os.getenv('SANDBOX_TIMEOUT_SECONDS', '30'))
+# A worker that has not finished its preload imports by then is killed and started again
+SANDBOX_STARTUP_TIMEOUT_SECONDS = float(os.getenv('SANDBOX_STARTUP_TIMEOUT_SECONDS', '30'))
+# Attempts to start a worker before its slot is left empty until the next run needs it
+SANDBOX_START_ATTEMPTS = 3
+# Address space limit per script in MB (POSIX only); 0 for none
+SANDBOX_MEMORY_MB = int(os.getenv('SANDBOX_MEMORY_MB', '0'))
+# Imported once in each worker; forked scripts inherit them already initialized
+PRELOAD_MODULES = [name.strip() for name in os.getenv(
+    'SANDBOX_PRELOAD_MODULES', 're,json,csv,collections,datetime,math,statistics,itertools,string'
+).split(',') if name.strip()]
+# stdout / stderr beyond this are cut off before being sent back
+MAX_OUTPUT_BYTES = 1024 * 1024
+# Extra time the pool gives a worker past the script timeout before killing the worker itself
+WATCHDOG_GRACE_SECONDS = 5.0
+
+_HEADER = struct.Struct(">I")
+
+
+def _send(stream, message: Dict) -> None:
+    data = json.dumps(message).encode('utf-8')
+    stream.write(_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+
+def _receive(stream) -> Dict:
+    header = stream.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise EOFError("Sandbox worker closed its pipe")
+    data = stream.read(_HEADER.unpack(header)[0])
+    return json.loads(data.decode('utf-8'))
+
+
+def _read_output(f) -> str:
+    f.seek(0)
+    data = f.read(MAX_OUTPUT_BYTES + 1)
+    text = data[:MAX_OUTPUT_BYTES].decode('utf-8', errors='replace')
+    return text + "\n[output truncated]" if len(data) > MAX_OUTPUT_BYTES else text
+
+
+# ---------------------------------------------------------------------------
+# Worker process side
+# ---------------------------------------------------------------------------
+
+def _exec_script(request: Dict) -> int:
+    """Run the script in this process as __main__; returns its exit code"""
+    if request.get("cwd"):
+        os.chdir(request["cwd"])
+    sys.argv = [request["filename"]]
+    namespace = {"__name__": "__main__", "__file__": request["filename"], "__builtins__": __builtins__}
+    try:
+        exec(compile(request["source"], request["filename"], "exec"), namespace)
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException as e:
+        # Skip this frame so the traceback reads like one from `python script.py`
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def _wait(pid: int, timeout: float) -> Optional[int]:
+    """waitpid with a timeout: the exit status, or None if the child is still running"""
+    deadline = time.monotonic() + timeout
+    delay = 0.0005
+    while True:
+        finished, status = os.waitpid(pid, os.WNOHANG)
+        if finished:
+            return status
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, 0.02)
+
+
+def _run_forked(request: Dict) -> Dict:
+    """Run the script in a forked child so it starts from the warm, unmodified worker state"""
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                os.dup2(out.fileno(), 1)
+                os.dup2(err.fileno(), 2)
+                if SANDBOX_MEMORY_MB:
+                    import resource
+                    limit = SANDBOX_MEMORY_MB * 1024 * 1024
+                    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+                code = _exec_script(request)
+            finally:
+                os._exit(code)
+
+        status = _wait(pid, request["timeout"])
+        timed_out = status is None
+        if timed_out:
+            os.kill(pid, 9)
+            status = os.waitpid(pid, 0)[1]
+        stderr = _read_output(err)
+        if timed_out:
+            stderr += f"\nScript timed out after {request['timeout']:g} seconds"
+        return {
+            "returncode": os.waitstatus_to_exitcode(status),
+            "stdout": _read_output(out),
+            "stderr": stderr,
+            "timed_out": timed_out
+        }
+
+
+def _run_inline(request: Dict) -> Dict:
+    """Fallback without fork (Windows): run in the worker itself; the pool enforces the timeout"""
+    import io
+    import contextlib
+    cwd = os.getcwd()
+    out, err = io.StringIO(), io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            code = _exec_script(request)
+    finally:
+        os.chdir(cwd)
+    return {
+        "returncode": code,
+        "stdout": out.getvalue()[:MAX_OUTPUT_BYTES],
+        "stderr": err.getvalue()[:MAX_OUTPUT_BYTES],
+        "timed_out": False
+    }
+
+
+def _worker_main() -> None:
+    # The protocol owns the original stdin/stdout; stray writes to fd 1 go to stderr instead
+    channel_in = os.fdopen(os.dup(0), 'rb')
+    channel_out = os.fdopen(os.dup(1), 'wb')
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(2, 1)
+
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    _send(channel_out, {"ready": True, "pid": os.getpid()})
+
+    run = _run_forked if hasattr(os, "fork") else _run_inline
+    while True:
+        try:
+            request = _receive(channel_in)
+        except EOFError:
+            return
+        _send(channel_out, run(request))
+
+
+# ---------------------------------------------------------------------------
+# Pool side
+# ---------------------------------------------------------------------------
+
+class CancelToken:
+    """
+    Lets a caller abandon scripts it no longer needs (the losers of a speculative round)
+
+    A run that has not started yet is skipped; a running one has its worker killed.
+    """
+
+    def __init__(self):
+        self._cancelled = False
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def _on_cancel(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def _discard(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+def _cancelled_result() -> Dict:
+    return {"returncode": None, "stdout": "", "stderr": "Script cancelled", "timed_out": False, "cancelled": True}
+
+
+class SandboxWorker:
+    """One pre-warmed worker process, driven over its stdin / stdout pipes"""
+
+    def __init__(self, startup_timeout: float = SANDBOX_STARTUP_TIMEOUT_SECONDS):
+        """
+        Start the worker and wait for its preloaded imports
+
+        Raises:
+            RuntimeError: If the worker exits, or is not ready within startup_timeout seconds
+        """
+        # Own process group on POSIX, so killing the worker also kills the script child it forked
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, start_new_session=hasattr(os, "killpg")
+        )
+        self.runs = 0
+        self.killed_by_watchdog = False
+        self.killed_by_cancel = False
+
+        # A worker hanging in an import is killed, which ends the wait with EOFError
+        watchdog = threading.Timer(startup_timeout, self._kill_hung)
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            _receive(self.process.stdout)
+        except (EOFError, OSError, ValueError) as e:
+            self.close()
+            if self.killed_by_watchdog:
+                raise RuntimeError(f"Sandbox worker was not ready after {startup_timeout:g} seconds") from e
+            raise RuntimeError(f"Sandbox worker exited during startup (exit code {self.process.returncode})") from e
+        finally:
+            watchdog.cancel()
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def run(self, request: Dict, cancel: Optional[CancelToken] = None) -> Dict:
+        """Send one script; raises EOFError if the worker died (or was killed by the watchdog or a cancel)"""
+        watchdog = threading.Timer(request["timeout"] + WATCHDOG_GRACE_SECONDS, self._kill_hung)
+        watchdog.daemon = True
+        watchdog.start()
+        if cancel is not None:
+            cancel._on_cancel(self._kill_cancelled)
+        try:
+            _send(self.process.stdin, request)
+            return _receive(self.process.stdout)
+        finally:
+            watchdog.cancel()
+            if cancel is not None:
+                cancel._discard(self._kill_cancelled)
+            self.runs += 1
+
+    def _kill_hung(self) -> None:
+        self.killed_by_watchdog = True
+        self.close()
+
+    def _kill_cancelled(self) -> None:
+        self.killed_by_cancel = True
+        self.close()
+
+    def close(self) -> None:
+        if self.process.poll() is None:
+            if hasattr(os, "killpg"):
+                try:
+                    os.killpg(self.process.pid, 9)
+                except OSError:
+                    self.process.kill()
+            else:
+                self.process.kill()
+            self.process.wait()
+
+
+class SandboxPool:
+    """
+    Fixed-size pool of SandboxWorkers
+
+    Workers start in the background as soon as the pool is created, so the first script does
+    not pay for interpreter startup. Callers beyond the pool size wait for a free worker.
+    A worker that crashes or hangs while starting is retried with backoff; if no worker can
+    be started at all, runs fail with RuntimeError instead of waiting forever.
+    """
+
+    def __init__(self, size: int = SANDBOX_WORKERS, max_runs: int = SANDBOX_MAX_RUNS,
+                 timeout: float = SANDBOX_TIMEOUT_SECONDS, startup_timeout: float = SANDBOX_STARTUP_TIMEOUT_SECONDS):
+        self.size = max(1, size)
+        self.max_runs = max_runs
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self._idle: "queue.Queue[SandboxWorker]" = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._starting = 0      # slots whose worker is being started
+        self._empty_slots = 0   # slots whose worker failed every start attempt
+        self.runs = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.recycled = 0
+        self.cancelled = 0
+        self.start_failures = 0
+        self.wait_seconds = 0.0
+        for _ in range(self.size):
+            self._spawn()
+
+    def _spawn(self) -> None:
+        """Start a replacement worker in the background and add it to the idle queue when ready"""
+        with self._lock:
+            self._starting += 1
+
+        def start():
+            worker = None
+            for attempt in range(SANDBOX_START_ATTEMPTS):
+                if attempt:
+                    time.sleep(0.5 * 2 ** attempt)
+                try:
+                    worker = SandboxWorker(self.startup_timeout)
+                    break
+                except Exception as e:
+                    print(f"Warning: could not start sandbox worker "
+                          f"(attempt {attempt + 1}/{SANDBOX_START_ATTEMPTS}): {e}")
+                    with self._lock:
+                        self.start_failures += 1
+                if self._closed:
+                    break
+
+            if worker is not None:
+                if self._closed:
+                    worker.close()
+                else:
+                    self._idle.put(worker)
+            with self._lock:
+                self._starting -= 1
+                self._empty_slots += 1 if worker is None else 0
+
+        threading.Thread(target=start, name="sandbox-spawn", daemon=True).start()
+
+    def _acquire(self, cancel: Optional[CancelToken]) -> Optional[SandboxWorker]:
+        """
+        Wait for an idle worker; None if the run is cancelled first
+
+        Raises:
+            RuntimeError: If every worker failed to start
+        """
+        with self._lock:
+            # Slots left empty by earlier failed starts get another try now that a run needs them
+            retry, self._empty_slots = self._empty_slots, 0
+        for _ in range(retry):
+            self._spawn()
+
+        while cancel is None or not cancel.cancelled:
+            try:
+                return self._idle.get(timeout=0.05)
+            except queue.Empty:
+                pass
+            with self._lock:
+                if self._empty_slots >= self.size and self._idle.empty():
+                    raise RuntimeError(f"No sandbox worker could be started after {SANDBOX_START_ATTEMPTS} attempts")
+        return None
+
+    def run(self, source: str, filename: str = "script.py", cwd: Optional[str] = None,
+            timeout: Optional[float] = None, cancel: Optional[CancelToken] = None) -> Dict:
+        """
+        Run a script's source as __main__ in a warm worker
+
+        Args:
+            source: Python source code
+            filename: Name the script runs under (sys.argv[0], tracebacks)
+            cwd: Working directory for the script; defaults to this process's
+            timeout: Seconds before the script is killed
+            cancel: Token that abandons the run when cancelled
+
+        Returns:
+            Dict with returncode, stdout, stderr, timed_out, cancelled and worker_pid
+        """
+        request = {"source": source, "filename": filename, "cwd": os.path.abspath(cwd or os.getcwd()),
+                   "timeout": timeout or self.timeout}
+        waited = time.perf_counter()
+        worker = self._acquire(cancel)
+        with self._lock:
+            self.wait_seconds += time.perf_counter() - waited
+        if worker is None or (cancel is not None and cancel.cancelled):
+            if worker is not None:
+                self._idle.put(worker)
+            with self._lock:
+                self.cancelled += 1
+            return _cancelled_result()
+
+        retire = False
+        try:
+            result = worker.run(request, cancel)
+        except (EOFError, OSError, ValueError) as e:
+            # The worker crashed, or was killed: by the watchdog because the script outlived
+            # the timeout, or because the caller cancelled the run
+            retire = True
+            timed_out = worker.killed_by_watchdog
+            if worker.killed_by_cancel:
+                result = _cancelled_result()
+            else:
+                result = {
+                    "returncode": worker.process.poll(),
+                    "stdout": "",
+                    "stderr": f"Script timed out after {request['timeout']:g} seconds" if timed_out
+                              else f"Sandbox worker failed: {e}",
+                    "timed_out": timed_out
+                }
+            with self._lock:
+                self.cancelled += 1 if result.get("cancelled") else 0
+                self.crashes += 0 if timed_out or result.get("cancelled") else 1
+        result.setdefault("cancelled", False)
+        result["worker_pid"] = worker.pid
+
+        with self._lock:
+            self.runs += 1
+            self.timeouts += 1 if result["timed_out"] else 0
+            if not retire and worker.runs >= self.max_runs:
+                retire = True
+                self.recycled += 1
+
+        if retire:
+            worker.close()
+            self._spawn()
+        else:
+            self._idle.put(worker)
+        return result
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.size,
+                "idle": self._idle.qsize(),
+                "runs": self.runs,
+                "timeouts": self.timeouts,
+                "crashes": self.crashes,
+                "recycled": self.recycled,
+                "cancelled": self.cancelled,
+                "start_failures": self.start_failures,
+                "wait_seconds": round(self.wait_seconds, 2),
+                "max_runs": self.max_runs,
+                "preloaded_modules": PRELOAD_MODULES,
+                "forked_runs": hasattr(os, "fork")
+            }
+
+
+# Global sandbox pool instance
+_sandbox_pool = None
+_sandbox_pool_lock = threading.Lock()
+
+def get_sandbox_pool() -> SandboxPool:
+    """Get the global sandbox pool, starting its workers on first use"""
+    global _sandbox_pool
+    with _sandbox_pool_lock:
+        if _sandbox_pool is None:
+            _sandbox_pool = SandboxPool()
+            atexit.register(_sandbox_pool.close)
+        return _sandbox_pool
+
+
+def run_script(source: str, filename: str = "script.py", cwd: Optional[str] = None,
+               timeout: float = SANDBOX_TIMEOUT_SECONDS, cancel: Optional[CancelToken] = None) -> Dict:
+    """
+    Run a generated script through the pool, or in a fresh interpreter if the pool is disabled
+
+    The pool takes the source over its pipe; the fresh-interpreter fallback runs `filename`
+    in `cwd`, which the caller must already have written.
+
+    Returns:
+        Dict with returncode, stdout, stderr, timed_out and cancelled
+    """
+    if SANDBOX_POOL_ENABLED:
+        return get_sandbox_pool().run(source, filename, cwd, timeout, cancel)
+
+    if cancel is not None and cancel.cancelled:
+        return _cancelled_result()
+    process = subprocess.Popen([sys.executable, filename], cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               text=True)
+    if cancel is not None:
+        cancel._on_cancel(process.kill)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        return {"returncode": None, "stdout": "", "stderr": f"Script timed out after {timeout:g} seconds",
+                "timed_out": True, "cancelled": False}
+    finally:
+        if cancel is not None:
+            cancel._discard(process.kill)
+    if cancel is not None and cancel.cancelled:
+        return _cancelled_result()
+    return {"returncode": process.returncode, "stdout": stdout, "stderr": stderr, "timed_out": False,
+            "cancelled": False}
+
+
+if __name__ == "__main__" and "--worker" in sys.argv:
+    _worker_main()
@@ -0,0 +1,58 @@
+"""
+Test configuration
+Points every module-level cache, index and log at a throwaway directory and gives the Azure
+client placeholder credentials, before any module of the app is imported
+"""
+
+import os
+import re
+import zlib
+import tempfile
+
+import numpy as np
+import pytest
+
+_STORAGE_ROOT = tempfile.mkdtemp(prefix="analysis-tests-")
+
+for name, value in {
+    "PING_FED_URL": "http://127.0.0.1:9/as/token.oauth2",
+    "KGW_CLIENT_ID": "test-client",
+    "KGW_CLIENT_SECRET": "test-secret",
+    "KGW_ENDPOINT": "http://127.0.0.1:9",
+    "AOAI_API_VERSION": "2024-06-01",
+    "CHAT_MODEL_DEPLOYMENT_NAME": "gpt-4o",
+    "EMBEDDING_CACHE_DIR": os.path.join(_STORAGE_ROOT, "embedding_cache"),
+    "ANSWER_CACHE_DIR": os.path.join(_STORAGE_ROOT, "answer_cache"),
+    "SCRIPT_LIBRARY_DIR": os.path.join(_STORAGE_ROOT, "script_library"),
+    "DOCUMENT_INDEX_DIR": os.path.join(_STORAGE_ROOT, "indexes"),
+    "JOB_STORAGE_DIR": os.path.join(_STORAGE_ROOT, "jobs"),
+    "FLIGHT_RECORDER_FILE": os.path.join(_STORAGE_ROOT, "traces", "flight_recorder.jsonl"),
+    "SANDBOX_POOL_ENABLED": "false"
+}.items():
+    os.environ.setdefault(name, value)
+
+EMBEDDING_DIMENSIONS = 64
+
+
+def fake_embedding(text):
+    """Hashed bag of words: texts sharing words get similar vectors, as with a real model"""
+    vector = np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32)
+    for word in re.findall(r"\w+", text.lower()):
+        vector[zlib.crc32(word.encode("utf-8")) % EMBEDDING_DIMENSIONS] += 1.0
+    vector[0] += 0.01  # Never all zeros
+    return vector.tolist()
+
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+    """Replace the embeddings API with fake_embedding; returns the list of embedded batches"""
+    import analysis_engine
+
+    batches = []
+
+    def create_embeddings(texts, chunk_params=None):
+        batches.append(list(texts))
+        return [fake_embedding(text) for text in texts]
+
+    monkeypatch.setattr(analysis_engine, "create_embeddings", create_embeddings)
+    return batches
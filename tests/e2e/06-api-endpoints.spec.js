@@ -43,6 +43,42 @@ test.describe('API Endpoints', () => {
     expect(Array.isArray(data.files)).toBe(true);
   });
 
+  test('should respond to cache stats endpoint', async ({ page }) => {
+    const response = await page.request.get('/api/cache/stats');
+    expect(response.status()).toBe(200);
+    
+    const data = await response.json();
+    expect(data).toHaveProperty('embeddings');
+    expect(data.embeddings).toHaveProperty('hits');
+    expect(data.embeddings).toHaveProperty('misses');
+    expect(data).toHaveProperty('answers');
+    expect(data).toHaveProperty('scripts');
+    expect(data).toHaveProperty('coalescing');
+  });
+
+  test('should respond to index status endpoint', async ({ page }) => {
+    const response = await page.request.get('/api/index');
+    expect(response.status()).toBe(200);
+    
+    const data = await response.json();
+    expect(data).toHaveProperty('documents');
+    expect(Array.isArray(data.documents)).toBe(true);
+  });
+
+  test('should respond to jobs endpoint', async ({ page }) => {
+    const response = await page.request.get('/api/jobs');
+    expect(response.status()).toBe(200);
+    
+    const data = await response.json();
+    expect(data).toHaveProperty('jobs');
+    expect(Array.isArray(data.jobs)).toBe(true);
+  });
+
+  test('should return 404 for unknown job', async ({ page }) => {
+    const response = await page.request.get('/api/jobs/00000000000000000000000000000000');
+    expect(response.status()).toBe(404);
+  });
+
   test('should handle test endpoint', async ({ page }) => {
     const response = await page.request.get('/api/test');
     expect(response.status()).toBe(200);
@@ -92,6 +128,14 @@ test.describe('POST API Endpoints', () => {
     expect([200, 500]).toContain(response.status());
   });
 
+  test('should reject streaming for the extraction method', async ({ page }) => {
+    const response = await page.request.post('/api/process/stream', {
+      data: { user_prompt: 'Test prompt', method: 'extraction' }
+    });
+    
+    expect(response.status()).toBe(400);
+  });
+
   test('should validate element save endpoint structure', async ({ page }) => {
     const elementData = {
       element_id: 'test-element-id',
@@ -0,0 +1,157 @@
+"""
+Analysis engine tests
+Failed runs must be recorded as errors and kept out of the answer cache, whatever the answer text says
+"""
+
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+import analysis_engine
+from analysis_engine import AnalysisError, MockEmbeddingResponse, MockResponse
+from answer_cache import AnswerCache
+from embedding_cache import EmbeddingCache
+from flight_recorder import get_flight_recorder, trace
+from http_pool import get_http_pool
+
+from conftest import fake_embedding
+
+PROMPT = "Summarize the leaking pump complaints"
+CONTEXT = {"chunks": ["Complaint ID: 1 - Leaking pump"], "sources": [], "context_tokens": 8, "error": None}
+
+
+@pytest.fixture
+def answer_cache(tmp_path, monkeypatch):
+    cache = AnswerCache(storage_dir=str(tmp_path / "answers"))
+    monkeypatch.setattr(analysis_engine, "get_answer_cache", lambda: cache)
+    monkeypatch.setattr(analysis_engine, "retrieve_rag_context",
+                        lambda prompt, target_file, progress=None, query_embedding=None: CONTEXT)
+    return cache
+
+
+@pytest.fixture
+def document(tmp_path):
+    path = tmp_path / "complaints.txt"
+    path.write_text("--- Page 1 ---\nComplaint ID: 1 - Leaking pump\n", encoding="utf-8")
+    return str(path)
+
+
+def test_api_error_response_is_not_cached(answer_cache, document, monkeypatch):
+    async def token():
+        return "token"
+
+    async def post(url, **kwargs):
+        return httpx.Response(500, text="upstream unavailable", request=httpx.Request("POST", url))
+
+    monkeypatch.setattr(analysis_engine.client.auth, "get_access_token_async", token)
+    monkeypatch.setattr(get_http_pool(), "post", post)
+
+    result, cache_info = analysis_engine.cached_query_processor(PROMPT, "reasoning", document)
+
+    assert "API Error: 500" in result and cache_info is None
+    assert answer_cache.get_stats()["entries"] == 0
+
+
+def test_failed_request_is_not_cached_and_is_retried(answer_cache, document, monkeypatch):
+    responses = [MockResponse("Request failed after 3 attempts: connection reset", status=None),
+                 MockResponse("12 complaints mention a leaking pump")]
+    monkeypatch.setattr(analysis_engine.client, "chat_completions_create", lambda **kwargs: responses.pop(0))
+
+    assert analysis_engine.cached_query_processor(PROMPT, "reasoning", document)[1] is None
+    assert answer_cache.get_stats()["entries"] == 0
+
+    result, cache_info = analysis_engine.cached_query_processor(PROMPT, "reasoning", document)
+    assert result == "12 complaints mention a leaking pump" and cache_info is None
+    assert answer_cache.get_stats()["entries"] == 1
+    assert analysis_engine.cached_query_processor(PROMPT, "reasoning", document)[1]["match"] == "exact"
+
+
+def test_generate_rag_response_raises_on_failed_completion(monkeypatch):
+    monkeypatch.setattr(analysis_engine.client, "chat_completions_create",
+                        lambda **kwargs: MockResponse("Failed after 3 attempts", status=429))
+
+    with pytest.raises(AnalysisError, match="Failed after 3 attempts"):
+        analysis_engine.generate_rag_response(PROMPT, CONTEXT["chunks"])
+
+
+@pytest.mark.parametrize("method", ["reasoning", "extraction"])
+def test_failed_run_is_recorded_as_an_error(method, answer_cache, document, monkeypatch):
+    monkeypatch.setattr(analysis_engine.client, "chat_completions_create",
+                        lambda **kwargs: MockResponse("API Error: 503 - overloaded", status=503))
+
+    with trace(method, PROMPT, document) as current:
+        result = analysis_engine.manual_query_processor(PROMPT, method, document)
+
+    assert "API Error: 503 - overloaded" in result
+    assert current.error == result
+
+
+def test_successful_run_is_not_recorded_as_an_error(answer_cache, document, monkeypatch):
+    # An answer that merely starts with "Error" is still an answer
+    monkeypatch.setattr(analysis_engine.client, "chat_completions_create",
+                        lambda **kwargs: MockResponse("Error codes E12 and E14 appear in 3 complaints"))
+
+    with trace("reasoning", PROMPT, document) as current:
+        result = analysis_engine.manual_query_processor(PROMPT, "reasoning", document)
+
+    assert result == "Error codes E12 and E14 appear in 3 complaints"
+    assert current.error is None
+
+
+@pytest.fixture
+def async_client(tmp_path, monkeypatch):
+    """Async fakes for the shared client; returns the calls made, with the thread each ran on"""
+    calls = []
+    answers = []
+
+    async def embeddings_create_async(model, input_text):
+        calls.append(("embeddings", threading.current_thread()))
+        return MockEmbeddingResponse([fake_embedding(text) for text in input_text])
+
+    async def make_api_call_async(messages, max_tokens=4000, temperature=0.3):
+        calls.append(("chat", threading.current_thread()))
+        return answers.pop(0)
+
+    monkeypatch.setattr(analysis_engine, "get_embedding_cache",
+                        lambda cache=EmbeddingCache(storage_dir=str(tmp_path / "embeddings")): cache)
+    monkeypatch.setattr(analysis_engine.client, "embeddings_create_async", embeddings_create_async)
+    monkeypatch.setattr(analysis_engine.client, "make_api_call_async", make_api_call_async)
+    return calls, answers
+
+
+def test_async_reasoning_awaits_the_shared_client(answer_cache, document, async_client, monkeypatch):
+    calls, answers = async_client
+    answers.append(MockResponse("12 complaints mention a leaking pump"))
+    embeddings = []
+    def retrieve_rag_context(prompt, target_file, progress=None, query_embedding=None):
+        embeddings.append(query_embedding)
+        return CONTEXT
+    monkeypatch.setattr(analysis_engine, "retrieve_rag_context", retrieve_rag_context)
+
+    result, cache_info = asyncio.run(analysis_engine.cached_query_processor_async(PROMPT, "reasoning", document))
+
+    assert result == "12 complaints mention a leaking pump" and cache_info is None
+    # Both API calls ran on the caller's event loop, not on a worker thread
+    assert [(name, thread) for name, thread in calls] == [("embeddings", threading.main_thread()),
+                                                          ("chat", threading.main_thread())]
+    assert embeddings == [fake_embedding(PROMPT)]
+    assert answer_cache.get_stats()["entries"] == 1
+
+    result, cache_info = asyncio.run(analysis_engine.cached_query_processor_async(PROMPT, "reasoning", document))
+    assert result == "12 complaints mention a leaking pump" and cache_info["match"] == "exact"
+    assert [name for name, _ in calls] == ["embeddings", "chat"]
+
+
+def test_async_failed_run_is_recorded_and_not_cached(answer_cache, document, async_client):
+    _, answers = async_client
+    answers.append(MockResponse("API Error: 503 - overloaded", status=503))
+
+    result, cache_info = asyncio.run(analysis_engine.cached_query_processor_async(PROMPT, "reasoning", document,
+                                                                                 request_id="async-failure"))
+
+    assert "API Error: 503 - overloaded" in result and cache_info is None
+    assert answer_cache.get_stats()["entries"] == 0
+    record = get_flight_recorder().get("async-failure")
+    assert record["status"] == "error" and record["error"] == result
@@ -0,0 +1,65 @@
+"""
+ANN index tests
+Every vector lands in exactly one inverted list, probing every list is exact, and a saved index
+loads back with the same lists
+"""
+
+import numpy as np
+import pytest
+
+from ann_index import IVFFlatIndex
+from vector_store import VectorStore, normalize_rows
+
+
+@pytest.fixture
+def vectors():
+    # Clustered data, as real embeddings are: recall should be near perfect
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 32))
+    return normalize_rows(centers[rng.integers(0, 20, size=2000)] + 0.3 * rng.normal(size=(2000, 32)))
+
+
+def test_every_vector_is_in_exactly_one_list(vectors):
+    index = IVFFlatIndex().build(vectors, n_lists=16)
+
+    assert index.n_lists == 16 and len(index) == len(vectors)
+    assert sorted(np.concatenate(index.lists).tolist()) == list(range(len(vectors)))
+
+
+def test_probing_every_list_matches_exact_search(vectors):
+    index = IVFFlatIndex().build(vectors, n_lists=16)
+    query = vectors[7]
+
+    indices, scores = index.search(vectors, query, top_k=10, n_probe=16)
+
+    exact = np.argsort(-(vectors @ query), kind="stable")[:10]
+    assert list(indices) == list(exact)
+    np.testing.assert_allclose(scores, (vectors @ query)[exact], rtol=1e-6)
+
+
+def test_recall_with_a_few_probes(vectors):
+    store = VectorStore(vectors, normalized=True)
+    store.build_ann(n_lists=32, n_probe=4)
+    queries = np.random.default_rng(1).choice(len(vectors), size=20, replace=False)
+
+    recall = np.mean([
+        len(set(store.search(vectors[q], top_k=10)[0]) & set(store.search(vectors[q], top_k=10, exact=True)[0])) / 10
+        for q in queries
+    ])
+    assert recall >= 0.9
+
+
+def test_add_before_build_is_rejected(vectors):
+    with pytest.raises(ValueError, match="must be built"):
+        IVFFlatIndex().add(vectors[:5], np.arange(5))
+
+
+def test_saved_index_loads_back(vectors, tmp_path):
+    index = IVFFlatIndex(n_probe=8).build(vectors, n_lists=16)
+    index.save(tmp_path)
+
+    loaded = IVFFlatIndex.load(tmp_path)
+
+    assert loaded.n_probe == 8 and loaded.n_lists == 16
+    assert [ids.tolist() for ids in loaded.lists] == [ids.tolist() for ids in index.lists]
+    assert IVFFlatIndex.load(tmp_path / "missing") is None
@@ -0,0 +1,52 @@
+"""
+Answer cache tests
+Near-duplicate matching must never serve the answer to a negated or different-entity question
+"""
+
+from answer_cache import AnswerCache, prompt_guard
+
+DOC = "doc-sha"
+# ada-002 puts such prompts almost on top of each other; use one vector for all of them
+EMBEDDING = [0.6, 0.8, 0.0]
+
+
+def make_cache(tmp_path, **kwargs):
+    return AnswerCache(storage_dir=str(tmp_path / "answers"), semantic=True, **kwargs)
+
+
+def test_semantic_matching_is_off_by_default(tmp_path):
+    cache = AnswerCache(storage_dir=str(tmp_path / "answers"))
+    cache.put(DOC, "reasoning", "How many complaints are for Israel?", "12", EMBEDDING)
+    assert not cache.semantic_enabled
+    assert cache.get_similar(DOC, "reasoning", "How many complaints for Israel", EMBEDDING) is None
+
+
+def test_negated_prompt_is_not_served(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put(DOC, "reasoning", "State the total number of substantiated complaints.", "40", EMBEDDING)
+
+    assert cache.get_similar(DOC, "reasoning", "State the total number of unsubstantiated complaints.",
+                             EMBEDDING) is None
+    assert cache.get_similar(DOC, "reasoning", "Which complaints were not substantiated?", EMBEDDING) is None
+
+
+def test_different_entity_or_number_is_not_served(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put(DOC, "reasoning", "How many complaints are for Israel in 2024?", "12", EMBEDDING)
+
+    assert cache.get_similar(DOC, "reasoning", "How many complaints are for Germany in 2024?", EMBEDDING) is None
+    assert cache.get_similar(DOC, "reasoning", "How many complaints are for Israel in 2023?", EMBEDDING) is None
+
+
+def test_rephrased_prompt_is_served(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put(DOC, "reasoning", "How many complaints are for Israel in 2024?", "12", EMBEDDING)
+
+    hit = cache.get_similar(DOC, "reasoning", "how many complaints were there for Israel in 2024", EMBEDDING)
+    assert hit is not None and hit["answer"] == "12" and hit["match"] == "semantic"
+
+
+def test_prompt_guard_terms():
+    assert prompt_guard("List the unsubstantiated complaints for Israel in 2024") == {"unsubstantiated", "israel", "2024"}
+    assert prompt_guard("Complaints that did not close") == prompt_guard("Complaints that did not close.")
+    assert prompt_guard("Complaints that didn't close") != prompt_guard("Complaints that did close")
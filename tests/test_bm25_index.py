@@ -0,0 +1,57 @@
+"""
+BM25 index tests
+Identifiers match whole or by their parts, merged indexes score like one built from scratch,
+and rank fusion favours chunks both rankings agree on
+"""
+
+import numpy as np
+
+from bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+CHUNKS = [
+    "Complaint QE-008854: leaking pump seal at site 4",
+    "CAPA-001 opened for cracked housing on the pump",
+    "Routine inspection, no issues found",
+    "Second report of a leaking pump seal, see QE-008854",
+]
+
+
+def test_compound_identifiers_keep_their_parts():
+    assert tokenize("See QE-008854 and CAPA-001.") == ["see", "qe-008854", "qe", "008854", "and", "capa-001",
+                                                       "capa", "001"]
+
+
+def test_search_ranks_matching_chunks_only():
+    index = BM25Index.build(CHUNKS)
+
+    ids, scores = index.search("QE-008854 leaking seal", top_k=10)
+
+    assert set(ids) == {0, 3} and np.all(scores > 0)
+    assert list(index.search("008854")[0]) == list(index.search("qe-008854")[0])
+    assert len(index.search("warranty")[0]) == 0
+
+
+def test_concat_scores_like_a_single_index():
+    whole = BM25Index.build(CHUNKS)
+    merged = BM25Index.concat([BM25Index.build(CHUNKS[:2]), BM25Index.build(CHUNKS[2:])])
+
+    assert len(merged) == len(CHUNKS)
+    for query in ["leaking pump", "CAPA-001 housing", "inspection"]:
+        np.testing.assert_allclose(merged.scores(query), whole.scores(query), rtol=1e-6)
+
+
+def test_saved_index_loads_back(tmp_path):
+    index = BM25Index.build(CHUNKS, k1=1.2, b=0.5)
+    index.save(tmp_path)
+
+    loaded = BM25Index.load(tmp_path)
+
+    assert (loaded.k1, loaded.b) == (1.2, 0.5)
+    np.testing.assert_array_equal(loaded.scores("leaking pump seal"), index.scores("leaking pump seal"))
+
+
+def test_rank_fusion_prefers_chunks_found_by_both_rankings():
+    ids, scores = reciprocal_rank_fusion([np.array([5, 1, 2]), np.array([1, 7, 5])], top_k=3)
+
+    assert list(ids) == [1, 5, 7]
+    assert scores[0] == np.float32(1 / 62 + 1 / 61)
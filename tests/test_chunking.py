@@ -0,0 +1,69 @@
+"""
+Chunking tests
+Chunks stay within the token budget, never span a page, keep lines whole and point back at the
+bytes they came from
+"""
+
+from chunking import estimate_tokens, iter_document_chunks
+
+
+def write_pages(path, pages=3, rows=30):
+    lines = []
+    for page in range(1, pages + 1):
+        lines.append(f"--- Page {page} ---")
+        for row in range(rows):
+            lines.append(f"Complaint ID: {page * 100 + row} - Leaking pump seal reported at site {row}")
+            if row % 10 == 9:
+                lines.append("")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_chunks_fit_the_budget_and_stay_on_one_page(tmp_path):
+    path = write_pages(tmp_path / "complaints.txt")
+    chunks = list(iter_document_chunks(path, max_tokens=120, overlap_tokens=30))
+
+    assert {chunk["page"] for chunk in chunks} == {1, 2, 3}
+    for chunk in chunks:
+        assert chunk["token_count"] <= 120
+        assert "--- Page" not in chunk["text"]
+        # Complaint IDs are numbered page * 100 + row
+        assert all(int(line.split()[2]) // 100 == chunk["page"] for line in chunk["text"].split("\n"))
+
+
+def test_byte_offsets_cover_the_chunk_text(tmp_path):
+    path = write_pages(tmp_path / "complaints.txt", pages=2)
+    data = open(path, "rb").read()
+
+    for chunk in iter_document_chunks(path, max_tokens=120, overlap_tokens=0):
+        source = data[chunk["byte_start"]:chunk["byte_end"]].decode("utf-8")
+        assert [line for line in source.splitlines() if line] == chunk["text"].split("\n")
+
+
+def test_consecutive_chunks_overlap_on_the_same_page(tmp_path):
+    path = write_pages(tmp_path / "complaints.txt", pages=1)
+    chunks = list(iter_document_chunks(path, max_tokens=120, overlap_tokens=30))
+
+    assert len(chunks) > 1
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk["text"].split("\n")[0] in previous["text"].split("\n")
+
+
+def test_only_an_overlong_line_is_split(tmp_path):
+    path = tmp_path / "notes.txt"
+    long_line = " ".join(f"word{i}" for i in range(400))
+    path.write_text(f"Short line\n{long_line}\n", encoding="utf-8")
+
+    chunks = list(iter_document_chunks(str(path), max_tokens=100, overlap_tokens=0))
+
+    assert chunks[0]["text"].startswith("Short line")
+    assert all(chunk["token_count"] <= 100 for chunk in chunks)
+    assert " ".join(" ".join(chunk["text"].split("\n")) for chunk in chunks).split()[2:] == long_line.split()
+    assert estimate_tokens(long_line) > 100
+
+
+def test_line_filter_drops_lines(tmp_path):
+    path = write_pages(tmp_path / "complaints.txt", pages=1, rows=5)
+    chunks = list(iter_document_chunks(path, line_filter=lambda line: "site 3" not in line["text"]))
+
+    assert len(chunks) == 1 and "site 3" not in chunks[0]["text"] and "site 4" in chunks[0]["text"]
@@ -0,0 +1,56 @@
+"""
+Context packer tests
+Packed context stays within the token budget, neighbouring chunks merge without repeating their
+overlap, and near-duplicates give way to different content
+"""
+
+import numpy as np
+
+from context_packer import merge_texts, mmr_order, pack_context
+
+
+def record(chunk_id, text, score, byte_start=None, page=1, tokens=None):
+    return {"chunk_id": chunk_id, "text": text, "score": score, "page": page, "source": "complaints.txt",
+            "byte_start": byte_start, "byte_end": None if byte_start is None else byte_start + len(text),
+            "token_count": tokens}
+
+
+def test_merge_texts_drops_the_repeated_lines():
+    assert merge_texts("a\nb\nc", "b\nc\nd") == "a\nb\nc\nd"
+    assert merge_texts("a\nb", "c") == "a\nb\nc"
+
+
+def test_candidates_that_do_not_fit_are_skipped_for_smaller_ones():
+    candidates = [record(0, "best", 0.9, tokens=60), record(1, "large", 0.8, tokens=50),
+                  record(2, "small", 0.7, tokens=30)]
+
+    packed = pack_context(candidates, budget_tokens=100)
+
+    assert [p["chunk_ids"] for p in packed["passages"]] == [[0], [2]]
+    assert packed["token_count"] == 90 and packed["dropped"] == [1]
+
+
+def test_best_candidate_is_kept_even_over_budget():
+    packed = pack_context([record(0, "huge", 0.9, tokens=500)], budget_tokens=100)
+    assert packed["passages"][0]["chunk_ids"] == [0] and packed["dropped"] == []
+
+
+def test_adjacent_chunks_on_a_page_merge_into_one_passage():
+    first = "Complaint 1 - Leaking pump\nComplaint 2 - Cracked housing"
+    second = "Complaint 2 - Cracked housing\nComplaint 3 - Broken seal"
+    candidates = [record(4, second, 0.9, byte_start=27), record(3, first, 0.8, byte_start=0),
+                  record(9, "Complaint 3 - Broken seal", 0.7, byte_start=27, page=2)]
+
+    packed = pack_context(candidates, budget_tokens=1000)
+
+    assert [p["chunk_ids"] for p in packed["passages"]] == [[3, 4], [9]]
+    assert packed["passages"][0]["text"] == ("Complaint 1 - Leaking pump\nComplaint 2 - Cracked housing\n"
+                                             "Complaint 3 - Broken seal")
+
+
+def test_mmr_moves_near_duplicates_down():
+    vectors = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+
+    assert mmr_order([0.9, 0.89, 0.8], vectors, mmr_lambda=0.5) == [0, 2, 1]
+    assert mmr_order([0.9, 0.89, 0.8], vectors, mmr_lambda=1.0) == [0, 1, 2]
+    assert mmr_order([0.9, 0.89, 0.8], None) == [0, 1, 2]
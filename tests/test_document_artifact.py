@@ -0,0 +1,87 @@
+"""
+Document artifact tests
+The line / page table matches the text file line for line, whatever order page markers arrive in
+"""
+
+import sqlite3
+
+import pytest
+
+import document_artifact
+from document_artifact import build_artifact, read_artifact_meta
+
+# Starts with a byte order mark, as files saved by Notepad do
+DOCUMENT = "\ufeff" + """Cover sheet
+--- Page 1 ---
+Complaint ID: 100 - Leaking pump
+
+Complaint ID: 101 - Cracked housing
+--- Page 2 ---
+Complaint ID: 102 - Broken seal
+--- Page 1 ---
+Complaint ID: 103 - Leaking pump
+"""
+
+
+@pytest.fixture
+def artifact(tmp_path):
+    source = tmp_path / "complaints.txt"
+    source.write_text(DOCUMENT, encoding="utf-8")
+    output = tmp_path / "lines.db"
+    meta = build_artifact(str(source), str(output), "abc123")
+    conn = sqlite3.connect(output)
+    yield meta, output, conn
+    conn.close()
+
+
+def test_lines_keep_their_numbers_and_pages(artifact):
+    _, _, conn = artifact
+    lines = conn.execute("SELECT line_no, page, text, is_marker FROM lines ORDER BY line_no").fetchall()
+
+    assert lines[:4] == [(1, None, "Cover sheet", 0), (2, 1, "--- Page 1 ---", 1),
+                         (3, 1, "Complaint ID: 100 - Leaking pump", 0), (4, 1, "", 0)]
+    assert [text for _, _, text, _ in lines] == DOCUMENT.lstrip("\ufeff").splitlines()
+
+
+def test_page_seen_again_is_extended(artifact):
+    meta, _, conn = artifact
+    pages = dict((page, (first, last, text)) for page, first, last, text in conn.execute("SELECT * FROM pages"))
+
+    assert meta["pages"] == 2 and set(pages) == {1, 2}
+    assert pages[1] == (2, 9, "Complaint ID: 100 - Leaking pump\n\nComplaint ID: 101 - Cracked housing\n"
+                              "Complaint ID: 103 - Leaking pump")
+    assert pages[2] == (6, 7, "Complaint ID: 102 - Broken seal")
+
+
+def test_meta_is_read_back(artifact):
+    meta, output, _ = artifact
+
+    stored = read_artifact_meta(output)
+
+    assert stored["content_sha256"] == "abc123" and stored["lines"] == 9
+    assert stored["version"] == document_artifact.ARTIFACT_VERSION and stored["fts"] == meta["fts"]
+    assert read_artifact_meta(output.with_name("missing.db")) is None
+
+
+def test_full_text_search_finds_lines(artifact):
+    meta, _, conn = artifact
+    if not meta["fts"]:
+        pytest.skip("SQLite built without FTS5")
+
+    rows = conn.execute("SELECT line_no FROM lines WHERE line_no IN "
+                        "(SELECT rowid FROM lines_fts WHERE lines_fts MATCH '\"leaking pump\"') ORDER BY line_no")
+    assert [line_no for (line_no,) in rows] == [3, 9]
+
+
+def test_small_batches_give_the_same_table(tmp_path, monkeypatch, artifact):
+    _, _, conn = artifact
+    monkeypatch.setattr(document_artifact, "INSERT_BATCH_SIZE", 2)
+    source = tmp_path / "complaints.txt"
+    build_artifact(str(source), str(tmp_path / "batched.db"), "abc123")
+
+    batched = sqlite3.connect(tmp_path / "batched.db")
+    try:
+        for query in ["SELECT * FROM lines ORDER BY line_no", "SELECT * FROM pages ORDER BY page"]:
+            assert batched.execute(query).fetchall() == conn.execute(query).fetchall()
+    finally:
+        batched.close()
@@ -0,0 +1,118 @@
+"""
+Document index tests
+A corpus index handed to a request never changes under it, and a failed rebuild never takes
+away the last ready index
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import analysis_engine
+import document_index
+from document_index import DocumentIndexManager
+from vector_store import VectorStore
+
+from conftest import fake_embedding
+
+
+def write_document(path, topic, pages=3):
+    lines = []
+    for page in range(1, pages + 1):
+        lines.append(f"--- Page {page} ---")
+        lines += [f"{topic} complaint {page * 10 + row} reported at site {row}" for row in range(4)]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_corpus_is_extended_by_copy(tmp_path, fake_embeddings):
+    manager = DocumentIndexManager(storage_dir=str(tmp_path / "indexes"))
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    manager.build_index(write_document(uploads / "pumps.txt", "Leaking pump"))
+
+    first, unindexed = manager.load_corpus(directory=str(uploads))
+    assert unindexed == [] and len(first.documents) == 1
+    first_records = list(first.chunk_records)
+    first_vectors = first.vector_store.vectors.copy()
+
+    manager.build_index(write_document(uploads / "valves.txt", "Sticking valve"))
+    second, _ = manager.load_corpus(directory=str(uploads))
+
+    # The index an earlier request is still searching is untouched
+    assert second is not first
+    assert first.chunk_records == first_records and len(first.documents) == 1
+    assert len(first.vector_store) == len(first.chunk_records) == len(first.bm25)
+    np.testing.assert_array_equal(first.vector_store.vectors, first_vectors)
+
+    assert len(second.documents) == 2
+    assert len(second.vector_store) == len(second.chunk_records) == len(second.bm25)
+    np.testing.assert_array_equal(second.vector_store.vectors[:len(first_vectors)], first_vectors)
+    assert manager.load_corpus(directory=str(uploads))[0] is second
+
+    indices, _ = second.vector_store.search(fake_embedding("Sticking valve complaint"), top_k=3)
+    assert all(second.chunk_records[i]["source"].endswith("valves.txt") for i in indices)
+
+
+def test_vector_store_copy_leaves_the_original_and_its_ann_index_unchanged():
+    rng = np.random.default_rng(0)
+    store = VectorStore(rng.normal(size=(200, 16)))
+    store.build_ann(n_lists=8)
+    ann_size = len(store.ann)
+
+    extended = store.copy()
+    ids = extended.add(rng.normal(size=(50, 16)))
+
+    assert len(store) == 200 and len(store.ann) == ann_size
+    assert len(extended) == 250 and len(extended.ann) == ann_size + 50
+    assert list(ids) == list(range(200, 250))
+
+
+def test_failed_rebuild_keeps_the_last_ready_index(tmp_path, fake_embeddings, monkeypatch):
+    storage_dir = str(tmp_path / "indexes")
+    manager = DocumentIndexManager(storage_dir=storage_dir)
+    path = write_document(tmp_path / "pumps.txt", "Leaking pump")
+    ready = manager.build_index(path)
+    index_dir = manager._index_dir(manager._file_key(path))
+    vectors_before = (index_dir / "vectors.npy").read_bytes()
+
+    # Fails after the vectors are written: nothing may replace the published index
+    build_artifact = document_index.build_artifact
+    def broken_artifact(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(document_index, "build_artifact", broken_artifact)
+    manager.build_index(path)
+
+    status = manager.get_status(path)
+    assert status["status"] == "ready" and status["indexed_at"] == ready["indexed_at"]
+    assert status["last_failure"]["error"] == "disk full"
+    assert (index_dir / "vectors.npy").read_bytes() == vectors_before
+    assert not (index_dir / "staging").exists()
+    reloaded = DocumentIndexManager(storage_dir=storage_dir).load_index(path)
+    assert len(reloaded["chunks"]) == len(reloaded["vector_store"]) == ready["chunk_count"]
+
+    monkeypatch.setattr(document_index, "build_artifact", build_artifact)
+    assert "last_failure" not in manager.build_index(path)
+
+
+def test_failed_first_build_is_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_engine, "create_embeddings", lambda texts, chunk_params=None: [])
+    manager = DocumentIndexManager(storage_dir=str(tmp_path / "indexes"))
+    path = write_document(tmp_path / "pumps.txt", "Leaking pump")
+
+    manager.build_index(path)
+    status = manager.get_status(path)
+    assert status["status"] == "failed" and status["error"] == "Embedding request failed"
+    assert manager.load_index(path) is None
+
+
+def test_concurrent_enqueues_queue_a_document_once(tmp_path, monkeypatch):
+    manager = DocumentIndexManager(storage_dir=str(tmp_path / "indexes"))
+    monkeypatch.setattr(manager, "_ensure_worker", lambda: None)
+    path = write_document(tmp_path / "pumps.txt", "Leaking pump")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        statuses = list(executor.map(lambda _: manager.enqueue(path), range(32)))
+
+    assert manager._queue.qsize() == 1
+    assert {status["status"] for status in statuses} == {"queued"}
@@ -0,0 +1,65 @@
+"""
+Embedding cache tests
+Embeddings are keyed by model, chunking parameters and text, and a put keeps the cache under its
+size bound without scanning the whole table each time
+"""
+
+from embedding_cache import EmbeddingCache
+
+MODEL = "text-embedding-ada-002"
+PARAMS = "tokens=400:overlap=50"
+ENTRY_BYTES = 4 * 4  # Four float32 values
+
+
+def embedding(i):
+    return [float(i), 0.5, 0.25, 1.0]
+
+
+def test_get_many_returns_stored_embeddings_in_order(tmp_path):
+    cache = EmbeddingCache(storage_dir=str(tmp_path / "embeddings"))
+    cache.put_many(MODEL, PARAMS, ["Leaking pump", "Cracked housing"], [embedding(1), embedding(2)])
+
+    assert cache.get_many(MODEL, PARAMS, ["Cracked housing", "Broken seal", "Leaking pump"]) == \
+        [embedding(2), None, embedding(1)]
+    assert cache.get_many(MODEL, "tokens=800:overlap=50", ["Leaking pump"]) == [None]
+    stats = cache.get_stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2 and stats["entries"] == 2
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = EmbeddingCache(storage_dir=str(tmp_path / "embeddings"), max_bytes=10 * ENTRY_BYTES)
+    texts = [f"complaint {i}" for i in range(10)]
+    for i, text in enumerate(texts):
+        cache.put_many(MODEL, PARAMS, [text], [embedding(i)])
+    cache.get_many(MODEL, PARAMS, texts[:2])  # The oldest two are now the most recently used
+
+    cache.put_many(MODEL, PARAMS, ["complaint 10"], [embedding(10)])
+
+    # Evicted down to 90% of the bound: the two least recently used entries go
+    assert cache.get_many(MODEL, PARAMS, texts[2:4]) == [None, None]
+    assert None not in cache.get_many(MODEL, PARAMS, texts[:2] + texts[4:] + ["complaint 10"])
+    stats = cache.get_stats()
+    assert stats["evictions"] == 2 and stats["size_bytes"] == 9 * ENTRY_BYTES
+
+
+def test_put_under_the_bound_does_not_scan_the_table(tmp_path):
+    cache = EmbeddingCache(storage_dir=str(tmp_path / "embeddings"), max_bytes=100 * ENTRY_BYTES)
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+
+    for i in range(20):
+        cache.put_many(MODEL, PARAMS, [f"complaint {i}"], [embedding(i)])
+
+    assert not any("SUM(" in statement for statement in statements)
+    assert cache.get_stats()["entries"] == 20
+
+
+def test_size_is_picked_up_from_an_existing_database(tmp_path):
+    storage_dir = str(tmp_path / "embeddings")
+    EmbeddingCache(storage_dir=storage_dir).put_many(MODEL, PARAMS, [f"complaint {i}" for i in range(10)],
+                                                     [embedding(i) for i in range(10)])
+
+    reopened = EmbeddingCache(storage_dir=storage_dir, max_bytes=10 * ENTRY_BYTES)
+    reopened.put_many(MODEL, PARAMS, ["complaint 10"], [embedding(10)])
+
+    assert reopened.get_stats()["entries"] == 9
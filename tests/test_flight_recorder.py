@@ -0,0 +1,78 @@
+"""
+Flight recorder tests
+Every call made for a query, on whichever thread, lands in that query's one trace, and the log
+rotates without losing the recent traces
+"""
+
+import asyncio
+
+import pytest
+
+import flight_recorder
+from flight_recorder import FlightRecorder, annotate, mark_error, record_llm_call, record_script_run, trace
+
+USAGE = {"prompt_tokens": 900, "completion_tokens": 120, "prompt_tokens_details": {"cached_tokens": 512}}
+
+
+@pytest.fixture
+def recorder(tmp_path, monkeypatch):
+    recorder = FlightRecorder(log_file=str(tmp_path / "traces.jsonl"))
+    monkeypatch.setattr(flight_recorder, "_flight_recorder", recorder)
+    return recorder
+
+
+def test_calls_from_worker_threads_land_in_one_trace(recorder):
+    async def analysis():
+        with trace("reasoning", "How many leaks?", "complaints.txt", request_id="leaks") as current:
+            annotate(document_hash="abc123")
+            await asyncio.to_thread(record_llm_call, "embeddings", "text-embedding-ada-002", 40.0)
+            record_llm_call("chat", "gpt-4o", 1500.0, attempts=2, usage=USAGE)
+            with trace("reasoning", "nested") as nested:
+                assert nested is current
+                record_script_run("print(12)", 0, 80.0)
+
+    asyncio.run(analysis())
+
+    record = recorder.get("leaks")
+    assert record["status"] == "ok" and record["document_hash"] == "abc123"
+    assert [call["kind"] for call in record["llm_calls"]] == ["embeddings", "chat"]
+    assert record["totals"] == {"llm_calls": 2, "llm_ms": 1540.0, "retries": 1, "prompt_tokens": 900,
+                                "completion_tokens": 120, "cached_tokens": 512, "scripts": 1, "script_ms": 80.0,
+                                "total_tokens": 1020}
+    assert recorder.get_stats()["written"] == 1
+
+
+def test_failures_are_recorded(recorder):
+    with pytest.raises(ValueError):
+        with trace("extraction", "Count the pumps", request_id="raised"):
+            raise ValueError("bad batch number")
+    with trace("reasoning", "Count the pumps", request_id="marked"):
+        mark_error("API Error: 503 - overloaded")
+
+    assert recorder.get("raised")["status"] == "error" and recorder.get("raised")["error"] == "bad batch number"
+    assert recorder.get("marked")["status"] == "error" and recorder.get("marked")["error"] == "API Error: 503 - overloaded"
+
+
+def test_calls_outside_a_trace_are_ignored(recorder):
+    record_llm_call("chat", "gpt-4o", 10.0)
+    assert recorder.get_stats()["written"] == 0
+
+
+def test_log_rotates_and_keeps_recent_traces(tmp_path):
+    recorder = FlightRecorder(log_file=str(tmp_path / "traces.jsonl"), max_bytes=2000, backups=2)
+    for i in range(30):
+        recorder.write({"request_id": f"query-{i}", "method": "reasoning", "status": "ok", "total_ms": i,
+                        "padding": "x" * 200})
+
+    assert recorder.get_stats()["files"] == 3
+    assert recorder.get("query-29") is not None and recorder.get("query-0") is None
+    assert [record["request_id"] for record in recorder.query(limit=2)] == ["query-29", "query-28"]
+
+
+def test_query_filters_and_sorts(recorder):
+    for request_id, method, status, total_ms in [("a", "reasoning", "ok", 900), ("b", "extraction", "ok", 4000),
+                                                 ("c", "extraction", "error", 200), ("d", "extraction", "ok", 1500)]:
+        recorder.write({"request_id": request_id, "method": method, "status": status, "total_ms": total_ms})
+
+    assert [r["request_id"] for r in recorder.query(method="extraction", status="ok", sort="total_ms")] == ["b", "d"]
+    assert [r["request_id"] for r in recorder.query(min_total_ms=1000)] == ["d", "b"]
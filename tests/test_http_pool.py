@@ -0,0 +1,127 @@
+"""
+HTTP pool tests
+One connection pool serves sync callers and any number of event loops, and identical calls in
+flight at the same time are sent once
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from http_pool import HTTPPool, SingleFlight, get_http_pool
+
+URL = "http://azure.test/openai/deployments/gpt-4o/chat/completions"
+
+
+@pytest.fixture
+def local_pool():
+    """A pool whose client answers every request locally, recording the thread it ran on"""
+    pool = HTTPPool()
+    threads = []
+
+    def handler(request):
+        threads.append(threading.current_thread())
+        return httpx.Response(200, json={"path": request.url.path})
+
+    pool.run(_install_client(pool, httpx.MockTransport(handler)))
+    yield pool, threads
+    pool.close()
+
+
+async def _install_client(pool, transport):
+    pool._client = httpx.AsyncClient(transport=transport)
+
+
+def test_requests_from_several_event_loops_share_the_pool_loop(local_pool):
+    pool, threads = local_pool
+    first = asyncio.run(pool.post(URL))
+    second = asyncio.run(pool.post(URL))
+
+    assert first.json() == second.json() == {"path": "/openai/deployments/gpt-4o/chat/completions"}
+    assert threads == [pool._thread, pool._thread]
+
+
+def test_sync_callers_run_on_the_pool_loop(local_pool):
+    pool, threads = local_pool
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        responses = list(executor.map(lambda _: pool.run(pool.post(URL)), range(8)))
+
+    assert [response.status_code for response in responses] == [200] * 8
+    assert set(threads) == {pool._thread}
+
+
+def test_run_from_the_pool_loop_is_refused(local_pool):
+    pool, _ = local_pool
+
+    async def nested():
+        return pool.run(pool.post(URL))
+
+    with pytest.raises(RuntimeError, match="would deadlock"):
+        pool.run(nested())
+
+
+def slow_call(calls, result="12 complaints", error=None):
+    """Factory for a call that takes a moment and counts how often it is really sent"""
+    async def call():
+        calls.append(result)
+        await asyncio.sleep(0.2)
+        if error is not None:
+            raise error
+        return result
+    return call
+
+
+def test_identical_calls_in_flight_are_sent_once():
+    single_flight = SingleFlight()
+    calls = []
+    key = SingleFlight.key("chat", "gpt-4o", [{"role": "user", "content": "Count the leaks"}])
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: get_http_pool().run(single_flight.do(key, slow_call(calls))), range(4)))
+
+    assert results == ["12 complaints"] * 4 and len(calls) == 1
+    stats = single_flight.get_stats()
+    assert stats["requests"] == 1 and stats["coalesced"] == 3 and stats["in_flight"] == 0
+
+    # Nothing is kept once the call finishes
+    assert get_http_pool().run(single_flight.do(key, slow_call(calls))) == "12 complaints" and len(calls) == 2
+
+
+def test_different_calls_are_not_coalesced():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def main():
+        return await asyncio.gather(single_flight.do(SingleFlight.key("chat", 0.3), slow_call(calls, "first")),
+                                    single_flight.do(SingleFlight.key("chat", 0.7), slow_call(calls, "second")))
+
+    assert asyncio.run(main()) == ["first", "second"] and len(calls) == 2
+
+
+def test_failure_reaches_every_caller():
+    single_flight = SingleFlight()
+    calls = []
+    call = slow_call(calls, error=RuntimeError("connection reset"))
+
+    async def main():
+        return await asyncio.gather(*(single_flight.do("key", call) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert [str(error) for error in errors] == ["connection reset"] * 3 and len(calls) == 1
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def main():
+        first = asyncio.ensure_future(single_flight.do("key", slow_call(calls)))
+        second = asyncio.ensure_future(single_flight.do("key", slow_call(calls)))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "12 complaints" and len(calls) == 1
@@ -0,0 +1,61 @@
+"""
+Ingest filter tests
+Boilerplate stripping must remove repeated headers / footers without touching table rows
+"""
+
+from ingest_filters import detect_boilerplate, iter_clean_chunks, normalize_line
+
+PAGES = 20
+ROWS_PER_PAGE = 30
+
+
+def write_batch_table(path):
+    """A report whose pages hold a header, a numeric batch table and a page footer"""
+    lines = []
+    for page in range(1, PAGES + 1):
+        lines.append(f"--- Page {page} ---")
+        lines.append("Company Confidential - Batch Release Report")
+        for row in range(ROWS_PER_PAGE):
+            n = page * 100 + row
+            lines.append(f"Batch {100000 + n} | Material 1000000{n:05d} | Qty {n % 400 + 1}")
+            lines.append(f"Complaint ID: {n} - Leaking pump")
+        lines.append(f"Page {page} of {PAGES}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def test_normalize_line_masks_only_page_numbers():
+    assert normalize_line("Page 2 of 123.") == normalize_line("Page  7 of 123.")
+    assert normalize_line("Batch 123456 | Qty 12") != normalize_line("Batch 654321 | Qty 40")
+
+
+def test_numeric_table_rows_are_kept(tmp_path):
+    path = tmp_path / "batches.txt"
+    write_batch_table(path)
+
+    boilerplate = detect_boilerplate(str(path))
+    assert boilerplate["lines"] == {"Company Confidential - Batch Release Report", "Page # of #"}
+
+    stats = {}
+    text = "\n".join(chunk["text"] for chunk in iter_clean_chunks(str(path), stats=stats))
+    assert stats["lines_removed"] == 2 * PAGES
+    assert "Company Confidential" not in text
+    assert "Page 3 of 20" not in text
+    for page in (1, 10, PAGES):
+        for row in (0, ROWS_PER_PAGE - 1):
+            n = page * 100 + row
+            assert f"Batch {100000 + n} |" in text
+            assert f"Complaint ID: {n} - Leaking pump" in text
+
+
+def test_repeated_line_in_page_body_is_kept(tmp_path):
+    # With EDGE_LINES = 3 the status line sits in the body of every page
+    path = tmp_path / "body.txt"
+    lines = []
+    for page in range(1, 6):
+        lines += [f"--- Page {page} ---", "Header", f"Case {page}", f"Owner: site {page * 13}", "Status: Closed",
+                  f"Opened on day {page * 7}", f"Closed on day {page * 11}", "Footer"]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    text = "\n".join(chunk["text"] for chunk in iter_clean_chunks(str(path)))
+    assert text.count("Status: Closed") == 5
+    assert "Header" not in text and "Footer" not in text
@@ -0,0 +1,106 @@
+"""
+Job manager tests
+Jobs finish, fail or cancel with their status persisted, and only jobs whose owning process is
+gone are marked interrupted
+"""
+
+import json
+import time
+import threading
+
+import pytest
+
+from job_manager import JobManager, HOSTNAME
+
+
+def wait_until_finished(manager, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get_job(job_id)
+        if job["status"] in ("completed", "failed", "cancelled"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish: {manager.get_job(job_id)}")
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return JobManager(storage_dir=str(tmp_path / "jobs"), max_workers=1)
+
+
+def test_completed_job_keeps_its_result_and_progress(manager):
+    def runner(progress):
+        progress("Generating script")
+        return "12 complaints"
+
+    job = wait_until_finished(manager, manager.submit({"prompt": "Count"}, runner)["job_id"])
+
+    assert job["status"] == "completed" and job["result"] == "12 complaints"
+    assert [step["message"] for step in job["progress"]] == ["Generating script"]
+    stored = json.loads((manager.storage_dir / f"{job['job_id']}.json").read_text(encoding="utf-8"))
+    assert stored["status"] == "completed"
+
+
+def test_failed_job_records_the_error(manager):
+    def runner(progress):
+        raise RuntimeError("sandbox unavailable")
+
+    job = wait_until_finished(manager, manager.submit({}, runner)["job_id"])
+    assert job["status"] == "failed" and job["error"] == "sandbox unavailable"
+
+
+def test_running_job_stops_at_its_next_checkpoint(manager):
+    started, release = threading.Event(), threading.Event()
+    steps = []
+
+    def runner(progress):
+        started.set()
+        release.wait(5)
+        progress("Retrieving relevant chunks")
+        steps.append("after checkpoint")
+
+    job_id = manager.submit({}, runner)["job_id"]
+    started.wait(5)
+    assert manager.cancel(job_id)["cancel_requested"]
+    release.set()
+
+    assert wait_until_finished(manager, job_id)["status"] == "cancelled"
+    assert steps == []
+
+
+def test_queued_job_is_cancelled_at_once(manager):
+    release = threading.Event()
+    running = manager.submit({}, lambda progress: release.wait(5))["job_id"]
+    queued = manager.submit({}, lambda progress: "never")["job_id"]
+
+    assert manager.cancel(queued)["status"] == "cancelled"
+    release.set()
+    assert wait_until_finished(manager, running)["status"] == "completed"
+    assert manager.get_job(queued)["result"] is None
+
+
+def write_foreign_job(storage_dir, job_id, heartbeat_age):
+    storage_dir.mkdir(parents=True, exist_ok=True)
+    job = {"job_id": job_id, "status": "running", "request": {}, "progress": [], "result": None, "error": None,
+           "owner": {"pid": 1, "host": f"not-{HOSTNAME}"}, "heartbeat_at": time.time() - heartbeat_age}
+    (storage_dir / f"{job_id}.json").write_text(json.dumps(job), encoding="utf-8")
+
+
+def test_only_jobs_with_a_stale_owner_are_marked_interrupted(tmp_path):
+    storage_dir = tmp_path / "jobs"
+    write_foreign_job(storage_dir, "a" * 32, heartbeat_age=3600)
+    write_foreign_job(storage_dir, "b" * 32, heartbeat_age=0)
+
+    manager = JobManager(storage_dir=str(storage_dir))
+
+    assert manager.get_job("a" * 32)["status"] == "failed"
+    assert manager.get_job("b" * 32)["status"] == "running"
+
+
+def test_cancel_of_a_job_owned_elsewhere_leaves_a_marker(tmp_path):
+    storage_dir = tmp_path / "jobs"
+    write_foreign_job(storage_dir, "c" * 32, heartbeat_age=0)
+    manager = JobManager(storage_dir=str(storage_dir))
+
+    assert manager.cancel("c" * 32)["cancel_requested"]
+    assert (storage_dir / f"{'c' * 32}.cancel").exists()
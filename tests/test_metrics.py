@@ -0,0 +1,91 @@
+"""
+Metrics tests
+Counters and histograms render in the Prometheus text format, timed stages record durations and
+errors, and with metrics disabled nothing is recorded
+"""
+
+import asyncio
+
+import pytest
+
+import metrics
+from metrics import Counter, Histogram, MetricsRegistry, timed_stage
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+
+
+def test_counter_renders_escaped_labels(enabled):
+    counter = Counter("rag_cache_lookups_total", "Lookups", ["cache", "result"])
+    counter.inc(cache="answers", result="exact_hit")
+    counter.inc(2, cache="answers", result="exact_hit")
+    counter.inc(0.5, cache='quote"d\nname', result="miss")
+
+    assert list(counter.render()) == [
+        'rag_cache_lookups_total{cache="answers",result="exact_hit"} 3',
+        'rag_cache_lookups_total{cache="quote\\"d\\nname",result="miss"} 0.5'
+    ]
+
+
+def test_histogram_buckets_are_cumulative(enabled):
+    histogram = Histogram("rag_stage_duration_seconds", "Durations", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, stage="retrieval")
+
+    assert list(histogram.render()) == [
+        'rag_stage_duration_seconds_bucket{stage="retrieval",le="0.1"} 2',
+        'rag_stage_duration_seconds_bucket{stage="retrieval",le="1"} 3',
+        'rag_stage_duration_seconds_bucket{stage="retrieval",le="+Inf"} 4',
+        'rag_stage_duration_seconds_sum{stage="retrieval"} 3.65',
+        'rag_stage_duration_seconds_count{stage="retrieval"} 4'
+    ]
+
+
+def test_registry_renders_help_and_type():
+    registry = MetricsRegistry()
+    registry.register(Counter("rag_llm_retries_total", "Retries"))
+
+    assert registry.render() == "# HELP rag_llm_retries_total Retries\n# TYPE rag_llm_retries_total counter\n"
+
+
+def stage_series(stage):
+    seconds = [line for line in metrics.STAGE_SECONDS.render() if f'stage="{stage}"' in line and "_count" in line]
+    errors = [line for line in metrics.STAGE_ERRORS.render() if f'stage="{stage}"' in line]
+    return seconds, errors
+
+
+def test_timed_stage_records_durations_and_errors(enabled):
+    @timed_stage("test_sync_stage")
+    def retrieve(fail=False):
+        if fail:
+            raise RuntimeError("index missing")
+        return "chunks"
+
+    @timed_stage("test_async_stage")
+    async def generate():
+        await asyncio.sleep(0)
+        return "answer"
+
+    assert retrieve() == "chunks"
+    with pytest.raises(RuntimeError):
+        retrieve(fail=True)
+    assert asyncio.run(generate()) == "answer"
+
+    assert stage_series("test_sync_stage") == (['rag_stage_duration_seconds_count{stage="test_sync_stage"} 2'],
+                                               ['rag_stage_errors_total{stage="test_sync_stage"} 1'])
+    assert stage_series("test_async_stage") == (['rag_stage_duration_seconds_count{stage="test_async_stage"} 1'],
+                                                [])
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+
+    def retrieve():
+        return "chunks"
+
+    assert timed_stage("test_disabled_stage")(retrieve) is retrieve
+    counter = Counter("rag_llm_retries_total", "Retries", ["endpoint"])
+    counter.inc(endpoint="chat")
+    assert list(counter.render()) == []
@@ -0,0 +1,62 @@
+"""
+Micro-benchmark tests
+The regression check flags only real slowdowns against the baseline, and each suite reports the
+benchmark names the baseline is keyed by
+"""
+
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import micro_benchmarks
+from micro_benchmarks import bench_elements, bench_retrieval, compare, write_corpus
+
+BASELINE = {
+    "retrieval/dense/1000": {"best_ms": 10.0},
+    "retrieval/hybrid/1000": {"best_ms": 10.0},
+    "elements/get/100": {"best_ms": 0.01}
+}
+
+
+def test_only_slowdowns_over_the_threshold_regress():
+    results = {
+        "retrieval/dense/1000": {"best_ms": 12.0},    # 20% slower: within the threshold
+        "retrieval/hybrid/1000": {"best_ms": 14.0},   # 40% slower
+        "elements/get/100": {"best_ms": 0.05},        # 5x slower, but only by 0.04 ms
+        "chunking/new/1MB": {"best_ms": 500.0}        # Not in the baseline yet
+    }
+
+    assert compare(results, BASELINE, threshold=0.25, min_delta_ms=0.25) == ["retrieval/hybrid/1000"]
+    assert compare(results, BASELINE, threshold=0.5, min_delta_ms=0.25) == []
+
+
+def test_corpus_is_paged_like_extracted_pdf_text(tmp_path):
+    path = tmp_path / "corpus.txt"
+    write_corpus(str(path), 0.05)
+
+    text = path.read_text(encoding="utf-8")
+    assert 0.05 * 1024 * 1024 <= len(text) < 0.06 * 1024 * 1024
+    assert text.startswith("\n--- Page 1 ---\n") and "--- Page 2 ---" in text
+
+
+def test_suites_report_the_baseline_names(tmp_path):
+    retrieval = bench_retrieval([200], dim=32, repeat=1, queries=2)
+    elements = bench_elements([20], str(tmp_path), repeat=1, lookups=5)
+
+    assert set(retrieval) == {"retrieval/retrieve_relevant_chunks/dense/200",
+                              "retrieval/retrieve_relevant_chunks/hybrid/200"}
+    assert set(elements) == {f"elements/{operation}/20" for operation in ("load", "save_update", "save_new", "list", "get")}
+    assert all(result["best_ms"] > 0 for result in {**retrieval, **elements}.values())
+    assert os.listdir(tmp_path) == []
+
+
+def test_stored_baseline_covers_the_small_scale():
+    with open(micro_benchmarks.DEFAULT_BASELINE, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+
+    small = micro_benchmarks.SCALES["small"]
+    assert f"chunking/prepare_document_chunks/{small['chunking_mb'][0]}MB" in baseline
+    assert f"retrieval/retrieve_relevant_chunks/hybrid/{small['retrieval_chunks'][0]}" in baseline
+    assert f"elements/get/{small['elements'][0]}" in baseline
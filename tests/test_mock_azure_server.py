@@ -0,0 +1,90 @@
+"""
+Mock Azure OpenAI server tests
+The stand-in answers like PingFed and Azure OpenAI do, including their rate-limit responses, so
+benchmarks against it exercise the real client's paths
+"""
+
+import os
+import sys
+import json
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from mock_azure_server import build_parser, create_app, hashed_embedding, parse_latency
+
+CHAT_URL = "/openai/deployments/gpt-4o/chat/completions?api-version=2024-06-01"
+EMBEDDINGS_URL = "/openai/deployments/text-embedding-ada-002/embeddings?api-version=2024-06-01"
+MESSAGES = [{"role": "user", "content": "QUESTION: How many complaints mention a leaking pump?"}]
+
+
+def dot(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+def mock_server(*options):
+    args = build_parser().parse_args(["--token-latency", "0", "--chat-latency", "0", "--stream-token-interval", "0",
+                                      "--embedding-latency", "0", "--embedding-dim", "64", *options])
+    return TestClient(create_app(args))
+
+
+def bearer(client):
+    token = client.post("/as/token.oauth2").json()
+    assert token["token_type"] == "Bearer" and token["expires_in"] == 3600
+    return {"Authorization": f"Bearer {token['access_token']}"}
+
+
+def test_chat_completion_needs_a_token_and_reports_usage():
+    client = mock_server()
+    assert client.post(CHAT_URL, json={"messages": MESSAGES}).status_code == 401
+
+    body = client.post(CHAT_URL, json={"messages": MESSAGES}, headers=bearer(client)).json()
+
+    assert body["choices"][0]["message"]["content"] == \
+        "This is a mock answer to: How many complaints mention a leaking pump?"
+    assert body["usage"]["total_tokens"] == body["usage"]["prompt_tokens"] + body["usage"]["completion_tokens"]
+
+
+def test_streamed_completion_ends_with_usage_and_done():
+    client = mock_server()
+    response = client.post(CHAT_URL, headers=bearer(client),
+                           json={"messages": MESSAGES, "stream": True, "stream_options": {"include_usage": True}})
+
+    events = [line[len("data: "):] for line in response.text.splitlines() if line.startswith("data: ")]
+    chunks = [json.loads(event) for event in events[:-1]]
+    assert events[-1] == "[DONE]" and chunks[-1]["usage"]["completion_tokens"] > 0
+    content = "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks if chunk["choices"])
+    assert content == "This is a mock answer to: How many complaints mention a leaking pump?"
+
+
+def test_embeddings_rank_texts_sharing_words_higher():
+    client = mock_server()
+    body = client.post(EMBEDDINGS_URL, headers=bearer(client),
+                       json={"input": ["leaking pump seal", "leaking pump", "annual audit report"]}).json()
+
+    query, related, unrelated = [data["embedding"] for data in body["data"]]
+    assert len(query) == 64 and dot(query, related) > dot(query, unrelated)
+    assert hashed_embedding("leaking pump", 64) == related
+
+
+def test_requests_over_the_quota_get_429_with_retry_after():
+    client = mock_server("--rpm", "2")
+    headers = bearer(client)
+
+    statuses = [client.post(CHAT_URL, json={"messages": MESSAGES}, headers=headers) for _ in range(3)]
+
+    assert [response.status_code for response in statuses] == [200, 200, 429]
+    throttled = statuses[-1].headers
+    assert float(throttled["retry-after-ms"]) > 0 and throttled["x-ratelimit-remaining-requests"] == "0"
+    assert client.get("/stats").json()["chat_429"] == 1
+
+
+def test_latency_specs():
+    rng = random.Random(0)
+    assert parse_latency("300", rng)() == 0.3
+    assert 0.1 <= parse_latency("uniform:100:200", rng)() <= 0.2
+    with pytest.raises(ValueError):
+        parse_latency("gamma:1:2", rng)
@@ -0,0 +1,84 @@
+"""
+Rate limiter tests
+Callers are admitted within the quota's burst and queued past it, the service's rate-limit headers
+correct the buckets, and processes sharing a store file share one budget
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from rate_limiter import RateLimiter, estimate_request_tokens, retry_after_seconds
+
+# 600 RPM with the default 10 second burst: 100 requests at once, then 10 per second
+RPM = 600
+
+
+def acquire_all(limiter, count, tokens=0):
+    async def main():
+        return [await limiter.acquire(tokens) for _ in range(count)]
+    return asyncio.run(main())
+
+
+def response(status_code, **headers):
+    return httpx.Response(status_code, headers={name.replace("_", "-"): str(value) for name, value in headers.items()})
+
+
+def test_request_estimate_includes_the_completion_budget():
+    messages = [{"role": "user", "content": "How many complaints mention a leaking pump?"}]
+    assert estimate_request_tokens(messages, max_tokens=4000) == estimate_request_tokens(messages) + 4000
+
+
+def test_retry_after_prefers_milliseconds():
+    assert retry_after_seconds({"retry-after-ms": "250", "retry-after": "3"}) == 0.25
+    assert retry_after_seconds({"retry-after": "3"}) == 3.0
+    assert retry_after_seconds({}) is None
+
+
+def test_requests_past_the_burst_wait_for_the_refill():
+    limiter = RateLimiter("gpt-4o", rpm_limit=RPM)
+
+    waits = acquire_all(limiter, 101)
+
+    assert waits[:100] == [0.0] * 100
+    assert 0 < waits[100] <= 0.1
+    stats = limiter.get_stats()
+    assert stats["admitted"] == 101 and stats["throttled"] == 1
+
+
+def test_token_quota_is_charged_per_request():
+    limiter = RateLimiter("gpt-4o", tpm_limit=60000)  # 10000 tokens of burst, 1000 per second
+
+    waits = acquire_all(limiter, 3, tokens=3500)
+
+    assert waits[:2] == [0.0, 0.0] and 0.3 < waits[2] <= 0.5
+
+
+def test_rate_limited_response_pauses_every_caller():
+    limiter = RateLimiter("gpt-4o", rpm_limit=RPM)
+
+    assert limiter.observe(response(429, retry_after_ms=300)) == pytest.approx(0.3)
+
+    assert acquire_all(limiter, 1)[0] == pytest.approx(0.3, abs=0.1)
+    assert limiter.get_stats()["rate_limited_responses"] == 1
+
+
+def test_limits_are_learned_from_response_headers():
+    limiter = RateLimiter("gpt-4o")
+
+    limiter.observe(response(200, x_ratelimit_limit_requests=RPM, x_ratelimit_remaining_requests=5,
+                             x_ratelimit_remaining_tokens=20000))
+
+    stats = limiter.get_stats()
+    assert stats["limits"]["requests"] == RPM and stats["remaining"]["requests"] == pytest.approx(5, abs=1)
+    assert stats["limits"]["tokens"] == 20000
+
+
+def test_limiters_sharing_a_store_file_share_the_budget(tmp_path):
+    store_file = str(tmp_path / "rate_limits.db")
+    first = RateLimiter("gpt-4o", rpm_limit=RPM, store_file=store_file)
+    second = RateLimiter("gpt-4o", rpm_limit=RPM, store_file=store_file)
+
+    assert acquire_all(first, 100) == [0.0] * 100
+    assert acquire_all(second, 1)[0] > 0
@@ -0,0 +1,137 @@
+"""
+Script generation tests
+Each extraction runs its scripts in a private workspace holding only the target file, and the
+workspace is gone once the analysis ends; speculative rounds return the first usable candidate
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import analysis_engine
+from script_library import ScriptLibrary
+
+# Prints the file it was given, and records the directory it ran in
+REPORT_SCRIPT = """
+import os
+print(os.getcwd())
+print(sorted(os.listdir('.')))
+print(open({file_name!r}, encoding='utf-8').read().strip())
+"""
+
+
+@pytest.fixture
+def extraction(tmp_path, monkeypatch):
+    """Extraction with GPT-4o replaced: scripts come from REPORT_SCRIPT and every decision is DONE"""
+    library = ScriptLibrary(storage_dir=str(tmp_path / "scripts"), enabled=False)
+    monkeypatch.setattr(analysis_engine, "get_script_library", lambda: library)
+    monkeypatch.setattr(analysis_engine, "link_artifact_into_workspace", lambda target_file, workspace, file_name: "")
+    monkeypatch.setattr(analysis_engine, "get_gpt4o_script",
+                        lambda prompt, file_name, artifact_note="", *args: REPORT_SCRIPT.format(file_name=file_name))
+    monkeypatch.setattr(analysis_engine, "ask_gpt4o_for_decision", lambda prompt, result: "DONE: " + result["output"])
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def write_document(directory, text):
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / "complaints.txt"
+    path.write_text(text + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_workspace_holds_the_target_file_and_is_removed(tmp_path):
+    path = write_document(tmp_path / "uploads", "Complaint ID: 1 - Leaking pump")
+
+    with analysis_engine.analysis_workspace(path) as (workspace, file_name):
+        assert file_name == "complaints.txt" and os.listdir(workspace) == ["complaints.txt"]
+        with open(os.path.join(workspace, file_name), encoding="utf-8") as f:
+            assert f.read() == "Complaint ID: 1 - Leaking pump\n"
+
+    assert not os.path.exists(workspace)
+    assert os.path.exists(path)
+
+
+def test_scripts_run_in_the_workspace_not_the_working_directory(extraction):
+    path = write_document(extraction / "uploads", "Complaint ID: 1 - Leaking pump")
+
+    cwd, files, content = analysis_engine.autonomous_analysis_loop("Show the file", target_file=path).split("\n")
+
+    assert cwd != str(extraction) and not os.path.exists(cwd)
+    assert files == "['complaints.txt', 'gpt4o_script_iter_1.py']"
+    assert content == "Complaint ID: 1 - Leaking pump"
+    assert not any(name.endswith(".py") for name in os.listdir(extraction))
+
+
+def test_concurrent_analyses_of_same_named_files_stay_apart(extraction, monkeypatch):
+    paths = [write_document(extraction / f"upload-{i}", f"Complaint ID: {i} - Leaking pump") for i in range(4)]
+    barrier = threading.Barrier(len(paths))
+    execute = analysis_engine.execute_script_and_analyze
+
+    def execute_together(*args, **kwargs):
+        # Every analysis has written its script before any of them runs
+        barrier.wait(timeout=10)
+        return execute(*args, **kwargs)
+
+    def analyse(path):
+        return analysis_engine.autonomous_analysis_loop("Show the file", target_file=path)
+
+    monkeypatch.setattr(analysis_engine, "execute_script_and_analyze", execute_together)
+    with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        answers = list(executor.map(analyse, paths))
+
+    assert [answer.split("\n")[2] for answer in answers] == [f"Complaint ID: {i} - Leaking pump" for i in range(4)]
+    assert len({answer.split("\n")[0] for answer in answers}) == 4
+
+
+def candidate_scripts(monkeypatch, scripts, generation_delays=()):
+    """GPT-4o writes scripts[k] for candidate k, after generation_delays[k] seconds"""
+    hints = [variant_hint for _, variant_hint in analysis_engine.SCRIPT_CANDIDATE_VARIANTS]
+
+    def get_gpt4o_script(prompt, file_name, artifact_note, temperature, variant_hint):
+        k = hints.index(variant_hint)
+        time.sleep(generation_delays[k] if k < len(generation_delays) else 0)
+        if isinstance(scripts[k], Exception):
+            raise scripts[k]
+        return scripts[k]
+
+    monkeypatch.setattr(analysis_engine, "get_gpt4o_script", get_gpt4o_script)
+
+
+def run_candidates(tmp_path, candidates):
+    path = write_document(tmp_path / "uploads", "Complaint ID: 1 - Leaking pump")
+    with analysis_engine.analysis_workspace(path) as (workspace, file_name):
+        return analysis_engine.run_script_candidates("Count the complaints", file_name, "", workspace, 1, candidates)
+
+
+def test_first_usable_candidate_wins_and_the_rest_are_cancelled(tmp_path, monkeypatch):
+    candidate_scripts(monkeypatch, ["import time\ntime.sleep(30)\nprint('too late')",
+                                    "raise SystemExit(1)",
+                                    "print('1 complaint')"])
+
+    started = time.perf_counter()
+    script, result = run_candidates(tmp_path, 3)
+
+    assert script == "print('1 complaint')" and result["output"].strip() == "1 complaint"
+    assert time.perf_counter() - started < 10
+
+
+def test_without_a_usable_candidate_the_lowest_numbered_run_is_returned(tmp_path, monkeypatch):
+    # Candidate 1 finishes last, but its error is the one the decision step sees
+    candidate_scripts(monkeypatch, ["print('Error: no complaints found')", "raise SystemExit(1)", ""],
+                      generation_delays=[0.3])
+
+    script, result = run_candidates(tmp_path, 3)
+
+    assert script == "print('Error: no complaints found')"
+    assert not analysis_engine.script_output_usable(result)
+
+
+def test_all_generations_failing_raises(tmp_path, monkeypatch):
+    candidate_scripts(monkeypatch, [TimeoutError("GPT-4o timed out")] * 2)
+
+    with pytest.raises(RuntimeError, match="All 2 candidate scripts failed"):
+        run_candidates(tmp_path, 2)
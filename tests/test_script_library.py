@@ -0,0 +1,103 @@
+"""
+Script library tests
+A stored script is reused only while it still answers the question; one that fails, or catches
+its own error and prints it, is invalidated so GPT-4o writes a new one
+"""
+
+import pytest
+
+import analysis_engine
+from script_library import ScriptLibrary, structural_fingerprint
+
+PROMPT = "How many complaints mention a leaking pump?"
+COUNT_SCRIPT = """
+with open('complaints.txt', encoding='utf-8') as f:
+    print(sum('Leaking pump' in line for line in f), "complaints mention a leaking pump")
+"""
+# Descriptions repeated three times or more would count as format markers
+JANUARY = ["Leaking pump", "Cracked housing", "Broken seal", "Leaking pump", "Loose fitting", "Noisy motor"]
+FEBRUARY = ["Worn gasket", "Leaking valve", "Cracked housing", "Overheating", "Worn gasket", "Bent shaft", "Rust"]
+CAUGHT_ERROR_SCRIPT = """
+try:
+    open('complaints_2023.txt').read()
+except OSError as e:
+    print(f"Error: {e}")
+"""
+
+
+def write_report(path, complaints):
+    lines = []
+    for page, start in enumerate(range(0, len(complaints), 2), start=1):
+        lines.append(f"--- Page {page} ---")
+        lines += [f"Complaint ID: {100 + start + i} - {text}" for i, text in enumerate(complaints[start:start + 2])]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    library = ScriptLibrary(storage_dir=str(tmp_path / "scripts"))
+    monkeypatch.setattr(analysis_engine, "get_script_library", lambda: library)
+    return library
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    directory = tmp_path / "workspace"
+    directory.mkdir()
+    path = write_report(directory / "complaints.txt", ["Leaking pump", "Cracked housing", "Leaking pump"] * 3)
+    return str(directory), path
+
+
+def test_fingerprint_ignores_values_but_not_format(tmp_path):
+    january = write_report(tmp_path / "january.txt", JANUARY)
+    february = write_report(tmp_path / "february.txt", FEBRUARY)
+    csv_export = tmp_path / "export.txt"
+    csv_export.write_text("id,description\n100,Leaking pump\n101,Cracked housing\n", encoding="utf-8")
+
+    assert structural_fingerprint(january) == structural_fingerprint(february)
+    assert structural_fingerprint(january) != structural_fingerprint(str(csv_export))
+
+
+def test_get_rewrites_the_file_name_and_evicts_least_recently_used(tmp_path):
+    library = ScriptLibrary(storage_dir=str(tmp_path / "scripts"), max_entries=2)
+    january = write_report(tmp_path / "january.txt", JANUARY)
+    february = write_report(tmp_path / "february.txt", FEBRUARY)
+
+    library.put(PROMPT, january, "print(open('january.txt').read())", 1500.0)
+    entry = library.get("how many complaints mention a leaking pump", february)
+    assert entry["script"] == "print(open('february.txt').read())" and entry["generation_ms"] == 1500.0
+
+    library.put("List the complaint IDs", january, "print(1)", 900.0)
+    library.get(PROMPT, january)
+    library.put("Count the pages", january, "print(2)", 700.0)
+    assert library.get("List the complaint IDs", january) is None
+    assert library.get(PROMPT, january) is not None
+    assert library.get_stats()["entries"] == 2
+
+
+def test_library_hit_returns_the_stored_script_output(library, workspace):
+    directory, path = workspace
+    library.put(PROMPT, path, COUNT_SCRIPT, 4000.0)
+
+    assert analysis_engine.run_library_script(PROMPT, path, directory).strip() == "6 complaints mention a leaking pump"
+    stats = library.get_stats()
+    assert stats["hits"] == 1 and stats["stale"] == 0 and stats["entries"] == 1
+    assert stats["saved_seconds"] > 0
+
+
+@pytest.mark.parametrize("script", [CAUGHT_ERROR_SCRIPT, "raise SystemExit('File not found')", "pass"])
+def test_failing_stored_script_is_invalidated(library, workspace, script):
+    directory, path = workspace
+    library.put(PROMPT, path, script, 4000.0)
+
+    assert analysis_engine.run_library_script(PROMPT, path, directory) is None
+    stats = library.get_stats()
+    assert stats["stale"] == 1 and stats["entries"] == 0
+    assert library.get(PROMPT, path) is None
+
+
+def test_library_miss_runs_nothing(library, workspace):
+    directory, path = workspace
+    assert analysis_engine.run_library_script(PROMPT, path, directory) is None
+    assert library.get_stats()["misses"] == 1
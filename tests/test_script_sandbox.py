@@ -0,0 +1,97 @@
+"""
+Script sandbox tests
+Scripts run in warm workers with timeouts and cancellation, and a worker that hangs or crashes
+while starting never blocks the pool
+"""
+
+import sys
+import time
+import threading
+
+import pytest
+
+import script_sandbox
+from script_sandbox import CancelToken, SandboxPool, SandboxWorker
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="forked runs are POSIX only")
+
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(size=1, max_runs=2, timeout=5)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def broken_preload(tmp_path, monkeypatch):
+    """Make workers import a module of the test's choosing at startup"""
+    def install(source):
+        (tmp_path / "broken_preload.py").write_text(source, encoding="utf-8")
+        monkeypatch.setenv("PYTHONPATH", str(tmp_path))
+        monkeypatch.setenv("SANDBOX_PRELOAD_MODULES", "json,broken_preload")
+    return install
+
+
+def test_script_runs_in_the_given_directory(pool, tmp_path):
+    (tmp_path / "complaints.txt").write_text("Leaking pump\nCracked housing\nLeaking pump\n", encoding="utf-8")
+    script = "print(open('complaints.txt').read().count('Leaking pump'))\nimport sys\nprint('done', file=sys.stderr)"
+
+    result = pool.run(script, "count.py", cwd=str(tmp_path))
+
+    assert result["returncode"] == 0 and result["stdout"] == "2\n" and result["stderr"] == "done\n"
+    assert not result["timed_out"] and not result["cancelled"]
+
+
+def test_failing_script_reports_its_traceback(pool):
+    result = pool.run("raise ValueError('bad batch number')", "broken.py")
+    assert result["returncode"] == 1
+    assert 'File "broken.py", line 1' in result["stderr"] and "ValueError: bad batch number" in result["stderr"]
+
+
+def test_scripts_do_not_leak_state_and_workers_are_recycled(pool):
+    first = pool.run("import json\njson.dumps = None\nprint('patched')")
+    second = pool.run("import json\nprint(json.dumps([1]))")
+    third = pool.run("print('fresh')")
+
+    assert second["stdout"] == "[1]\n" and first["worker_pid"] == second["worker_pid"]
+    assert third["worker_pid"] != first["worker_pid"]
+    assert pool.get_stats()["recycled"] == 1
+
+
+def test_script_timeout(pool):
+    result = pool.run("import time\ntime.sleep(30)", timeout=0.5)
+    assert result["timed_out"] and "timed out after 0.5 seconds" in result["stderr"]
+    assert pool.run("print('still working')")["stdout"] == "still working\n"
+
+
+def test_cancel_abandons_a_running_script(pool):
+    cancel = CancelToken()
+    threading.Timer(0.5, cancel.cancel).start()
+
+    started = time.monotonic()
+    result = pool.run("import time\ntime.sleep(30)", cancel=cancel)
+
+    assert result["cancelled"] and time.monotonic() - started < 5
+    assert pool.run("print('next')")["stdout"] == "next\n"
+
+
+def test_worker_hanging_at_startup_is_killed(broken_preload):
+    broken_preload("import time\ntime.sleep(60)\n")
+
+    started = time.monotonic()
+    with pytest.raises(RuntimeError, match="not ready after 0.5 seconds"):
+        SandboxWorker(startup_timeout=0.5)
+    assert time.monotonic() - started < 5
+
+
+def test_pool_whose_workers_crash_at_startup_fails_runs(broken_preload, monkeypatch):
+    broken_preload("import os\nos._exit(3)\n")
+    monkeypatch.setattr(script_sandbox, "SANDBOX_START_ATTEMPTS", 2)
+    pool = SandboxPool(size=1, startup_timeout=5)
+    try:
+        with pytest.raises(RuntimeError, match="No sandbox worker could be started"):
+            pool.run("print('never runs')")
+        assert pool.get_stats()["start_failures"] >= 2
+    finally:
+        pool.close()
@@ -0,0 +1,69 @@
+"""
+Streaming endpoint tests
+A streamed answer names its request_id in the first event, so it can be traced and cancelled
+"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import analysis_engine
+import app as app_module
+from flight_recorder import get_flight_recorder
+
+CONTEXT = {"chunks": ["Complaint ID: 1 - Leaking pump"], "sources": [{"chunk_id": 0, "page": 1, "score": 0.9}],
+           "context_tokens": 8, "error": None}
+
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(analysis_engine, "retrieve_rag_context", lambda prompt, target_file, progress=None: CONTEXT)
+    return TestClient(app_module.app)
+
+
+def stream_tokens(monkeypatch, on_first_token=None):
+    async def stream_chat_completion(messages, max_tokens=4000, temperature=0.3):
+        for i, token in enumerate(["Twelve ", "complaints ", "mention ", "leaks."]):
+            if i == 0 and on_first_token:
+                on_first_token()
+            yield {"type": "token", "content": token}
+        yield {"type": "usage", "usage": {"prompt_tokens": 40, "completion_tokens": 4}}
+    monkeypatch.setattr(analysis_engine.client, "stream_chat_completion", stream_chat_completion)
+
+
+def test_first_event_carries_the_request_id(client, monkeypatch):
+    stream_tokens(monkeypatch)
+
+    response = client.post("/api/process/stream", json={"user_prompt": "How many leaks?", "method": "reasoning",
+                                                        "bypass_cache": True})
+    events = parse_events(response.text)
+
+    assert [event for event, _ in events] == ["start", "retrieval", "token", "token", "token", "token", "done"]
+    request_id = events[0][1]["request_id"]
+    assert request_id and response.headers["x-request-id"] == request_id
+    assert events[-1][1]["request_id"] == request_id
+    assert get_flight_recorder().get(request_id)["status"] == "ok"
+
+
+def test_cancel_stops_the_stream(client, monkeypatch):
+    # Raise the flag /api/process/stream/{request_id}/cancel sets, just before the first token
+    stream_tokens(monkeypatch, on_first_token=lambda: [event.set() for event in app_module.active_streams.values()])
+
+    events = parse_events(client.post("/api/process/stream", json={"user_prompt": "How many leaks?",
+                                                                   "method": "reasoning",
+                                                                   "bypass_cache": True}).text)
+
+    request_id = events[0][1]["request_id"]
+    assert [event for event, _ in events] == ["start", "retrieval", "token", "cancelled"]
+    assert get_flight_recorder().get(request_id)["status"] == "cancelled"
+    assert app_module.active_streams == {}
+    assert client.post(f"/api/process/stream/{request_id}/cancel").status_code == 404
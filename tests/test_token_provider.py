@@ -0,0 +1,85 @@
+"""
+Token provider tests
+Concurrent callers share one token request, the token is renewed before it expires, and worker
+processes sharing a token file ask the identity provider only once
+"""
+
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from token_provider import TokenProvider
+
+
+def counting_fetch(lifetime=3600.0, delay=0.1, error=None):
+    """fetch_token that returns token-1, token-2, ... and counts its calls"""
+    calls = []
+
+    async def fetch_token():
+        calls.append(time.time())
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return f"token-{len(calls)}", lifetime
+    return fetch_token, calls
+
+
+def test_concurrent_callers_share_one_refresh():
+    fetch_token, calls = counting_fetch()
+    provider = TokenProvider(fetch_token)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        tokens = list(executor.map(lambda _: provider.get_token(), range(16)))
+
+    assert tokens == ["token-1"] * 16 and len(calls) == 1
+    assert provider.get_token() == "token-1" and len(calls) == 1
+
+
+def test_async_callers_share_one_refresh():
+    fetch_token, calls = counting_fetch()
+    provider = TokenProvider(fetch_token)
+
+    async def main():
+        return await asyncio.gather(*(provider.get_token_async() for _ in range(8)))
+
+    assert asyncio.run(main()) == ["token-1"] * 8 and len(calls) == 1
+
+
+def test_failed_refresh_reaches_every_caller_and_is_retried():
+    fetch_token, calls = counting_fetch(delay=0.3, error=RuntimeError("PingFed unavailable"))
+    provider = TokenProvider(fetch_token)
+
+    def get_token():
+        with pytest.raises(RuntimeError, match="PingFed unavailable"):
+            provider.get_token()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: get_token(), range(4)))
+    assert len(calls) == 1
+
+    get_token()
+    assert len(calls) == 2
+
+
+def test_token_is_renewed_before_it_expires():
+    # Short-lived tokens are renewed half way through their lifetime
+    fetch_token, calls = counting_fetch(lifetime=2.2, delay=0.0)
+    provider = TokenProvider(fetch_token)
+    assert provider.get_token() == "token-1"
+
+    time.sleep(1.5)
+
+    assert len(calls) == 2 and provider.get_token() == "token-2"
+
+
+def test_processes_sharing_a_token_file_fetch_once(tmp_path):
+    fetch_token, calls = counting_fetch()
+    cache_file = str(tmp_path / "token.json")
+    first = TokenProvider(fetch_token, cache_file=cache_file)
+    second = TokenProvider(fetch_token, cache_file=cache_file)
+
+    assert first.get_token() == second.get_token() == "token-1"
+    assert len(calls) == 1 and second.get_stats()["shared_hits"] == 1
+    assert not (tmp_path / "token.json.lock").exists()
@@ -0,0 +1,62 @@
+"""
+Vector store tests
+Search returns the same ranking as a full cosine scan, and a saved store loads back without
+being normalized again
+"""
+
+import numpy as np
+
+from vector_store import VectorStore, normalize_rows
+
+
+def cosine_ranking(vectors, query):
+    vectors = np.asarray(vectors, dtype=np.float64)
+    scores = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+    return np.argsort(-scores, kind="stable"), np.sort(scores)[::-1]
+
+
+def test_normalize_rows_gives_unit_float32_rows():
+    rows = normalize_rows([[3.0, 4.0], [0.0, 0.0]])
+    assert rows.dtype == np.float32 and rows.flags["C_CONTIGUOUS"]
+    np.testing.assert_allclose(rows, [[0.6, 0.8], [0.0, 0.0]])
+
+
+def test_search_matches_a_full_cosine_scan():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 32))
+    query = rng.normal(size=32)
+    store = VectorStore(vectors)
+
+    indices, scores = store.search(query, top_k=10)
+
+    expected_indices, expected_scores = cosine_ranking(vectors, query)
+    assert list(indices) == list(expected_indices[:10])
+    np.testing.assert_allclose(scores, expected_scores[:10], rtol=1e-5)
+
+
+def test_search_applies_the_threshold_and_handles_small_stores():
+    store = VectorStore([[1.0, 0.0], [0.8, 0.6], [0.0, 1.0]])
+
+    indices, scores = store.search([1.0, 0.0], top_k=10, similarity_threshold=0.5)
+
+    assert list(indices) == [0, 1]
+    np.testing.assert_allclose(scores, [1.0, 0.8], rtol=1e-6)
+    assert len(VectorStore([]).search([1.0, 0.0])[0]) == 0
+
+
+def test_add_appends_after_the_existing_vectors():
+    store = VectorStore([[1.0, 0.0]])
+    ids = store.add([[0.0, 2.0], [0.0, -1.0]])
+
+    assert list(ids) == [1, 2] and len(store) == 3
+    assert store.search([0.0, 1.0], top_k=1)[0][0] == 1
+
+
+def test_saved_store_is_memory_mapped_on_load(tmp_path):
+    store = VectorStore(np.random.default_rng(1).normal(size=(20, 8)))
+    store.save(tmp_path / "vectors.npy")
+
+    loaded = VectorStore.load(tmp_path / "vectors.npy")
+
+    assert isinstance(loaded.vectors, np.memmap)
+    np.testing.assert_array_equal(loaded.vectors, store.vectors)
@@ -0,0 +1,192 @@
+"""
+Token Provider
+Single-flight OAuth2 token cache with proactive background refresh and optional cross-process sharing
+"""
+
+import os
+import json
+import time
+import asyncio
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from http_pool import get_http_pool
+
+# Refresh this long before the token stops being usable, so requests never wait on PingFed
+REFRESH_AHEAD_SECONDS = float(os.getenv('AOAI_TOKEN_REFRESH_AHEAD_SECONDS', '600'))
+# Retry interval when a background refresh fails while the current token is still usable
+REFRESH_RETRY_SECONDS = 30.0
+# A lock file older than this is left over from a crashed process
+LOCK_STALE_SECONDS = 30.0
+
+
+class TokenProvider:
+    """
+    Keeps one access token fresh for every caller in the process (and optionally across processes)
+
+    All refresh work runs on the shared HTTP pool's event loop, which makes it single-flight
+    for free: concurrent callers that find the token expired await the same refresh task.
+    After each refresh a timer on that loop renews the token REFRESH_AHEAD_SECONDS before it
+    stops being usable, so in steady state get_token() returns without any I/O.
+
+    With cache_file set, worker processes share the token through that file: a refresh first
+    adopts a token another process has already written, and only one process at a time (held
+    by a lock file) asks the identity provider for a new one.
+    """
+
+    def __init__(self, fetch_token: Callable[[], Awaitable[Tuple[str, float]]], cache_file: Optional[str] = None):
+        """
+        Args:
+            fetch_token: Coroutine function returning (token, seconds until it should no longer be used)
+            cache_file: Optional path of a token file shared by worker processes
+        """
+        self.fetch_token = fetch_token
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.token: Optional[str] = None
+        self.expires_at: Optional[float] = None
+        self.lifetime = 0.0
+        self.refreshes = 0
+        self.shared_hits = 0
+        self._inflight: Optional[asyncio.Task] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _is_usable(self) -> bool:
+        return bool(self.token and self.expires_at and time.time() < self.expires_at)
+
+    def get_token(self) -> str:
+        """Current token for sync callers; blocks only if there is no usable token yet"""
+        if self._is_usable():
+            return self.token
+        return get_http_pool().run(self._refresh_shared())
+
+    async def get_token_async(self) -> str:
+        """Current token for async callers; awaits only if there is no usable token yet"""
+        if self._is_usable():
+            return self.token
+        return await get_http_pool().call(self._refresh_shared())
+
+    async def _refresh_shared(self) -> str:
+        # Runs on the pool loop: everyone who needs a refresh awaits the same task
+        if self._is_usable():
+            return self.token
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+            self._inflight.add_done_callback(self._clear_inflight)
+        return await asyncio.shield(self._inflight)
+
+    def _clear_inflight(self, _task) -> None:
+        self._inflight = None
+
+    async def _refresh(self) -> str:
+        if self.cache_file is None:
+            token, lifetime = await self.fetch_token()
+            self._set_token(token, lifetime)
+        else:
+            await self._refresh_through_file()
+
+        self.refreshes += 1
+        self._schedule_refresh(max(self.expires_at - time.time() - self._refresh_ahead(self.lifetime), 1.0))
+        return self.token
+
+    @staticmethod
+    def _refresh_ahead(lifetime: float) -> float:
+        # Short-lived tokens are renewed half way through their lifetime
+        return min(REFRESH_AHEAD_SECONDS, lifetime / 2)
+
+    def _set_token(self, token: str, lifetime: float, expires_at: Optional[float] = None) -> None:
+        self.token, self.lifetime = token, lifetime
+        self.expires_at = expires_at or time.time() + lifetime
+
+    def _schedule_refresh(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._start_background_refresh)
+
+    def _start_background_refresh(self) -> None:
+        if self._inflight is not None:
+            return
+
+        # The same task callers join in _refresh_shared: anyone who needs a token while it
+        # runs gets its token, or its exception
+        self._inflight = asyncio.ensure_future(self._refresh())
+        self._inflight.add_done_callback(self._clear_inflight)
+        self._inflight.add_done_callback(self._after_background_refresh)
+
+    def _after_background_refresh(self, task: asyncio.Task) -> None:
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            # The current token stays in use until it expires; try again shortly
+            print(f"Background token refresh failed: {error}")
+            self._schedule_refresh(REFRESH_RETRY_SECONDS)
+
+    # Cross-process sharing
+
+    def _read_cache_file(self) -> Optional[Dict]:
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _adopt_shared_token(self) -> bool:
+        """Use the token in the shared file if it is not due for a refresh yet"""
+        cached = self._read_cache_file()
+        if cached and cached.get("expires_at", 0) - time.time() > self._refresh_ahead(cached.get("lifetime", 0)):
+            self._set_token(cached["access_token"], cached["lifetime"], cached["expires_at"])
+            self.shared_hits += 1
+            return True
+        return False
+
+    async def _refresh_through_file(self) -> None:
+        if self._adopt_shared_token():
+            return
+
+        lock_file = self.cache_file.with_suffix(self.cache_file.suffix + ".lock")
+        locked = await self._acquire_lock(lock_file)
+        try:
+            # Another process may have refreshed while we waited for the lock
+            if locked and self._adopt_shared_token():
+                return
+
+            token, lifetime = await self.fetch_token()
+            self._set_token(token, lifetime)
+
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.cache_file.with_suffix(f".{os.getpid()}.tmp")
+            fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"access_token": self.token, "expires_at": self.expires_at, "lifetime": self.lifetime}, f)
+            os.replace(tmp_file, self.cache_file)
+        finally:
+            if locked:
+                lock_file.unlink(missing_ok=True)
+
+    async def _acquire_lock(self, lock_file: Path, timeout: float = 15.0) -> bool:
+        """Portable inter-process lock via exclusive file creation; False if it timed out"""
+        lock_file.parent.mkdir(parents=True, exist_ok=True)
+        deadline = time.time() + timeout
+        while True:
+            try:
+                os.close(os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - lock_file.stat().st_mtime > LOCK_STALE_SECONDS:
+                        lock_file.unlink(missing_ok=True)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() >= deadline:
+                    return False
+                await asyncio.sleep(0.05)
+
+    def get_stats(self) -> Dict:
+        """Refresh counters and time left on the current token"""
+        return {
+            "refreshes": self.refreshes,
+            "shared_hits": self.shared_hits,
+            "seconds_remaining": round(self.expires_at - time.time(), 1) if self.expires_at else None,
+            "shared_cache": str(self.cache_file) if self.cache_file else None
+        }
@@ -0,0 +1,122 @@
+"""
+Vector Store
+Pre-normalized float32 embedding matrix with vectorized cosine top-k retrieval
+"""
+
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+# Identifies how vectors are laid out on disk; bump when the format changes
+VECTOR_FORMAT = "float32-l2normalized-v1"
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Return a contiguous float32 copy of matrix with every row scaled to unit length"""
+    matrix = np.array(matrix, dtype=np.float32, copy=True, order='C')
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+class VectorStore:
+    """Holds unit-length embeddings in one contiguous float32 matrix for dot-product search"""
+
+    def __init__(self, vectors: Union[np.ndarray, list], normalized: bool = False):
+        if normalized and isinstance(vectors, np.ndarray) and vectors.dtype == np.float32 and vectors.ndim == 2:
+            # Already unit length (possibly a read-only memmap): use as-is, no copy
+            self.vectors = vectors
+        elif len(vectors) == 0:
+            self.vectors = np.zeros((0, 0), dtype=np.float32)
+        else:
+            self.vectors = normalize_rows(vectors)
+        self.ann = None  # Optional IVFFlatIndex used for large stores
+
+    @classmethod
+    def load(cls, path: Union[str, Path], mmap: bool = True) -> "VectorStore":
+        """Load a store saved with save(); memory-maps the matrix by default"""
+        vectors = np.load(path, mmap_mode='r' if mmap else None)
+        return cls(vectors, normalized=True)
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Persist the normalized matrix as a .npy file"""
+        np.save(path, np.ascontiguousarray(self.vectors))
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def dimensions(self) -> int:
+        return self.vectors.shape[1] if self.vectors.ndim == 2 else 0
+
+    def build_ann(self, n_lists: Optional[int] = None, n_probe: Optional[int] = None) -> None:
+        """Build an IVF-flat ANN index over the stored vectors"""
+        from ann_index import ANN_NPROBE, IVFFlatIndex
+        self.ann = IVFFlatIndex(n_probe=n_probe or ANN_NPROBE).build(self.vectors, n_lists=n_lists)
+
+    def copy(self) -> "VectorStore":
+        """A store that can be added to without changing this one; the matrix is shared, not copied"""
+        store = VectorStore(self.vectors, normalized=True) if len(self) else VectorStore([])
+        store.ann = self.ann.copy() if self.ann is not None else None
+        return store
+
+    def add(self, embeddings) -> np.ndarray:
+        """Append embeddings (and index them in the ANN index if present); returns their ids"""
+        new_vectors = normalize_rows(embeddings)
+        start = len(self)
+        if start == 0:
+            self.vectors = new_vectors
+        else:
+            self.vectors = np.concatenate([self.vectors, new_vectors])
+        ids = np.arange(start, start + len(new_vectors), dtype=np.int64)
+        if self.ann is not None:
+            self.ann.add(new_vectors, ids)
+        return ids
+
+    def scores(self, query_embedding) -> np.ndarray:
+        """Cosine similarity of the query against every stored vector"""
+        query = normalize_rows(query_embedding)[0]
+        return self.vectors @ query
+
+    def search(self, query_embedding, top_k: int = 10, similarity_threshold: Optional[float] = None,
+               exact: bool = False, n_probe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the most similar vectors
+
+        Args:
+            query_embedding: Query vector (need not be normalized)
+            top_k: Maximum number of results
+            similarity_threshold: Drop results scoring below this value
+            exact: Scan every vector even if an ANN index is attached
+            n_probe: Override the ANN index's recall/latency setting for this query
+
+        Returns:
+            (indices, scores) ordered by descending score
+        """
+        count = len(self)
+        if count == 0 or top_k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        if self.ann is not None and not exact:
+            query = normalize_rows(query_embedding)[0]
+            candidates, candidate_scores = self.ann.search(self.vectors, query, top_k=top_k, n_probe=n_probe)
+        else:
+            similarities = self.scores(query_embedding)
+            k = min(top_k, count)
+            if k < count:
+                candidates = np.argpartition(-similarities, k - 1)[:k]
+            else:
+                candidates = np.arange(count)
+
+            candidates = candidates[np.argsort(-similarities[candidates], kind='stable')]
+            candidate_scores = similarities[candidates]
+
+        if similarity_threshold is not None:
+            mask = candidate_scores >= similarity_threshold
+            candidates, candidate_scores = candidates[mask], candidate_scores[mask]
+
+        return candidates, candidate_scores